@@ -14,6 +14,7 @@
 from __future__ import division
 import os
 import gc
+import hashlib
 import sys
 import subprocess
 from cStringIO import StringIO
@@ -283,6 +284,8 @@ REQUEST = None
 TEST_ENV = None
 LOCAL = None
 LOCAL_MANAGER = None
+URL_ADAPTER = None
+MULTIPART_UPLOAD = None
 
 
 def time_url_decode():
@@ -307,6 +310,77 @@ def time_parse_form_data_multipart():
     request.form
 
 
+def make_multipart_upload(payload):
+    return '\r\n'.join((
+        '--foo',
+        'Content-Disposition: form-data; name=file; filename=upload.bin',
+        'Content-Type: application/octet-stream',
+        '',
+        payload,
+        '--foo--'
+    ))
+
+
+def parse_multipart_upload():
+    environ = {
+        'REQUEST_METHOD':   'POST',
+        'CONTENT_TYPE':     'multipart/form-data; boundary=foo',
+        'wsgi.input':       StringIO(MULTIPART_UPLOAD),
+        'CONTENT_LENGTH':   str(len(MULTIPART_UPLOAD))
+    }
+    request = wz.Request(environ)
+    request.files['file'].close()
+
+
+def before_parse_multipart_binary_upload():
+    global MULTIPART_UPLOAD
+    MULTIPART_UPLOAD = make_multipart_upload(os.urandom(1024 * 1024 * 4))
+
+
+def time_parse_multipart_binary_upload():
+    parse_multipart_upload()
+
+
+def after_parse_multipart_binary_upload():
+    global MULTIPART_UPLOAD
+    MULTIPART_UPLOAD = None
+
+
+def before_parse_multipart_text_upload():
+    global MULTIPART_UPLOAD
+    MULTIPART_UPLOAD = make_multipart_upload('a short line\r\n' * 300000)
+
+
+def time_parse_multipart_text_upload():
+    parse_multipart_upload()
+
+
+def after_parse_multipart_text_upload():
+    global MULTIPART_UPLOAD
+    MULTIPART_UPLOAD = None
+
+
+def before_parse_urlencoded_large():
+    global URLENCODED_FORM
+    URLENCODED_FORM = '&'.join('field%d=some+value+%%C3%%A4+%d' % (x, x)
+                               for x in xrange(50000))
+
+
+def time_parse_urlencoded_large():
+    environ = {
+        'REQUEST_METHOD':   'POST',
+        'CONTENT_TYPE':     'application/x-www-form-urlencoded',
+        'wsgi.input':       StringIO(URLENCODED_FORM),
+        'CONTENT_LENGTH':   str(len(URLENCODED_FORM))
+    }
+    wz.Request(environ).form
+
+
+def after_parse_urlencoded_large():
+    global URLENCODED_FORM
+    URLENCODED_FORM = None
+
+
 def before_multidict_lookup_hit():
     global MULTIDICT
     MULTIDICT = wz.MultiDict({'foo': 'bar'})
@@ -444,6 +518,280 @@ def after_html_builder():
     TABLE = None
 
 
+def make_line_data(size, newline='\r\n'):
+    line = 'a line in a stream' + newline
+    return (line * (size // len(line) + 1))[:size]
+
+
+LINE_DATA = dict((size, make_line_data(size))
+                 for size in (1024, 1024 * 64, 1024 * 1024))
+CHUNK_DATA = dict((size, make_line_data(size, '&'))
+                  for size in (1024, 1024 * 64, 1024 * 1024))
+
+
+def iter_lines(data, repeat):
+    for x in xrange(repeat):
+        for line in wz.make_line_iter(StringIO(data), len(data)):
+            pass
+
+
+def iter_chunks(data, repeat):
+    from werkzeug.wsgi import make_chunk_iter
+    for x in xrange(repeat):
+        for chunk in make_chunk_iter(StringIO(data), '&', len(data)):
+            pass
+
+
+def time_line_iter_1k():
+    iter_lines(LINE_DATA[1024], 64)
+
+
+def time_line_iter_64k():
+    iter_lines(LINE_DATA[1024 * 64], 1)
+
+
+def time_line_iter_1m():
+    iter_lines(LINE_DATA[1024 * 1024], 1)
+
+
+def time_chunk_iter_1k():
+    iter_chunks(CHUNK_DATA[1024], 64)
+
+
+def time_chunk_iter_64k():
+    iter_chunks(CHUNK_DATA[1024 * 64], 1)
+
+
+def time_chunk_iter_1m():
+    iter_chunks(CHUNK_DATA[1024 * 1024], 1)
+
+
+def make_url_adapter(matcher=None):
+    """Binds a map with 300 rules for the routing benchmarks.  If the
+    matcher does not exist in the benchmarked version the default one
+    is used.
+    """
+    rules = []
+    for x in xrange(100):
+        rules.extend([
+            wz.routing.Rule('/section%d/' % x, endpoint='index%d' % x),
+            wz.routing.Rule('/section%d/<int:id>' % x, endpoint='show%d' % x),
+            wz.routing.Rule('/section%d/<int:id>/edit' % x,
+                            endpoint='edit%d' % x, methods=['GET', 'POST'])
+        ])
+    kwargs = {}
+    if matcher is not None and hasattr(wz.routing, matcher):
+        kwargs['matcher_class'] = getattr(wz.routing, matcher)
+    return wz.routing.Map(rules, **kwargs).bind('example.com')
+
+
+def match_late_and_missing_url():
+    URL_ADAPTER.match('/section99/42/edit')
+    try:
+        URL_ADAPTER.match('/missing/42')
+    except wz.routing.NotFound:
+        pass
+
+
+def before_routing_match_loop():
+    global URL_ADAPTER
+    URL_ADAPTER = make_url_adapter()
+
+
+def time_routing_match_loop():
+    match_late_and_missing_url()
+
+
+def after_routing_match_loop():
+    global URL_ADAPTER
+    URL_ADAPTER = None
+
+
+def before_routing_match_combined_regex():
+    global URL_ADAPTER
+    URL_ADAPTER = make_url_adapter('CombinedRegexMatcher')
+
+
+def time_routing_match_combined_regex():
+    match_late_and_missing_url()
+
+
+def after_routing_match_combined_regex():
+    global URL_ADAPTER
+    URL_ADAPTER = None
+
+
+def before_routing_match_tree():
+    global URL_ADAPTER
+    URL_ADAPTER = make_url_adapter('TreeMatcher')
+
+
+def time_routing_match_tree():
+    match_late_and_missing_url()
+
+
+def after_routing_match_tree():
+    global URL_ADAPTER
+    URL_ADAPTER = None
+
+
+def before_routing_build():
+    global URL_ADAPTER
+    URL_ADAPTER = make_url_adapter()
+
+
+def time_routing_build():
+    for x in xrange(100):
+        URL_ADAPTER.build('show99', {'id': x})
+
+
+def after_routing_build():
+    global URL_ADAPTER
+    URL_ADAPTER = None
+
+
+def before_routing_build_many():
+    global URL_ADAPTER
+    URL_ADAPTER = make_url_adapter()
+
+
+def time_routing_build_many():
+    values = [{'id': x} for x in xrange(100)]
+    if hasattr(URL_ADAPTER, 'build_many'):
+        list(URL_ADAPTER.build_many('show99', values))
+    else:
+        for x in values:
+            URL_ADAPTER.build('show99', x)
+
+
+def after_routing_build_many():
+    global URL_ADAPTER
+    URL_ADAPTER = None
+
+
+DEV_SERVER_REQUEST = (
+    'GET /foo/bar?baz=42&blah=23 HTTP/1.1\r\n'
+    'Host: localhost:5000\r\n'
+    'User-Agent: Mozilla/5.0 (X11; Linux x86_64; rv:30.0) Gecko/20100101 '
+    'Firefox/30.0\r\n'
+    'Accept: text/html,application/xhtml+xml,application/xml;q=0.9,'
+    '*/*;q=0.8\r\n'
+    'Accept-Language: en-US,en;q=0.5\r\n'
+    'Accept-Encoding: gzip, deflate\r\n'
+    'Cookie: session=0123456789abcdef\r\n'
+    'Connection: keep-alive\r\n'
+    '\r\n'
+)
+
+
+def before_dev_server_environ():
+    global DEV_SERVER_HANDLER
+    from werkzeug.serving import WSGIRequestHandler
+
+    class server(object):
+        ssl_context = None
+        multithread = multiprocess = False
+        server_address = ('localhost', 5000)
+        keep_alive = True
+
+    # skip __init__, it would start handling requests on a socket.
+    DEV_SERVER_HANDLER = WSGIRequestHandler.__new__(WSGIRequestHandler)
+    DEV_SERVER_HANDLER.server = server()
+    DEV_SERVER_HANDLER.client_address = ('127.0.0.1', 40000)
+
+
+def time_dev_server_environ():
+    handler = DEV_SERVER_HANDLER
+    for x in xrange(100):
+        handler.rfile = StringIO(DEV_SERVER_REQUEST)
+        handler.raw_requestline = handler.rfile.readline()
+        handler.parse_request()
+        handler.make_environ()
+
+
+def after_dev_server_environ():
+    global DEV_SERVER_HANDLER
+    DEV_SERVER_HANDLER = None
+
+
+def fill_filesystem_cache(entries):
+    global FS_CACHE_DIR, FS_CACHE
+    import tempfile
+    from werkzeug.contrib.cache import FileSystemCache
+    FS_CACHE_DIR = tempfile.mkdtemp()
+    FS_CACHE = FileSystemCache(FS_CACHE_DIR, threshold=entries)
+    for x in xrange(entries):
+        FS_CACHE.set('key%d' % x, x)
+
+
+def remove_filesystem_cache():
+    global FS_CACHE_DIR, FS_CACHE
+    import shutil
+    shutil.rmtree(FS_CACHE_DIR)
+    FS_CACHE_DIR = FS_CACHE = None
+
+
+def before_filesystem_cache_set_1k():
+    fill_filesystem_cache(1000)
+
+
+def time_filesystem_cache_set_1k():
+    for x in xrange(100):
+        FS_CACHE.set('new%d' % x, x)
+
+
+def after_filesystem_cache_set_1k():
+    remove_filesystem_cache()
+
+
+def before_filesystem_cache_set_100k():
+    fill_filesystem_cache(100000)
+
+
+def time_filesystem_cache_set_100k():
+    for x in xrange(100):
+        FS_CACHE.set('new%d' % x, x)
+
+
+def after_filesystem_cache_set_100k():
+    remove_filesystem_cache()
+
+
+def _sha1(*args):
+    # hashlib does not know this function by name, so pbkdf2 has to
+    # use the pure Python implementation.
+    return hashlib.sha1(*args)
+
+
+def pbkdf2(iterations, hashfunc=None):
+    from werkzeug.security import pbkdf2_bin
+    pbkdf2_bin('password', 'salt', iterations, hashfunc=hashfunc)
+
+
+def time_pbkdf2_native_1k():
+    pbkdf2(1000)
+
+
+def time_pbkdf2_native_10k():
+    pbkdf2(10000)
+
+
+def time_pbkdf2_native_100k():
+    pbkdf2(100000)
+
+
+def time_pbkdf2_python_1k():
+    pbkdf2(1000, _sha1)
+
+
+def time_pbkdf2_python_10k():
+    pbkdf2(10000, _sha1)
+
+
+def time_pbkdf2_python_100k():
+    pbkdf2(100000, _sha1)
+
+
 if __name__ == '__main__':
     os.chdir(os.path.dirname(__file__) or os.path.curdir)
     try:
@@ -11,6 +11,10 @@ PY2 = sys.version_info[0] == 2
 
 _identity = lambda x: x
 
+#: Python 2.6 does not have :class:`memoryview`, code that uses it has to
+#: check for `None` and copy instead.
+memoryview = getattr(builtins, 'memoryview', None)
+
 if PY2:
     unichr = unichr
     text_type = unicode
@@ -214,6 +214,101 @@ class _DictAccessorProperty(object):
         )
 
 
+class _LRUDict(object):
+    """A mapping that keeps its keys in the order they were used, the least
+    recently used first.  The items are kept in a circular doubly linked
+    list of ``[prev, next, key, value]`` lists, so no operation depends on
+    the size.  It does no locking, callers shared between threads have to.
+
+    :internal:
+    """
+
+    def __init__(self):
+        self._links = {}
+        self._root = []
+        self._root[:] = [self._root, self._root, None, None]
+
+    def __len__(self):
+        return len(self._links)
+
+    def __contains__(self, key):
+        return key in self._links
+
+    def __iter__(self):
+        return iter([key for key, value in self.items()])
+
+    def _unlink(self, link):
+        prev, next = link[0], link[1]
+        prev[1] = next
+        next[0] = prev
+
+    def _link_last(self, link):
+        root = self._root
+        last = root[0]
+        last[1] = root[0] = link
+        link[0] = last
+        link[1] = root
+
+    def items(self):
+        """Returns a list of the ``(key, value)`` pairs, the least
+        recently used first.
+        """
+        rv = []
+        root = self._root
+        link = root[1]
+        while link is not root:
+            rv.append((link[2], link[3]))
+            link = link[1]
+        return rv
+
+    def get(self, key, default=None):
+        """Returns the value for `key` and marks it as the most recently
+        used one.
+        """
+        link = self._links.get(key)
+        if link is None:
+            return default
+        self._unlink(link)
+        self._link_last(link)
+        return link[3]
+
+    def peek(self, key, default=None):
+        """Returns the value for `key` without changing the order."""
+        link = self._links.get(key)
+        if link is None:
+            return default
+        return link[3]
+
+    def __setitem__(self, key, value):
+        link = self._links.get(key)
+        if link is not None:
+            self._unlink(link)
+        link = self._links[key] = [None, None, key, value]
+        self._link_last(link)
+
+    def pop(self, key, default=None):
+        link = self._links.pop(key, None)
+        if link is None:
+            return default
+        self._unlink(link)
+        return link[3]
+
+    def popitem(self):
+        """Removes and returns the least recently used ``(key, value)``
+        pair.
+        """
+        link = self._root[1]
+        if link is self._root:
+            raise KeyError('popitem(): mapping is empty')
+        self._unlink(link)
+        del self._links[link[2]]
+        return link[2], link[3]
+
+    def clear(self):
+        self._links.clear()
+        self._root[:] = [self._root, self._root, None, None]
+
+
 def _cookie_quote(b):
     buf = bytearray()
     all_legal = True
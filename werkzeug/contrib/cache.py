@@ -58,16 +58,28 @@
 """
 import os
 import re
+import sys
+import mmap
+import struct
 import tempfile
+from contextlib import contextmanager
 from hashlib import md5
+from heapq import heapify, heappop, heappush
+from itertools import count
+from threading import Lock, Semaphore
 from time import time
 try:
     import cPickle as pickle
 except ImportError:  # pragma: no cover
     import pickle
+try:
+    import fcntl
+except ImportError:  # pragma: no cover
+    fcntl = None
 
 from werkzeug._compat import iteritems, string_types, text_type, \
-     integer_types, to_bytes
+     integer_types, to_bytes, to_native, PY2
+from werkzeug._internal import _LRUDict
 from werkzeug.posixemulation import rename
 
 
@@ -87,6 +99,18 @@ def _items(mappingorseq):
     return mappingorseq
 
 
+def _batches(iterable, size):
+    """Yields the items of `iterable` in lists of up to `size` items."""
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
 class BaseCache(object):
     """Baseclass for the cache systems.  All the cache systems implement this
     API or a superset of it.
@@ -237,61 +261,170 @@ class NullCache(BaseCache):
     """
 
 
+#: types of values that :class:`SimpleCache` stores without pickling.
+_immutable_types = frozenset((type(None), bool, float, complex, bytes,
+                              text_type) + integer_types)
+
+
 class SimpleCache(BaseCache):
     """Simple memory cache for single process environments.  This class exists
-    mainly for the development server and is not 100% thread safe.  It tries
-    to use as many atomic operations as possible and no locks for simplicity
-    but it could happen under heavy load that keys are added multiple times.
+    mainly for the development server.  All operations hold a lock, so the
+    cache can be used from multiple threads.
+
+    If more than `threshold` items or, with `max_size`, more than that many
+    bytes are stored, the least recently used items are evicted.  Expired
+    items are removed in the order they expire.  Neither walks over all
+    items, so the cost of an operation does not depend on the size of the
+    cache.
+
+    Values are pickled so that every :meth:`~BaseCache.get` returns a copy.
+    Immutable values (``None``, booleans, numbers and strings) are stored as
+    they are.
 
     :param threshold: the maximum number of items the cache stores before
                       it starts deleting some.
     :param default_timeout: the default timeout that is used if no timeout is
                             specified on :meth:`~BaseCache.set`.
+    :param max_size: the maximum number of bytes the stored values may take
+                     up or `None` for no limit.  Values bigger than that are
+                     not stored.
+
+    .. versionchanged:: 0.10
+       Items are evicted in least recently used order.  The cache got a
+       lock, the `max_size` parameter and the :attr:`hits`, :attr:`misses`
+       and :attr:`evictions` counters.
     """
 
-    def __init__(self, threshold=500, default_timeout=300):
+    def __init__(self, threshold=500, default_timeout=300, max_size=None):
         BaseCache.__init__(self, default_timeout)
-        self._cache = {}
-        self.clear = self._cache.clear
         self._threshold = threshold
-
-    def _prune(self):
-        if len(self._cache) > self._threshold:
-            now = time()
-            for idx, (key, (expires, _)) in enumerate(self._cache.items()):
-                if expires <= now or idx % 3 == 0:
-                    self._cache.pop(key, None)
+        self.max_size = max_size
+        self._lock = Lock()
+        # the keys are mapped to ``(value, expires, size, pickled)`` tuples.
+        # The heap has an ``(expires, n, key)`` tuple for every set,
+        # outdated ones are skipped when popped.
+        self._cache = _LRUDict()
+        self._expiry = []
+        self._counter = count()
+        self._size = 0
+
+        #: how often :meth:`~BaseCache.get` found a key.
+        self.hits = 0
+        #: how often :meth:`~BaseCache.get` did not find a key or found an
+        #: expired one.
+        self.misses = 0
+        #: the number of items evicted because the cache was full.
+        self.evictions = 0
+
+    @property
+    def size(self):
+        """The approximate number of bytes the stored values take up."""
+        return self._size
+
+    def _dump(self, value):
+        if type(value) in _immutable_types:
+            return value, sys.getsizeof(value), False
+        value = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        return value, sys.getsizeof(value), True
+
+    def _load(self, entry):
+        if entry[3]:
+            return pickle.loads(entry[0])
+        return entry[0]
+
+    def _remove(self, key):
+        self._size -= self._cache.pop(key)[2]
+
+    def _remove_expired(self, now):
+        expiry = self._expiry
+        while expiry and expiry[0][0] <= now:
+            expires, _, key = heappop(expiry)
+            entry = self._cache.peek(key)
+            if entry is not None and entry[1] == expires:
+                self._remove(key)
+        # keys that are set over and over leave outdated entries behind.
+        if len(expiry) > 2 * len(self._cache) + 64:
+            expiry[:] = [(entry[1], next(self._counter), key)
+                         for key, entry in self._cache.items()]
+            heapify(expiry)
+
+    def _store(self, key, dumped, expires):
+        if key in self._cache:
+            self._remove(key)
+        value, size, pickled = dumped
+        if self.max_size is not None and size > self.max_size:
+            return False
+        self._cache[key] = (value, expires, size, pickled)
+        self._size += size
+        heappush(self._expiry, (expires, next(self._counter), key))
+
+        while len(self._cache) > self._threshold or \
+              (self.max_size is not None and self._size > self.max_size):
+            self._size -= self._cache.popitem()[1][2]
+            self.evictions += 1
+        return True
 
     def get(self, key):
+        with self._lock:
+            entry = self._cache.get(key)
+            if entry is None or entry[1] <= time():
+                if entry is not None:
+                    self._remove(key)
+                self.misses += 1
+                return None
+            self.hits += 1
         try:
-            expires, value = self._cache[key]
-            if expires > time():
-                return pickle.loads(value)
-        except (KeyError, pickle.PickleError):
+            return self._load(entry)
+        except pickle.PickleError:
             return None
 
     def set(self, key, value, timeout=None):
         if timeout is None:
             timeout = self.default_timeout
-        self._prune()
-        self._cache[key] = (time() + timeout, pickle.dumps(value,
-            pickle.HIGHEST_PROTOCOL))
-        return True
+        dumped = self._dump(value)
+        with self._lock:
+            now = time()
+            self._remove_expired(now)
+            return self._store(key, dumped, now + timeout)
 
     def add(self, key, value, timeout=None):
         if timeout is None:
             timeout = self.default_timeout
-        if len(self._cache) > self._threshold:
-            self._prune()
-        item = (time() + timeout, pickle.dumps(value,
-            pickle.HIGHEST_PROTOCOL))
-        if key in self._cache:
-            return False
-        self._cache.setdefault(key, item)
-        return True
+        dumped = self._dump(value)
+        with self._lock:
+            now = time()
+            self._remove_expired(now)
+            if key in self._cache:
+                return False
+            return self._store(key, dumped, now + timeout)
 
     def delete(self, key):
-        return self._cache.pop(key, None) is not None
+        with self._lock:
+            if key not in self._cache:
+                return False
+            self._remove(key)
+            return True
+
+    def clear(self):
+        with self._lock:
+            self._cache.clear()
+            del self._expiry[:]
+            self._size = 0
+        return True
+
+    def inc(self, key, delta=1):
+        with self._lock:
+            now = time()
+            self._remove_expired(now)
+            entry = self._cache.peek(key)
+            value = entry is not None and self._load(entry) or 0
+            value += delta
+            if self._store(key, self._dump(value),
+                           now + self.default_timeout):
+                return value
+
+    def dec(self, key, delta=1):
+        return self.inc(key, -delta)
 
 
 _test_memcached_key = re.compile(br'[^\x00-\x21\xff]{1,250}$').match
@@ -320,75 +453,112 @@ class MemcachedCache(BaseCache):
                        applications.  Keep in mind that
                        :meth:`~BaseCache.clear` will also clear keys with a
                        different prefix.
+    :param pool_size: the maximum number of clients if server addresses are
+                      given.  Every thread uses a client of its own and waits
+                      if all of them are in use.  A client passed as `servers`
+                      is shared.
+    :param batch_size: the maximum number of keys sent to the server in one
+                       request by the methods working with many keys.
+
+    .. versionchanged:: 0.10
+       `pool_size` and `batch_size` were added.
     """
 
-    def __init__(self, servers=None, default_timeout=300, key_prefix=None):
+    def __init__(self, servers=None, default_timeout=300, key_prefix=None,
+                 pool_size=10, batch_size=100):
+        if pool_size < 1:
+            raise ValueError('pool_size must be at least 1')
         BaseCache.__init__(self, default_timeout)
+        self._servers = None
         if servers is None or isinstance(servers, (list, tuple)):
             if servers is None:
                 servers = ['127.0.0.1:11211']
             self._client = self.import_preferred_memcache_lib(servers)
             if self._client is None:
                 raise RuntimeError('no memcache module found')
+            self._servers = servers
         else:
             # NOTE: servers is actually an already initialized memcache
             # client.
             self._client = servers
 
         self.key_prefix = to_bytes(key_prefix)
+        self.batch_size = batch_size
+        self._pool = [self._client]
+        self._pool_lock = Lock()
+        self._pool_slots = Semaphore(pool_size)
+
+    @contextmanager
+    def _pooled_client(self):
+        """Takes a client from the pool for the duration of the with block.
+        Clients are created as needed until there are `pool_size`.
+        """
+        if self._servers is None:
+            yield self._client
+            return
+        with self._pool_slots:
+            with self._pool_lock:
+                client = self._pool and self._pool.pop() or None
+            if client is None:
+                client = self.import_preferred_memcache_lib(self._servers)
+            try:
+                yield client
+            finally:
+                with self._pool_lock:
+                    self._pool.append(client)
 
-    def get(self, key):
+    def _encode_key(self, key):
         if isinstance(key, text_type):
             key = key.encode('utf-8')
         if self.key_prefix:
             key = self.key_prefix + key
+        return key
+
+    def _encode_keys(self, keys):
+        """Returns a dict that maps the encoded and prefixed keys to the given
+        ones.  Keys memcached does not support are left out.
+        """
+        prefix = self.key_prefix
+        rv = {}
+        for key in keys:
+            encoded_key = key
+            if isinstance(key, text_type):
+                encoded_key = key.encode('utf-8')
+            if prefix:
+                encoded_key = prefix + encoded_key
+            if _test_memcached_key(encoded_key):
+                rv[encoded_key] = key
+        return rv
+
+    def get(self, key):
+        key = self._encode_key(key)
         # memcached doesn't support keys longer than that.  Because often
         # checks for so long keys can occour because it's tested from user
         # submitted data etc we fail silently for getting.
         if _test_memcached_key(key):
-            return self._client.get(key)
+            with self._pooled_client() as client:
+                return client.get(key)
 
     def get_dict(self, *keys):
-        key_mapping = {}
-        have_encoded_keys = False
-        for key in keys:
-            if isinstance(key, unicode):
-                encoded_key = key.encode('utf-8')
-                have_encoded_keys = True
-            else:
-                encoded_key = key
-            if self.key_prefix:
-                encoded_key = self.key_prefix + encoded_key
-            if _test_memcached_key(key):
-                key_mapping[encoded_key] = key
-        d = rv = self._client.get_multi(key_mapping.keys())
-        if have_encoded_keys or self.key_prefix:
-            rv = {}
-            for key, value in iteritems(d):
-                rv[key_mapping[key]] = value
-        if len(rv) < len(keys):
-            for key in keys:
-                if key not in rv:
-                    rv[key] = None
+        key_mapping = self._encode_keys(keys)
+        rv = dict.fromkeys(keys)
+        with self._pooled_client() as client:
+            for batch in _batches(key_mapping, self.batch_size):
+                for key, value in iteritems(client.get_multi(batch)):
+                    rv[key_mapping[key]] = value
         return rv
 
     def add(self, key, value, timeout=None):
         if timeout is None:
             timeout = self.default_timeout
-        if isinstance(key, text_type):
-            key = key.encode('utf-8')
-        if self.key_prefix:
-            key = self.key_prefix + key
-        return self._client.add(key, value, timeout)
+        with self._pooled_client() as client:
+            return client.add(self._encode_key(key), value, timeout)
 
     def set(self, key, value, timeout=None):
         if timeout is None:
             timeout = self.default_timeout
-        if isinstance(key, text_type):
-            key = key.encode('utf-8')
-        if self.key_prefix:
-            key = self.key_prefix + key
-        return self._client.set(key, value, timeout)
+        with self._pooled_client() as client:
+            return client.set(self._encode_key(key), value, timeout)
 
     def get_many(self, *keys):
         d = self.get_dict(*keys)
@@ -397,51 +567,43 @@ class MemcachedCache(BaseCache):
     def set_many(self, mapping, timeout=None):
         if timeout is None:
             timeout = self.default_timeout
-        new_mapping = {}
-        for key, value in _items(mapping):
-            if isinstance(key, text_type):
-                key = key.encode('utf-8')
-            if self.key_prefix:
-                key = self.key_prefix + key
-            new_mapping[key] = value
-        failed_keys = self._client.set_multi(new_mapping, timeout)
+        failed_keys = False
+        with self._pooled_client() as client:
+            for batch in _batches(_items(mapping), self.batch_size):
+                values = dict(batch)
+                new_mapping = {}
+                for new_key, key in iteritems(self._encode_keys(values)):
+                    new_mapping[new_key] = values[key]
+                if len(new_mapping) < len(values) or \
+                   client.set_multi(new_mapping, timeout):
+                    failed_keys = True
         return not failed_keys
 
     def delete(self, key):
-        if isinstance(key, unicode):
-            key = key.encode('utf-8')
-        if self.key_prefix:
-            key = self.key_prefix + key
+        key = self._encode_key(key)
         if _test_memcached_key(key):
-            return self._client.delete(key)
+            with self._pooled_client() as client:
+                return client.delete(key)
 
     def delete_many(self, *keys):
-        new_keys = []
-        for key in keys:
-            if isinstance(key, unicode):
-                key = key.encode('utf-8')
-            if self.key_prefix:
-                key = self.key_prefix + key
-            if _test_memcached_key(key):
-                new_keys.append(key)
-        return self._client.delete_multi(new_keys)
+        rv = True
+        with self._pooled_client() as client:
+            for batch in _batches(self._encode_keys(keys), self.batch_size):
+                if not client.delete_multi(batch):
+                    rv = False
+        return rv
 
     def clear(self):
-        return self._client.flush_all()
+        with self._pooled_client() as client:
+            return client.flush_all()
 
     def inc(self, key, delta=1):
-        if isinstance(key, unicode):
-            key = key.encode('utf-8')
-        if self.key_prefix:
-            key = self.key_prefix + key
-        return self._client.incr(key, delta)
+        with self._pooled_client() as client:
+            return client.incr(self._encode_key(key), delta)
 
     def dec(self, key, delta=1):
-        if isinstance(key, unicode):
-            key = key.encode('utf-8')
-        if self.key_prefix:
-            key = self.key_prefix + key
-        return self._client.decr(key, delta)
+        with self._pooled_client() as client:
+            return client.decr(self._encode_key(key), delta)
 
     def import_preferred_memcache_lib(self, servers):
         """Returns an initialized memcache client.  Used by the constructor."""
@@ -499,11 +661,22 @@ class RedisCache(BaseCache):
     :param default_timeout: the default timeout that is used if no timeout is
                             specified on :meth:`~BaseCache.set`.
     :param key_prefix: A prefix that should be added to all keys.
+    :param batch_size: the maximum number of keys sent to the server at once
+                       by the methods working with many keys.  Each batch is
+                       one round trip.
+
+    .. versionchanged:: 0.10
+       `batch_size` was added.  :meth:`~BaseCache.set_many`,
+       :meth:`~BaseCache.get_many`, :meth:`~BaseCache.delete_many` and
+       :meth:`~BaseCache.clear` send the keys in batches and
+       :meth:`~BaseCache.add` sets the value and the timeout in one command.
+       This needs redis-py 2.7.4 and Redis 2.6.12 or later.
     """
 
     def __init__(self, host='localhost', port=6379, password=None,
-                 db=0, default_timeout=300, key_prefix=None):
+                 db=0, default_timeout=300, key_prefix=None, batch_size=1000):
         BaseCache.__init__(self, default_timeout)
+        self.batch_size = batch_size
         if isinstance(host, string_types):
             try:
                 import redis
@@ -546,7 +719,10 @@ class RedisCache(BaseCache):
     def get_many(self, *keys):
         if self.key_prefix:
             keys = [self.key_prefix + key for key in keys]
-        return [self.load_object(x) for x in self._client.mget(keys)]
+        rv = []
+        for batch in _batches(keys, self.batch_size):
+            rv.extend(self.load_object(x) for x in self._client.mget(batch))
+        return rv
 
     def set(self, key, value, timeout=None):
         if timeout is None:
@@ -558,17 +734,21 @@ class RedisCache(BaseCache):
         if timeout is None:
             timeout = self.default_timeout
         dump = self.dump_object(value)
-        added = self._client.setnx(self.key_prefix + key, dump)
-        return added and self._client.expire(self.key_prefix + key, timeout)
+        return bool(self._client.set(self.key_prefix + key, dump,
+                                     ex=timeout, nx=True))
 
     def set_many(self, mapping, timeout=None):
         if timeout is None:
             timeout = self.default_timeout
-        pipe = self._client.pipeline()
-        for key, value in _items(mapping):
-            dump = self.dump_object(value)
-            pipe.setex(self.key_prefix + key, dump, timeout)
-        return pipe.execute()
+        rv = True
+        for batch in _batches(_items(mapping), self.batch_size):
+            pipe = self._client.pipeline(transaction=False)
+            for key, value in batch:
+                pipe.setex(self.key_prefix + key, self.dump_object(value),
+                           timeout)
+            if not all(pipe.execute()):
+                rv = False
+        return rv
 
     def delete(self, key):
         return self._client.delete(self.key_prefix + key)
@@ -578,14 +758,17 @@ class RedisCache(BaseCache):
             return
         if self.key_prefix:
             keys = [self.key_prefix + key for key in keys]
-        return self._client.delete(*keys)
+        rv = 0
+        for batch in _batches(keys, self.batch_size):
+            rv += self._client.delete(*batch)
+        return rv
 
     def clear(self):
         status = False
         if self.key_prefix:
             keys = self._client.keys(self.key_prefix + '*')
-            if keys:
-                status = self._client.delete(*keys)
+            for batch in _batches(keys, self.batch_size):
+                status = self._client.delete(*batch)
         else:
             status = self._client.flushdb()
         return status
@@ -597,52 +780,264 @@ class RedisCache(BaseCache):
         return self._client.decr(self.key_prefix + key, delta)
 
 
+_is_hex = re.compile(r'[0-9a-f]+$').match
+
+
 class FileSystemCache(BaseCache):
     """A cache that stores the items on the file system.  This cache depends
     on being the only user of the `cache_dir`.  Make absolutely sure that
     nobody but this cache stores files there or otherwise the cache will
     randomly delete files therein.
 
+    The files are spread over sub directories named after the first two
+    characters of the hashed key.  The expiry time and size of every file
+    is appended to an index file in `cache_dir`, so :meth:`~BaseCache.set`
+    finds the files to delete without looking at every file.  Expired
+    files are deleted first, then the ones that expire soonest.  Processes
+    sharing the directory read what the others appended to the index.
+    Where :func:`fcntl.flock` is available the index is locked while it
+    is compacted.  Elsewhere the index is only advisory: a record another
+    process appends while the index is replaced gets lost, so the index
+    is compacted by scanning the files in the directory instead.
+
     :param cache_dir: the directory where cache files are stored.
     :param threshold: the maximum number of items the cache stores before
                       it starts deleting some.
     :param default_timeout: the default timeout that is used if no timeout is
                             specified on :meth:`~BaseCache.set`.
     :param mode: the file mode wanted for the cache files, default 0600
+    :param max_size: the maximum number of bytes the cache files may take
+                     up or `None` for no limit.
+
+    .. versionchanged:: 0.10
+       The files are stored in sub directories and an index is kept.  Files
+       stored by older versions are moved when the index is created.  The
+       `max_size` parameter was added.
     """
 
     #: used for temporary files by the FileSystemCache
     _fs_transaction_suffix = '.__wz_cache'
 
-    def __init__(self, cache_dir, threshold=500, default_timeout=300, mode=0o600):
+    #: the name of the index file in the cache directory.
+    _fs_index_name = '__wz_cache_index'
+
+    #: a record in the index: the hashed key, the expiry time and the size
+    #: of the file.  An expiry time of zero marks a deleted file.
+    _fs_index_record = struct.Struct('!32sdQ')
+
+    def __init__(self, cache_dir, threshold=500, default_timeout=300, mode=0o600,
+                 max_size=None):
         BaseCache.__init__(self, default_timeout)
         self._path = cache_dir
         self._threshold = threshold
         self._mode = mode
+        self.max_size = max_size
+        self._index_path = os.path.join(cache_dir, self._fs_index_name)
+        self._reset_index()
         if not os.path.exists(self._path):
             os.makedirs(self._path)
+        if not os.path.exists(self._index_path):
+            self._rebuild_index()
+
+    def _reset_index(self):
+        # the hashes of the files mapped to ``(expires, size)`` and a heap
+        # of ``(expires, hash)`` tuples, outdated ones are skipped.
+        self._entries = {}
+        self._expiry = []
+        self._size = 0
+        self._index_id = None
+        self._index_offset = 0
+
+    def _apply_record(self, hash, expires, size):
+        old = self._entries.pop(hash, None)
+        if old is not None:
+            self._size -= old[1]
+        if expires:
+            self._entries[hash] = (expires, size)
+            self._size += size
+            heappush(self._expiry, (expires, hash))
+
+    def _read_index(self):
+        """Applies the records appended to the index since the last call.
+        If the index was replaced it is read from the start.
+        """
+        try:
+            with open(self._index_path, 'rb') as f:
+                st = os.fstat(f.fileno())
+                if (st.st_dev, st.st_ino) != self._index_id or \
+                   st.st_size < self._index_offset:
+                    self._reset_index()
+                    self._index_id = (st.st_dev, st.st_ino)
+                f.seek(self._index_offset)
+                data = f.read()
+        except (IOError, OSError):
+            return
+        record = self._fs_index_record
+        # another process might be in the middle of appending a record.
+        end = len(data) - len(data) % record.size
+        for offset in range(0, end, record.size):
+            hash, expires, size = record.unpack_from(data, offset)
+            self._apply_record(to_native(hash, 'ascii'), expires, size)
+        self._index_offset += end
+
+    @contextmanager
+    def _index_lock(self, exclusive=False):
+        """Locks the cache directory.  Appending to the index takes a
+        shared lock, replacing the index an exclusive one.  Does nothing
+        without :mod:`fcntl`.
+        """
+        fd = None
+        if fcntl is not None:
+            try:
+                fd = os.open(self._path, os.O_RDONLY)
+                fcntl.flock(fd, exclusive and fcntl.LOCK_EX or fcntl.LOCK_SH)
+            except (IOError, OSError):
+                pass
+        try:
+            yield
+        finally:
+            if fd is not None:
+                os.close(fd)
+
+    def _append_index(self, hash, expires, size):
+        self._apply_record(hash, expires, size)
+        data = self._fs_index_record.pack(to_bytes(hash, 'ascii'),
+                                          expires, size)
+        try:
+            with self._index_lock():
+                fd = os.open(self._index_path, os.O_WRONLY | os.O_APPEND |
+                             os.O_CREAT | getattr(os, 'O_BINARY', 0),
+                             self._mode)
+                try:
+                    os.write(fd, data)
+                finally:
+                    os.close(fd)
+        except (IOError, OSError):
+            pass
 
-    def _list_dir(self):
-        """return a list of (fully qualified) cache filenames
+    def _write_index(self, entries):
+        """Replaces the index with one that has a record for every
+        ``(hash, expires, size)`` tuple in `entries`.
         """
-        return [os.path.join(self._path, fn) for fn in os.listdir(self._path)
-                if not fn.endswith(self._fs_transaction_suffix)]
+        pack = self._fs_index_record.pack
+        try:
+            fd, tmp = tempfile.mkstemp(suffix=self._fs_transaction_suffix,
+                                       dir=self._path)
+            with os.fdopen(fd, 'wb') as f:
+                for hash, expires, size in entries:
+                    f.write(pack(to_bytes(hash, 'ascii'), expires, size))
+            rename(tmp, self._index_path)
+            os.chmod(self._index_path, self._mode)
+        except (IOError, OSError):
+            return False
+        self._read_index()
+        return True
 
-    def _prune(self):
-        entries = self._list_dir()
-        if len(entries) > self._threshold:
-            now = time()
+    def _compact_index(self):
+        """Replaces the index with one that has a single record for every
+        file.
+        """
+        if fcntl is None:
+            # records appended while the index is replaced would get lost,
+            # the files themselves are the only reliable source.
+            return self._rebuild_index()
+        with self._index_lock(exclusive=True):
+            # pick up what other processes appended since the last read,
+            # nothing can be appended until the new index is in place.
+            self._read_index()
+            return self._write_index([(hash, expires, size) for hash,
+                                      (expires, size) in
+                                      iteritems(self._entries)])
+
+    def _rebuild_index(self):
+        """Writes an index for the files in the cache directory.  Files that
+        older versions stored directly in the cache directory are moved to
+        their sub directory.
+        """
+        hashes = []
+        for name in os.listdir(self._path):
+            if not _is_hex(name):
+                continue
+            path = os.path.join(self._path, name)
+            if len(name) == 32:
+                try:
+                    self._make_file_dir(name)
+                    rename(path, self._get_hash_filename(name))
+                except (IOError, OSError):
+                    continue
+                hashes.append(name)
+            elif len(name) == 2 and os.path.isdir(path):
+                hashes.extend(name + fn for fn in os.listdir(path)
+                              if len(fn) == 30 and _is_hex(fn))
+        entries = []
+        for hash in hashes:
+            filename = self._get_hash_filename(hash)
             try:
-                for idx, fname in enumerate(entries):
-                    remove = False
-                    with open(fname, 'rb') as f:
-                        expires = pickle.load(f)
-                    remove = expires <= now or idx % 3 == 0
-
-                    if remove:
-                        os.remove(fname)
-            except (IOError, OSError):
+                with open(filename, 'rb') as f:
+                    expires = pickle.load(f)
+                    f.seek(0, 2)
+                    entries.append((hash, expires, f.tell()))
+            except (IOError, OSError, EOFError, pickle.PickleError):
                 pass
+        with self._index_lock(exclusive=True):
+            return self._write_index(entries)
+
+    def _list_dir(self):
+        """return a list of (fully qualified) cache filenames
+        """
+        rv = []
+        for name in os.listdir(self._path):
+            if not _is_hex(name):
+                continue
+            path = os.path.join(self._path, name)
+            if len(name) == 32:
+                rv.append(path)
+            elif len(name) == 2 and os.path.isdir(path):
+                rv.extend(os.path.join(path, fn) for fn in os.listdir(path)
+                          if not fn.endswith(self._fs_transaction_suffix))
+        return rv
+
+    def _prune(self, room=0):
+        """Deletes expired files and, if the cache is full, the files that
+        expire soonest until there is room for a file of `room` bytes.
+        """
+        self._read_index()
+        entries = self._entries
+        expiry = self._expiry
+        now = time()
+        while expiry:
+            expires, hash = expiry[0]
+            if expires > now and len(entries) < self._threshold and \
+               (self.max_size is None or
+                self._size + room <= self.max_size):
+                break
+            heappop(expiry)
+            entry = entries.get(hash)
+            if entry is not None and entry[0] == expires:
+                self._remove_file(hash)
+
+        # the index keeps growing with every set, replace it once most of
+        # it is outdated.
+        if self._index_offset > (2 * len(entries) + 1024) * \
+           self._fs_index_record.size:
+            self._compact_index()
+            entries = self._entries
+            expiry = self._expiry
+        if len(expiry) > 2 * len(entries) + 1024:
+            expiry[:] = [(expires, hash) for hash, (expires, _)
+                         in iteritems(entries)]
+            heapify(expiry)
+
+    def _remove_file(self, hash):
+        try:
+            os.remove(self._get_hash_filename(hash))
+        except (IOError, OSError):
+            removed = False
+        else:
+            removed = True
+        if removed or hash in self._entries:
+            self._append_index(hash, 0, 0)
+        return removed
 
     def clear(self):
         for fname in self._list_dir():
@@ -650,25 +1045,40 @@ class FileSystemCache(BaseCache):
                 os.remove(fname)
             except (IOError, OSError):
                 return False
-        return True
+        with self._index_lock(exclusive=True):
+            return self._write_index(())
 
-    def _get_filename(self, key):
+    def _get_hash(self, key):
         if isinstance(key, text_type):
             key = key.encode('utf-8') #XXX unicode review
-        hash = md5(key).hexdigest()
-        return os.path.join(self._path, hash)
+        return md5(key).hexdigest()
+
+    def _get_hash_filename(self, hash):
+        return os.path.join(self._path, hash[:2], hash[2:])
+
+    def _get_filename(self, key):
+        return self._get_hash_filename(self._get_hash(key))
+
+    def _make_file_dir(self, hash):
+        path = os.path.join(self._path, hash[:2])
+        if not os.path.isdir(path):
+            try:
+                os.mkdir(path)
+            except OSError:
+                # another process might have created it.
+                if not os.path.isdir(path):
+                    raise
 
     def get(self, key):
-        filename = self._get_filename(key)
+        hash = self._get_hash(key)
         try:
-            with open(filename, 'rb') as f:
+            with open(self._get_hash_filename(hash), 'rb') as f:
                 if pickle.load(f) >= time():
                     return pickle.load(f)
-                else:
-                    os.remove(filename)
-                    return None
         except (IOError, OSError, pickle.PickleError):
             return None
+        self._remove_file(hash)
+        return None
 
     def add(self, key, value, timeout=None):
         filename = self._get_filename(key)
@@ -679,25 +1089,249 @@ class FileSystemCache(BaseCache):
     def set(self, key, value, timeout=None):
         if timeout is None:
             timeout = self.default_timeout
-        filename = self._get_filename(key)
-        self._prune()
+        hash = self._get_hash(key)
+        filename = self._get_hash_filename(hash)
+        expires = int(time() + timeout)
         try:
             fd, tmp = tempfile.mkstemp(suffix=self._fs_transaction_suffix,
                                        dir=self._path)
             with os.fdopen(fd, 'wb') as f:
-                pickle.dump(int(time() + timeout), f, 1)
+                pickle.dump(expires, f, 1)
                 pickle.dump(value, f, pickle.HIGHEST_PROTOCOL)
+                size = f.tell()
+            self._prune(size)
+            self._make_file_dir(hash)
             rename(tmp, filename)
             os.chmod(filename, self._mode)
         except (IOError, OSError):
             return False
-        else:
-            return True
+        self._append_index(hash, expires, size)
+        return True
 
     def delete(self, key):
+        return self._remove_file(self._get_hash(key))
+
+
+class MmapCache(BaseCache):
+    """A cache that keeps the items in a memory mapped file of a fixed size.
+    All processes on a machine that use the same file share the cache, for
+    example the workers of a :class:`~werkzeug.serving.PreforkWSGIServer`,
+    without running a cache server.
+
+    The file is a hash table with room for `threshold` items of up to
+    `slot_size` bytes each.  Every key can be stored in one of `ways` slots
+    picked by its hash.  If all of them are used the least recently used
+    item among them is replaced.  Each group of slots is locked with
+    :func:`fcntl.lockf` while it is used, so other processes can work with
+    the rest of the cache at the same time.  Values are pickled, ones that
+    don't fit into a slot are not stored.
+
+    If the file exists it keeps the size it was created with, the
+    `threshold`, `slot_size` and `ways` parameters are only used to create
+    it.  Locks held on the file are released if the process closes any
+    other file descriptor for it, so use only one instance per process.
+    This cache requires the :mod:`fcntl` module.
+
+    :param path: the path of the cache file.  It is created if it does not
+                 exist.
+    :param threshold: the maximum number of items the cache stores.
+    :param slot_size: the size of a slot in bytes.  A slot holds the
+                      pickled value and 37 bytes of bookkeeping.
+    :param default_timeout: the default timeout that is used if no timeout is
+                            specified on :meth:`~BaseCache.set`.
+    :param mode: the file mode wanted for the cache file, default 0600
+    :param ways: the number of slots a key can be stored in.
+
+    .. versionadded:: 0.10
+    """
+
+    #: the file header: a magic string, the number of slots and the size
+    #: of a slot.  The slots start at :attr:`_header_size`.
+    _header = struct.Struct('!8sII')
+    _header_size = 64
+    _magic = b'WZMMAP01'
+
+    #: the start of a slot: a used flag, the hashed key, the expiry time,
+    #: the time the item was last used and the length of the value.
+    _slot = struct.Struct('!B16sddI')
+
+    def __init__(self, path, threshold=4096, slot_size=1024,
+                 default_timeout=300, mode=0o600, ways=8):
+        BaseCache.__init__(self, default_timeout)
+        if fcntl is None:
+            raise RuntimeError('the mmap cache requires the fcntl module')
+        self._path = path
+        self._lock = Lock()
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT, mode)
+        fcntl.lockf(self._fd, fcntl.LOCK_EX)
         try:
-            os.remove(self._get_filename(key))
-        except (IOError, OSError):
+            os.lseek(self._fd, 0, 0)
+            header = os.read(self._fd, self._header.size)
+            if len(header) == self._header.size and \
+               header[:len(self._magic)] == self._magic:
+                _, slots, slot_size = self._header.unpack(header)
+            else:
+                if slot_size <= self._slot.size:
+                    raise ValueError('slot_size has to be bigger than %d' %
+                                     self._slot.size)
+                slots = max(threshold, ways)
+                slots -= slots % ways
+                os.ftruncate(self._fd, self._header_size + slots * slot_size)
+                os.lseek(self._fd, 0, 0)
+                os.write(self._fd, self._header.pack(self._magic, slots,
+                                                     slot_size))
+        finally:
+            fcntl.lockf(self._fd, fcntl.LOCK_UN)
+        self._slot_size = slot_size
+        self._ways = ways
+        self._bucket_size = ways * slot_size
+        self._buckets = slots // ways
+        self._map = mmap.mmap(self._fd, self._header_size + slots * slot_size)
+
+    def _get_hash(self, key):
+        if isinstance(key, text_type):
+            key = key.encode('utf-8')
+        return md5(key).digest()
+
+    def _get_bucket(self, hash):
+        return self._header_size + self._bucket_size * \
+            (struct.unpack('!Q', hash[:8])[0] % self._buckets)
+
+    @contextmanager
+    def _locked(self, offset, length):
+        with self._lock:
+            fcntl.lockf(self._fd, fcntl.LOCK_EX, length, offset)
+            try:
+                yield
+            finally:
+                fcntl.lockf(self._fd, fcntl.LOCK_UN, length, offset)
+
+    def _find(self, bucket, hash, now):
+        """Returns the offset of the slot that holds `hash` or `None`.
+        An expired item is removed.
+        """
+        unpack_from = self._slot.unpack_from
+        for offset in range(bucket, bucket + self._bucket_size,
+                            self._slot_size):
+            used, slot_hash, expires = unpack_from(self._map, offset)[:3]
+            if used and slot_hash == hash:
+                if expires > now:
+                    return offset
+                self._map[offset:offset + 1] = b'\x00'
+                return None
+
+    def _find_free(self, bucket, hash, now):
+        """Returns the offset of the slot a new item with `hash` is stored
+        in: the one with the old value, a free one or the least recently
+        used one.
+        """
+        unpack_from = self._slot.unpack_from
+        free = oldest = None
+        for offset in range(bucket, bucket + self._bucket_size,
+                            self._slot_size):
+            used, slot_hash, expires, last_used = \
+                unpack_from(self._map, offset)[:4]
+            if used and slot_hash == hash:
+                return offset
+            if free is not None:
+                continue
+            if not used or expires <= now:
+                free = offset
+            elif oldest is None or last_used < oldest_used:
+                oldest, oldest_used = offset, last_used
+        if free is not None:
+            return free
+        return oldest
+
+    def _load(self, offset):
+        length = self._slot.unpack_from(self._map, offset)[4]
+        start = offset + self._slot.size
+        if PY2:
+            return pickle.loads(self._map[start:start + length])
+        with memoryview(self._map) as view:
+            return pickle.loads(view[start:start + length])
+
+    def _store(self, bucket, hash, data, expires, now):
+        if len(data) > self._slot_size - self._slot.size:
+            offset = self._find(bucket, hash, now)
+            if offset is not None:
+                self._map[offset:offset + 1] = b'\x00'
             return False
-        else:
+        offset = self._find_free(bucket, hash, now)
+        start = offset + self._slot.size
+        self._map[start:start + len(data)] = data
+        self._slot.pack_into(self._map, offset, 1, hash, expires, now,
+                             len(data))
+        return True
+
+    def get(self, key):
+        hash = self._get_hash(key)
+        bucket = self._get_bucket(hash)
+        with self._locked(bucket, self._bucket_size):
+            now = time()
+            offset = self._find(bucket, hash, now)
+            if offset is None:
+                return None
+            # update the time the item was last used
+            slot = list(self._slot.unpack_from(self._map, offset))
+            slot[3] = now
+            self._slot.pack_into(self._map, offset, *slot)
+            try:
+                return self._load(offset)
+            except pickle.PickleError:
+                return None
+
+    def set(self, key, value, timeout=None):
+        if timeout is None:
+            timeout = self.default_timeout
+        hash = self._get_hash(key)
+        bucket = self._get_bucket(hash)
+        data = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        with self._locked(bucket, self._bucket_size):
+            now = time()
+            return self._store(bucket, hash, data, now + timeout, now)
+
+    def add(self, key, value, timeout=None):
+        if timeout is None:
+            timeout = self.default_timeout
+        hash = self._get_hash(key)
+        bucket = self._get_bucket(hash)
+        data = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        with self._locked(bucket, self._bucket_size):
+            now = time()
+            if self._find(bucket, hash, now) is not None:
+                return False
+            return self._store(bucket, hash, data, now + timeout, now)
+
+    def delete(self, key):
+        hash = self._get_hash(key)
+        bucket = self._get_bucket(hash)
+        with self._locked(bucket, self._bucket_size):
+            offset = self._find(bucket, hash, time())
+            if offset is None:
+                return False
+            self._map[offset:offset + 1] = b'\x00'
             return True
+
+    def clear(self):
+        with self._locked(0, 0):
+            for offset in range(self._header_size, len(self._map),
+                                self._slot_size):
+                self._map[offset:offset + 1] = b'\x00'
+        return True
+
+    def inc(self, key, delta=1):
+        hash = self._get_hash(key)
+        bucket = self._get_bucket(hash)
+        with self._locked(bucket, self._bucket_size):
+            now = time()
+            offset = self._find(bucket, hash, now)
+            value = offset is not None and self._load(offset) or 0
+            value += delta
+            data = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+            if self._store(bucket, hash, data, now + self.default_timeout,
+                           now):
+                return value
+
+    def dec(self, key, delta=1):
+        return self.inc(key, -delta)
@@ -2504,6 +2504,9 @@ class FileStorage(object):
     ``storage.stream.read()``.
     """
 
+    # set by the form data parser if it post-processes the file
+    future = None
+
     def __init__(self, stream=None, filename=None, name=None,
                  content_type=None, content_length=None,
                  headers=None):
@@ -2587,8 +2590,16 @@ class FileStorage(object):
         :param buffer_size: the size of the buffer.  This works the same as
                             the `length` parameter of
                             :func:`shutil.copyfileobj`.
+
+        .. versionchanged:: 0.10
+           Streams with a `save_to` method like
+           :class:`~werkzeug.formparser.SpooledUploadFile` save themselves.
         """
         from shutil import copyfileobj
+        save_to = getattr(self.stream, 'save_to', None)
+        if save_to is not None:
+            save_to(dst, buffer_size)
+            return
         close_dst = False
         if isinstance(dst, string_types):
             dst = open(dst, 'wb')
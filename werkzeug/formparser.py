@@ -9,27 +9,33 @@
     :copyright: (c) 2014 by the Werkzeug Team, see AUTHORS for more details.
     :license: BSD, see LICENSE for more details.
 """
+import os
 import re
+import stat
 import codecs
-from io import BytesIO
-from tempfile import TemporaryFile
-from itertools import chain, repeat, tee
+from tempfile import TemporaryFile, mkstemp
+from shutil import copyfileobj
 from functools import update_wrapper
 
-from werkzeug._compat import to_native, text_type
-from werkzeug.urls import url_decode_stream
+from werkzeug._compat import to_native, text_type, string_types, memoryview
+from werkzeug.urls import _url_decode_impl
 from werkzeug.wsgi import make_line_iter, \
-     get_input_stream, get_content_length
+     get_input_stream, get_content_length, _make_chunk_iter
 from werkzeug.datastructures import Headers, FileStorage, MultiDict
 from werkzeug.http import parse_options_header
 
 
-#: an iterator that yields empty strings
-_empty_string_iter = repeat('')
-
 #: a regular expression for multipart boundaries
 _multipart_boundary_re = re.compile('^[ -~]{0,200}[!-~]$')
 
+_sendfile = getattr(os, 'sendfile', None)
+
+#: line endings in multipart data
+_line_end_re = re.compile(b'\r\n?|\n')
+
+#: the rest of a multipart boundary line after the boundary
+_boundary_end_re = re.compile(b'(--)?[ \t\x0b\x0c]*(?:\r\n?|\n|\\Z)')
+
 #: supported http encodings that are also available in python we support
 #: for multipart messages.
 _supported_multipart_encodings = frozenset(['base64', 'quoted-printable'])
@@ -37,16 +43,255 @@ _supported_multipart_encodings = frozenset(['base64', 'quoted-printable'])
 
 def default_stream_factory(total_content_length, filename, content_type,
                            content_length=None):
-    """The stream factory that is used per default."""
-    if total_content_length > 1024 * 500:
-        return TemporaryFile('wb+')
-    return BytesIO()
+    """The stream factory that is used per default.  Returns a
+    :class:`SpooledUploadFile` that keeps the data in memory unless the
+    request is larger than 500KB.
+    """
+    max_size = 1024 * 500
+    if total_content_length > max_size:
+        max_size = 0
+    return SpooledUploadFile(max_size)
+
+
+class SpooledUploadFile(object):
+    """A file-like container for uploaded files.  The data is kept in a
+    :class:`bytearray` until more than `max_size` bytes were written, then
+    it is moved to a temporary file.  Writes accept any object that
+    supports the buffer protocol such as :class:`memoryview`.
+
+    :meth:`~werkzeug.datastructures.FileStorage.save` uses :meth:`save_to`
+    which writes the data to the destination without reading it into
+    intermediate strings.  If `named` is `True` the temporary file has a
+    name and saving it to a path on the same file system moves it there
+    with :func:`os.rename`.  After that the container reads the moved file
+    and can't be written to anymore.  Named temporary files are removed
+    when the container is closed.
+
+    .. versionadded:: 0.10
+
+    :param max_size: the number of bytes that are kept in memory.
+    :param named: if set to `True` the data is spooled to a named
+                  temporary file instead of an anonymous one.
+    :param dir: the directory for the temporary file.
+    """
+
+    def __init__(self, max_size=1024 * 500, named=False, dir=None):
+        self.max_size = max_size
+        self.named = named
+        self.dir = dir
+        self.closed = False
+        self._buffer = bytearray()
+        self._pos = 0
+        self._file = None
+        self._path = None
+        self._moved = False
+
+    def __del__(self):
+        self.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.close()
+
+    @property
+    def in_memory(self):
+        """`True` as long as the data is kept in memory."""
+        return self._file is None
+
+    def rollover(self):
+        """Moves the data from memory to a temporary file."""
+        if self._file is not None:
+            return
+        if self.named:
+            fd, self._path = mkstemp(dir=self.dir)
+            f = os.fdopen(fd, 'w+b')
+        else:
+            f = TemporaryFile('w+b', dir=self.dir)
+        f.write(self._buffer)
+        f.seek(self._pos)
+        self._file = f
+        self._buffer = None
+
+    def write(self, data):
+        if self._file is None:
+            end = self._pos + len(data)
+            if end <= self.max_size:
+                buf = self._buffer
+                if self._pos > len(buf):
+                    buf.extend(b'\0' * (self._pos - len(buf)))
+                buf[self._pos:end] = data
+                self._pos = end
+                return len(data)
+            self.rollover()
+        return self._file.write(data)
+
+    def read(self, size=-1):
+        if self._file is not None:
+            return self._file.read(size)
+        buf = self._buffer
+        end = len(buf)
+        if size is not None and size >= 0:
+            end = min(end, self._pos + size)
+        if self._pos >= end:
+            return b''
+        rv = bytes(buf[self._pos:end])
+        self._pos = end
+        return rv
+
+    def readline(self, size=-1):
+        if self._file is not None:
+            return self._file.readline(size)
+        buf = self._buffer
+        if self._pos >= len(buf):
+            return b''
+        end = buf.find(b'\n', self._pos) + 1 or len(buf)
+        if size is not None and size >= 0:
+            end = min(end, self._pos + size)
+        rv = bytes(buf[self._pos:end])
+        self._pos = end
+        return rv
+
+    def readlines(self, hint=-1):
+        return list(self)
+
+    def __iter__(self):
+        return iter(self.readline, b'')
+
+    def seek(self, pos, whence=0):
+        if self._file is not None:
+            return self._file.seek(pos, whence)
+        if whence == 1:
+            pos += self._pos
+        elif whence == 2:
+            pos += len(self._buffer)
+        if pos < 0:
+            raise ValueError('negative seek position %d' % pos)
+        self._pos = pos
+        return pos
+
+    def tell(self):
+        if self._file is not None:
+            return self._file.tell()
+        return self._pos
+
+    def truncate(self, size=None):
+        if self._file is not None:
+            if size is None:
+                return self._file.truncate()
+            return self._file.truncate(size)
+        if size is None:
+            size = self._pos
+        del self._buffer[size:]
+        return size
+
+    def getvalue(self):
+        """Returns all data as bytes."""
+        if self._file is None:
+            return bytes(self._buffer)
+        pos = self._file.tell()
+        try:
+            self._file.seek(0)
+            return self._file.read()
+        finally:
+            self._file.seek(pos)
+
+    def flush(self):
+        if self._file is not None:
+            self._file.flush()
+
+    def fileno(self):
+        self.rollover()
+        return self._file.fileno()
+
+    def readable(self):
+        return True
+
+    def writable(self):
+        return not self._moved
+
+    def seekable(self):
+        return True
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        self._buffer = None
+        if self._file is not None:
+            self._file.close()
+        if self._path is not None:
+            try:
+                os.remove(self._path)
+            except OSError:
+                pass
+            self._path = None
+
+    def save_to(self, dst, buffer_size=16384):
+        """Writes the data from the current position to `dst` which is
+        either a filename or a file object.
+        """
+        if not isinstance(dst, string_types):
+            self._copy(dst, buffer_size)
+            return
+        # the file is created first so that a moved file gets the same
+        # permissions as one the data is copied to.
+        with open(dst, 'wb') as f:
+            if not self._move(dst):
+                self._copy(f, buffer_size, f.fileno())
+
+    def _move(self, dst):
+        if self._path is None or self._file.tell() != 0 or \
+           os.path.islink(dst):
+            return False
+        self._file.flush()
+        try:
+            os.chmod(self._path, stat.S_IMODE(os.stat(dst).st_mode))
+            os.rename(self._path, dst)
+        except OSError:
+            return False
+        # the open file now is `dst`, writes must not change it.
+        self._path = None
+        self._moved = True
+        self._file.close()
+        self._file = open(dst, 'rb')
+        self._file.seek(0, 2)
+        return True
+
+    def _copy(self, dst, buffer_size, dst_fd=None):
+        if self._file is None:
+            if self._pos < len(self._buffer):
+                if memoryview is None:
+                    dst.write(bytes(self._buffer[self._pos:]))
+                else:
+                    dst.write(memoryview(self._buffer)[self._pos:])
+                self._pos = len(self._buffer)
+            return
+        if dst_fd is not None and _sendfile is not None:
+            self._file.flush()
+            fd = self._file.fileno()
+            offset = self._file.tell()
+            size = os.fstat(fd).st_size
+            try:
+                while offset < size:
+                    sent = _sendfile(dst_fd, fd, offset, size - offset)
+                    if not sent:
+                        break
+                    offset += sent
+            except OSError:
+                # sendfile only supports sockets as destination on some
+                # systems, copy the rest with a buffer.
+                pass
+            self._file.seek(offset)
+        copyfileobj(self, dst, buffer_size)
 
 
 def parse_form_data(environ, stream_factory=None, charset='utf-8',
                     errors='replace', max_form_memory_size=None,
                     max_content_length=None, cls=None,
-                    silent=True):
+                    silent=True, executor=None, file_processor=None,
+                    max_form_fields=None, max_field_size=None):
     """Parse the form data in the environ and return it as tuple in the form
     ``(stream, form, files)``.  You should only call this method if the
     transport method is `POST`, `PUT`, or `PATCH`.
@@ -67,6 +312,10 @@ def parse_form_data(environ, stream_factory=None, charset='utf-8',
     .. versionadded:: 0.5.1
        The optional `silent` flag was added.
 
+    .. versionadded:: 0.10
+       The `executor`, `file_processor`, `max_form_fields` and
+       `max_field_size` parameters were added.
+
     :param environ: the WSGI environment to be used for parsing.
     :param stream_factory: An optional callable that returns a new read and
                            writeable file descriptor.  This callable works
@@ -85,11 +334,17 @@ def parse_form_data(environ, stream_factory=None, charset='utf-8',
     :param cls: an optional dict class to use.  If this is not specified
                        or `None` the default :class:`MultiDict` is used.
     :param silent: If set to False parsing errors will not be caught.
+    :param executor: see :class:`FormDataParser`.
+    :param file_processor: see :class:`FormDataParser`.
+    :param max_form_fields: see :class:`FormDataParser`.
+    :param max_field_size: see :class:`FormDataParser`.
     :return: A tuple in the form ``(stream, form, files)``.
     """
     return FormDataParser(stream_factory, charset, errors,
                           max_form_memory_size, max_content_length,
-                          cls, silent).parse_from_environ(environ)
+                          cls, silent, executor, file_processor,
+                          max_form_fields,
+                          max_field_size).parse_from_environ(environ)
 
 
 def exhaust_stream(f):
@@ -135,12 +390,35 @@ class FormDataParser(object):
     :param cls: an optional dict class to use.  If this is not specified
                        or `None` the default :class:`MultiDict` is used.
     :param silent: If set to False parsing errors will not be caught.
+    :param max_form_fields: the maximum number of fields accepted in url
+                            encoded form data.  If there are more an
+                            :exc:`~exceptions.RequestEntityTooLarge`
+                            exception is raised.
+    :param max_field_size: the maximum number of bytes of a single encoded
+                           field in url encoded form data.  If a field is
+                           longer an
+                           :exc:`~exceptions.RequestEntityTooLarge`
+                           exception is raised.
+    :param executor: an executor like the ones from :mod:`concurrent.futures`
+                     that runs the `file_processor`.
+    :param file_processor: a callable that is submitted to the `executor`
+                           with each uploaded :class:`FileStorage` as soon
+                           as the file was parsed, while the parser goes on
+                           with the next part.  The future is available as
+                           :attr:`FileStorage.future` and the stream of the
+                           file is rewound when the callable returns.  Wait
+                           for the future before reading the file.
+
+    .. versionadded:: 0.10
+       The `max_form_fields`, `max_field_size`, `executor` and
+       `file_processor` parameters were added.
     """
 
     def __init__(self, stream_factory=None, charset='utf-8',
                  errors='replace', max_form_memory_size=None,
                  max_content_length=None, cls=None,
-                 silent=True):
+                 silent=True, executor=None, file_processor=None,
+                 max_form_fields=None, max_field_size=None):
         if stream_factory is None:
             stream_factory = default_stream_factory
         self.stream_factory = stream_factory
@@ -152,6 +430,10 @@ class FormDataParser(object):
             cls = MultiDict
         self.cls = cls
         self.silent = silent
+        self.executor = executor
+        self.file_processor = file_processor
+        self.max_form_fields = max_form_fields
+        self.max_field_size = max_field_size
 
     def get_parse_func(self, mimetype, options):
         return self.parse_functions.get(mimetype)
@@ -179,10 +461,7 @@ class FormDataParser(object):
                         the multipart boundary for instance)
         :return: A tuple in the form ``(stream, form, files)``.
         """
-        if self.max_content_length is not None and \
-           content_length is not None and \
-           content_length > self.max_content_length:
-            raise exceptions.RequestEntityTooLarge()
+        self._check_content_length(content_length)
         if options is None:
             options = {}
 
@@ -197,29 +476,92 @@ class FormDataParser(object):
 
         return stream, self.cls(), self.cls()
 
-    @exhaust_stream
-    def _parse_multipart(self, stream, mimetype, content_length, options):
-        parser = MultiPartParser(self.stream_factory, self.charset, self.errors,
-                                 max_form_memory_size=self.max_form_memory_size,
-                                 cls=self.cls)
+    def parse_streaming(self, stream, mimetype, content_length, options=None,
+                        on_field=None, on_file_start=None, on_file_chunk=None,
+                        on_file_end=None):
+        """Parses url encoded or multipart form data like :meth:`parse`
+        but instead of collecting the fields and files into dicts the
+        callbacks are invoked as the data is read.  `on_field` is called
+        with the name and value of each field, the file callbacks work
+        like the ones of :meth:`MultiPartParser.parse_streaming`.  Data of
+        other mimetypes is left in the stream.
+
+        .. versionadded:: 0.10
+
+        :param stream: an input stream
+        :param mimetype: the mimetype of the data
+        :param content_length: the content length of the incoming data
+        :param options: optional mimetype parameters (used for
+                        the multipart boundary for instance)
+        """
+        self._check_content_length(content_length)
+        if options is None:
+            options = {}
+        try:
+            if mimetype == 'multipart/form-data':
+                self._stream_multipart(stream, content_length, options,
+                                       on_field, on_file_start,
+                                       on_file_chunk, on_file_end)
+            elif mimetype in _urlencoded_mimetypes:
+                self._stream_urlencoded(stream, content_length, on_field)
+        except ValueError:
+            if not self.silent:
+                raise
+
+    def _check_content_length(self, content_length):
+        if self.max_content_length is not None and \
+           content_length is not None and \
+           content_length > self.max_content_length:
+            raise exceptions.RequestEntityTooLarge()
+
+    def _get_multipart_parser(self, options):
         boundary = options.get('boundary')
         if boundary is None:
             raise ValueError('Missing boundary')
         if isinstance(boundary, text_type):
             boundary = boundary.encode('ascii')
+        parser = MultiPartParser(self.stream_factory, self.charset, self.errors,
+                                 max_form_memory_size=self.max_form_memory_size,
+                                 cls=self.cls, executor=self.executor,
+                                 file_processor=self.file_processor)
+        return parser, boundary
+
+    @exhaust_stream
+    def _parse_multipart(self, stream, mimetype, content_length, options):
+        parser, boundary = self._get_multipart_parser(options)
         form, files = parser.parse(stream, boundary, content_length)
         return stream, form, files
 
     @exhaust_stream
-    def _parse_urlencoded(self, stream, mimetype, content_length, options):
+    def _stream_multipart(self, stream, content_length, options, *callbacks):
+        parser, boundary = self._get_multipart_parser(options)
+        parser.parse_streaming(stream, boundary, content_length, *callbacks)
+
+    def _iter_urlencoded(self, stream, content_length):
+        """Yields the decoded pairs of url encoded form data."""
         if self.max_form_memory_size is not None and \
            content_length is not None and \
            content_length > self.max_form_memory_size:
             raise exceptions.RequestEntityTooLarge()
-        form = url_decode_stream(stream, self.charset,
-                                 errors=self.errors, cls=self.cls)
+        fields = _iter_fields(_make_chunk_iter(stream, None, 64 * 1024),
+                              b'&', self.max_field_size)
+        pairs = _url_decode_impl(fields, self.charset, False, True,
+                                 self.errors)
+        if self.max_form_fields is None:
+            return pairs
+        return _limit_fields(pairs, self.max_form_fields)
+
+    @exhaust_stream
+    def _parse_urlencoded(self, stream, mimetype, content_length, options):
+        form = self.cls(self._iter_urlencoded(stream, content_length))
         return stream, form, self.cls()
 
+    @exhaust_stream
+    def _stream_urlencoded(self, stream, content_length, on_field):
+        for key, value in self._iter_urlencoded(stream, content_length):
+            if on_field is not None:
+                on_field(key, value)
+
     #: mapping of mimetypes to parsing functions
     parse_functions = {
         'multipart/form-data':                  _parse_multipart,
@@ -228,6 +570,51 @@ class FormDataParser(object):
     }
 
 
+_urlencoded_mimetypes = frozenset(['application/x-www-form-urlencoded',
+                                   'application/x-url-encoded'])
+
+
+def _iter_fields(chunks, separator, max_size=None):
+    """Splits the chunks of url encoded data at the separator without
+    joining more than one field at a time.  If a field is longer than
+    `max_size` bytes a :exc:`~exceptions.RequestEntityTooLarge` exception
+    is raised.
+    """
+    pending = []
+    pending_size = 0
+    for chunk in chunks:
+        start = 0
+        while 1:
+            end = chunk.find(separator, start)
+            if end == -1:
+                break
+            if max_size is not None and \
+               pending_size + end - start > max_size:
+                raise exceptions.RequestEntityTooLarge()
+            if pending:
+                pending.append(chunk[start:end])
+                yield b''.join(pending)
+                pending = []
+                pending_size = 0
+            else:
+                yield chunk[start:end]
+            start = end + 1
+        if start < len(chunk):
+            pending.append(chunk[start:])
+            pending_size += len(chunk) - start
+            if max_size is not None and pending_size > max_size:
+                raise exceptions.RequestEntityTooLarge()
+    if pending:
+        yield b''.join(pending)
+
+
+def _limit_fields(pairs, max_fields):
+    for idx, pair in enumerate(pairs):
+        if idx >= max_fields:
+            raise exceptions.RequestEntityTooLarge()
+        yield pair
+
+
 def is_valid_multipart_boundary(boundary):
     """Checks if the string given is a valid multipart boundary."""
     return _multipart_boundary_re.match(boundary) is not None
@@ -274,6 +661,138 @@ def parse_multipart_headers(iterable):
     return Headers(result)
 
 
+def _take(buf, n):
+    """Removes the first `n` bytes from the bytearray `buf` and returns them
+    as bytes, copied only once.
+    """
+    if memoryview is None:
+        rv = bytes(buf[:n])
+    else:
+        # the view has to be gone before the bytearray can be resized.
+        view = memoryview(buf)
+        rv = view[:n].tobytes()
+        del view
+    del buf[:n]
+    return rv
+
+
+class _MultiPartReader(object):
+    """Reads multipart data from an iterator of blocks.  The header lines
+    are split off with :meth:`readline`, the data of a part is found by
+    searching the buffered blocks for the boundary.
+
+    The blocks are appended to one :class:`bytearray` that is consumed
+    from the front, so they may be views of a buffer that is reused by
+    the iterator.  The data is copied twice: into that buffer and into
+    the bytes passed on.
+    """
+
+    def __init__(self, chunks):
+        self._chunks = chunks
+        self.eof = False
+        self.buffer = bytearray()
+        #: the boundary line that ended the last part without whitespace
+        #: and newline or `None` if the data ended before.
+        self.terminator = None
+        #: the newline in front of that boundary line.
+        self.newline = b''
+
+    def _fill(self):
+        if not self.eof:
+            chunk = next(self._chunks, b'')
+            if chunk:
+                self.buffer += chunk
+                return True
+            self.eof = True
+        return False
+
+    def readline(self):
+        """Returns the next line including the line ending or an empty
+        string at the end of the data.
+        """
+        buf = self.buffer
+        while 1:
+            match = _line_end_re.search(buf)
+            if match is not None:
+                end = match.end()
+                # a carriage return at the end of the buffer might be
+                # followed by a newline in the next block.
+                if end < len(buf) or buf[-1:] == b'\n' or not self._fill():
+                    return _take(buf, end)
+            elif not self._fill():
+                return _take(buf, len(buf))
+
+    def iter_part(self, boundary):
+        """Yields the data up to the next line that consists of the
+        boundary, optionally followed by ``--`` and whitespace, and skips
+        that line.  The newline in front of the boundary line is not part
+        of the data.
+        """
+        self.terminator = None
+        self.newline = b''
+        at_start = True
+        start = 0
+        buf = self.buffer
+        while 1:
+            pos = buf.find(boundary, start)
+
+            if pos == -1:
+                # keep enough for a boundary that is cut in half and the
+                # newline in front of it.
+                cut = len(buf) - len(boundary) - 1
+                if cut > 0:
+                    yield _take(buf, cut)
+                    at_start = False
+                start = max(0, len(buf) - len(boundary) + 1)
+                if not self._fill():
+                    # the data ended without a boundary, pass on the rest
+                    # so that the caller can fail on it.
+                    if buf:
+                        yield _take(buf, len(buf))
+                    return
+                continue
+
+            if pos == 0 and not at_start or \
+               pos > 0 and buf[pos - 1] not in (10, 13):
+                start = pos + 1
+                continue
+
+            end = pos + len(boundary)
+            if not self.eof and len(buf) - end < 2 and \
+               b'--'.startswith(bytes(buf[end:])):
+                self._fill()
+                continue
+            match = _boundary_end_re.match(buf, end)
+            if match is None:
+                start = pos + 1
+                continue
+            if match.end() == len(buf) and not self.eof:
+                self._fill()
+                continue
+
+            if buf[pos - 2:pos] == b'\r\n':
+                data_end = pos - 2
+            else:
+                data_end = max(pos - 1, 0)
+            terminator = boundary + bytes(match.group(1) or b'')
+            end = match.end()
+            if data_end > 0:
+                yield _take(buf, data_end)
+                pos -= data_end
+                end -= data_end
+            self.newline = bytes(buf[:pos])
+            self.terminator = terminator
+            del buf[:end]
+            return
+
+
+def _process_file(file_processor, storage):
+    try:
+        return file_processor(storage)
+    finally:
+        storage.stream.seek(0)
+
+
 _begin_form = 'begin_form'
 _begin_file = 'begin_file'
 _cont = 'cont'
@@ -283,11 +802,14 @@ _end = 'end'
 class MultiPartParser(object):
 
     def __init__(self, stream_factory=None, charset='utf-8', errors='replace',
-                 max_form_memory_size=None, cls=None, buffer_size=64 * 1024):
+                 max_form_memory_size=None, cls=None, buffer_size=64 * 1024,
+                 executor=None, file_processor=None):
         self.stream_factory = stream_factory
         self.charset = charset
         self.errors = errors
         self.max_form_memory_size = max_form_memory_size
+        self.executor = executor
+        self.file_processor = file_processor
         if stream_factory is None:
             stream_factory = default_stream_factory
         if cls is None:
@@ -342,10 +864,13 @@ class MultiPartParser(object):
             return ct_params.get('charset', self.charset)
         return self.charset
 
-    def start_file_streaming(self, filename, headers, total_content_length):
+    def _decode_filename(self, filename):
         if isinstance(filename, bytes):
             filename = filename.decode(self.charset, self.errors)
-        filename = self._fix_ie_filename(filename)
+        return self._fix_ie_filename(filename)
+
+    def start_file_streaming(self, filename, headers, total_content_length):
+        filename = self._decode_filename(filename)
         content_type = headers.get('content-type')
         try:
             content_length = int(headers['content-length'])
@@ -380,15 +905,19 @@ class MultiPartParser(object):
         Always obeys the grammar
         parts = ( begin_form cont* end |
                   begin_file cont* end )*
+
+        The data of a part is not split into lines.  It is read in blocks
+        of `buffer_size` bytes that are searched for the boundary.
         """
         next_part = b'--' + boundary
         last_part = next_part + b'--'
 
-        iterator = chain(make_line_iter(file, limit=content_length,
-                                        buffer_size=self.buffer_size),
-                         _empty_string_iter)
+        reader = _MultiPartReader(_make_chunk_iter(file, content_length,
+                                                   self.buffer_size,
+                                                   reuse_buffer=True))
+        lines = iter(reader.readline, None)
 
-        terminator = self._find_terminator(iterator)
+        terminator = self._find_terminator(lines)
 
         if terminator == last_part:
             return
@@ -396,7 +925,7 @@ class MultiPartParser(object):
             self.fail('Expected boundary at start of multipart data')
 
         while terminator != last_part:
-            headers = parse_multipart_headers(iterator)
+            headers = parse_multipart_headers(lines)
 
             disposition = headers.get('content-disposition')
             if disposition is None:
@@ -416,57 +945,65 @@ class MultiPartParser(object):
             else:
                 yield _begin_file, (headers, name, filename)
 
-            buf = b''
-            for line in iterator:
-                if not line:
-                    self.fail('unexpected end of stream')
+            if transfer_encoding is None:
+                chunks = reader.iter_part(next_part)
+            else:
+                chunks = self._decode_part(reader, next_part,
+                                           transfer_encoding)
+            for chunk in chunks:
+                yield _cont, chunk
 
-                if line[:2] == b'--':
-                    terminator = line.rstrip()
-                    if terminator in (next_part, last_part):
-                        break
+            terminator = reader.terminator
+            if terminator is None:
+                self.fail('unexpected end of stream')
 
-                if transfer_encoding is not None:
-                    if transfer_encoding == 'base64':
-                        transfer_encoding = 'base64_codec'
-                    try:
-                        line = codecs.decode(line, transfer_encoding)
-                    except Exception:
-                        self.fail('could not decode transfer encoded chunk')
-
-                # we have something in the buffer from the last iteration.
-                # this is usually a newline delimiter.
-                if buf:
-                    yield _cont, buf
-                    buf = b''
-
-                # If the line ends with windows CRLF we write everything except
-                # the last two bytes.  In all other cases however we write
-                # everything except the last byte.  If it was a newline, that's
-                # fine, otherwise it does not matter because we will write it
-                # the next iteration.  this ensures we do not write the
-                # final newline into the stream.  That way we do not have to
-                # truncate the stream.  However we do have to make sure that
-                # if something else than a newline is in there we write it
-                # out.
-                if line[-2:] == b'\r\n':
-                    buf = b'\r\n'
-                    cutoff = -2
-                else:
-                    buf = line[-1:]
-                    cutoff = -1
-                yield _cont, line[:cutoff]
+            yield _end, None
 
-            else: # pragma: no cover
-                raise ValueError('unexpected end of part')
+    def _decode_part(self, reader, boundary, transfer_encoding):
+        """Decodes the data of a transfer encoded part line by line."""
+        if transfer_encoding == 'base64':
+            transfer_encoding = 'base64_codec'
 
-            # if we have a leftover in the buffer that is not a newline
-            # character we have to flush it, otherwise we will chop of
-            # certain values.
-            if buf not in (b'', b'\r', b'\n', b'\r\n'):
-                yield _cont, buf
+        def _iter_raw_lines():
+            for chunk in reader.iter_part(boundary):
+                yield chunk
+            yield reader.newline
 
-            yield _end, None
+        buf = b''
+        for line in make_line_iter(_iter_raw_lines()):
+            try:
+                line = codecs.decode(line, transfer_encoding)
+            except Exception:
+                self.fail('could not decode transfer encoded chunk')
+
+            # we have something in the buffer from the last iteration.
+            # this is usually a newline delimiter.
+            if buf:
+                yield buf
+                buf = b''
+
+            # If the line ends with windows CRLF we write everything except
+            # the last two bytes.  In all other cases however we write
+            # everything except the last byte.  If it was a newline, that's
+            # fine, otherwise it does not matter because we will write it
+            # the next iteration.  this ensures we do not write the
+            # final newline into the stream.  That way we do not have to
+            # truncate the stream.  However we do have to make sure that
+            # if something else than a newline is in there we write it
+            # out.
+            if line[-2:] == b'\r\n':
+                buf = b'\r\n'
+                cutoff = -2
+            else:
+                buf = line[-1:]
+                cutoff = -1
+            yield line[:cutoff]
+
+        # if we have a leftover in the buffer that is not a newline
+        # character we have to flush it, otherwise we will chop of
+        # certain values.
+        if buf not in (b'', b'\r', b'\n', b'\r\n'):
+            yield buf
 
     def parse_parts(self, file, boundary, content_length):
         """Generate ``('file', (name, val))`` and
@@ -503,9 +1040,13 @@ class MultiPartParser(object):
             elif ellt == _end:
                 if is_file:
                     container.seek(0)
-                    yield ('file',
-                           (name, FileStorage(container, filename, name,
-                                              headers=headers)))
+                    storage = FileStorage(container, filename, name,
+                                          headers=headers)
+                    if self.executor is not None and \
+                       self.file_processor is not None:
+                        storage.future = self.executor.submit(
+                            _process_file, self.file_processor, storage)
+                    yield 'file', (name, storage)
                 else:
                     part_charset = self.get_part_charset(headers)
                     yield ('form',
@@ -513,11 +1054,68 @@ class MultiPartParser(object):
                                 part_charset, self.errors)))
 
     def parse(self, file, boundary, content_length):
-        formstream, filestream = tee(
-            self.parse_parts(file, boundary, content_length), 2)
-        form = (p[1] for p in formstream if p[0] == 'form')
-        files = (p[1] for p in filestream if p[0] == 'file')
+        form = []
+        files = []
+        for ellt, ell in self.parse_parts(file, boundary, content_length):
+            if ellt == 'form':
+                form.append(ell)
+            elif ellt == 'file':
+                files.append(ell)
         return self.cls(form), self.cls(files)
 
+    def parse_streaming(self, file, boundary, content_length, on_field=None,
+                        on_file_start=None, on_file_chunk=None,
+                        on_file_end=None):
+        """Parses the multipart data without collecting the parts.  Instead
+        the given callbacks are invoked as the data arrives:
+
+        `on_field(name, value)`
+            for a form field with the decoded value.
+        `on_file_start(name, filename, headers)`
+            when an uploaded file starts.
+        `on_file_chunk(name, chunk)`
+            for each block of bytes of that file.
+        `on_file_end(name)`
+            after the last block of the file.
+
+        Callbacks that are not given are skipped.  Form fields are still
+        limited by `max_form_memory_size`.
+
+        .. versionadded:: 0.10
+        """
+        in_memory = 0
+
+        for ellt, ell in self.parse_lines(file, boundary, content_length):
+            if ellt == _begin_file:
+                headers, name, filename = ell
+                is_file = True
+                if on_file_start is not None:
+                    on_file_start(name, self._decode_filename(filename),
+                                  headers)
+
+            elif ellt == _begin_form:
+                headers, name = ell
+                is_file = False
+                container = []
+
+            elif ellt == _cont:
+                if is_file:
+                    if on_file_chunk is not None:
+                        on_file_chunk(name, ell)
+                    continue
+                container.append(ell)
+                if self.max_form_memory_size is not None:
+                    in_memory += len(ell)
+                    if in_memory > self.max_form_memory_size:
+                        self.in_memory_threshold_reached(in_memory)
+
+            elif ellt == _end:
+                if is_file:
+                    if on_file_end is not None:
+                        on_file_end(name)
+                elif on_field is not None:
+                    part_charset = self.get_part_charset(headers)
+                    on_field(name, b''.join(container).decode(
+                        part_charset, self.errors))
 
 from werkzeug import exceptions
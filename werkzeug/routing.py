@@ -100,11 +100,12 @@ import uuid
 import posixpath
 
 from pprint import pformat
+from threading import Lock
 
 from werkzeug.urls import url_encode, url_quote, url_join
 from werkzeug.utils import redirect, format_string
 from werkzeug.exceptions import HTTPException, NotFound, MethodNotAllowed
-from werkzeug._internal import _get_environ, _encode_idna
+from werkzeug._internal import _get_environ, _encode_idna, _LRUDict
 from werkzeug._compat import itervalues, iteritems, to_unicode, to_bytes, \
      text_type, string_types, native_string_result, \
      implements_to_string, wsgi_decoding_dance
@@ -561,6 +562,7 @@ class Rule(RuleFactory):
         else:
             self.arguments = set()
         self._trace = self._converters = self._regex = self._weights = None
+        self._domain_builder = self._path_builder = None
 
     def empty(self):
         """Return an unbound copy of this rule.  This can be useful if you
@@ -651,6 +653,10 @@ class Rule(RuleFactory):
         if not self.is_leaf:
             self._trace.append((False, '/'))
 
+        sep = self._trace.index((False, '|'))
+        self._domain_builder = self._compile_builder(self._trace[:sep])
+        self._path_builder = self._compile_builder(self._trace[sep + 1:])
+
         if self.build_only:
             return
         regex = r'^%s%s$' % (
@@ -660,6 +666,27 @@ class Rule(RuleFactory):
         )
         self._regex = re.compile(regex, re.UNICODE)
 
+    def _compile_builder(self, trace):
+        """Compiles a part of the trace into a format string with the
+        static parts already quoted and the converters for the variables.
+        Without variables the string is returned unformatted.
+
+        :internal:
+        """
+        template = []
+        converters = []
+        for is_dynamic, data in trace:
+            if is_dynamic:
+                template.append(u'%s')
+                converters.append((data, self._converters[data]))
+            else:
+                template.append(url_quote(to_bytes(data, self.map.charset),
+                                          safe='/:|+').replace('%', '%%'))
+        template = u''.join(template)
+        if not converters:
+            return template % (), ()
+        return template, tuple(converters)
+
     def match(self, path):
         """Check if the rule matches a given path. Path is a string in the
         form ``"subdomain|/path(method)"`` and is assembled by the map.  If
@@ -708,23 +735,16 @@ class Rule(RuleFactory):
 
         :internal:
         """
-        tmp = []
-        add = tmp.append
-        processed = set(self.arguments)
-        for is_dynamic, data in self._trace:
-            if is_dynamic:
-                try:
-                    add(self._converters[data].to_url(values[data]))
-                except ValidationError:
-                    return
-                processed.add(data)
-            else:
-                add(url_quote(to_bytes(data, self.map.charset), safe='/:|+'))
-        domain_part, url = (u''.join(tmp)).split(u'|', 1)
+        try:
+            domain_part = _format_builder(self._domain_builder, values)
+            url = _format_builder(self._path_builder, values)
+        except ValidationError:
+            return
 
-        if append_unknown:
+        if append_unknown and \
+           any(key not in self.arguments for key in values):
             query_vars = MultiDict(values)
-            for key in processed:
+            for key in self.arguments:
                 if key in query_vars:
                     del query_vars[key]
 
@@ -747,6 +767,15 @@ class Rule(RuleFactory):
     def suitable_for(self, values, method=None):
         """Check if the dict of values has enough data for url generation.
 
+        :internal:
+        """
+        return self._suitable_for_keys(values, method) and \
+            self._suitable_for_defaults(values)
+
+    def _suitable_for_keys(self, keys, method):
+        """The part of :meth:`suitable_for` that only looks at the keys of
+        the values, which allows :class:`Map` to cache the result.
+
         :internal:
         """
         # if a method was given explicitly and that method is not supported
@@ -760,16 +789,22 @@ class Rule(RuleFactory):
         # all arguments required must be either in the defaults dict or
         # the value dictionary otherwise it's not suitable
         for key in self.arguments:
-            if key not in defaults and key not in values:
+            if key not in defaults and key not in keys:
                 return False
+        return True
 
-        # in case defaults are given we ensure taht either the value was
+    def _suitable_for_defaults(self, values):
+        """The part of :meth:`suitable_for` that compares the values with
+        the defaults.
+
+        :internal:
+        """
+        # in case defaults are given we ensure that either the value was
         # skipped or the value is the same as the default value.
-        if defaults:
-            for key, value in iteritems(defaults):
+        if self.defaults:
+            for key, value in iteritems(self.defaults):
                 if key in values and value != values[key]:
                     return False
-
         return True
 
     def match_compare_key(self):
@@ -825,6 +860,49 @@ class Rule(RuleFactory):
         )
 
 
+def _format_builder(builder, values):
+    template, converters = builder
+    if not converters:
+        return template
+    return template % tuple([converter.to_url(values[name])
+                             for name, converter in converters])
+
+
+def _copy_match_result(result):
+    """Copies the result of :meth:`MapAdapter._lookup_rule` so that the
+    values stored in the match cache are not shared with the caller.
+    """
+    rv, have_match_for = result
+    if rv is not None and isinstance(rv[1], dict):
+        rv = rv[0], dict(rv[1])
+    return rv, set(have_match_for)
+
+
+def _clean_build_values(values):
+    """Converts the values passed to :meth:`MapAdapter.build` into a dict
+    and drops the values that are `None`.
+    """
+    if not values:
+        return {}
+    if isinstance(values, MultiDict):
+        valueiter = values.iteritems(multi=True)
+    else:
+        valueiter = iteritems(values)
+    return dict((k, v) for k, v in valueiter if v is not None)
+
+
+def _join_script_name(script_name, path):
+    """Like ``url_join(script_name, './' + path)`` for the paths built by
+    rules, but without parsing the URL unless there are dot segments or
+    other parts that :func:`url_join` would normalize.
+    """
+    if u'/.' in u'/' + script_name + path or u'#' in path or \
+       path.endswith(u'?') or script_name.startswith(u'//') or \
+       u':' in script_name or u'?' in script_name or u'#' in script_name:
+        return url_join(script_name, u'./' + path)
+    return script_name + path
+
+
 class BaseConverter(object):
     """Base class for all converters."""
     regex = '[^/]+'
@@ -1000,6 +1078,288 @@ DEFAULT_CONVERTERS = {
 }
 
 
+class RuleMatcher(object):
+    """Finds the rules of a map that can match a URL.  The map creates a
+    matcher from its sorted rules every time :meth:`Map.update` notices
+    that the rules changed, and :meth:`MapAdapter.match` then tries the
+    rules the matcher returns one after another.  Rules without any
+    arguments are looked up in the static index of the map first and are
+    not passed to the matcher.
+
+    This implementation does not narrow anything down and returns all the
+    rules, which means that every rule's regular expression is tried until
+    one matches.  Subclasses can override :meth:`get_candidates` to skip
+    rules that cannot match a given URL.
+
+    .. versionadded:: 0.10
+
+    :param rules: the rules of the map in match order, without the rules
+                  of the static index.
+    """
+
+    def __init__(self, rules):
+        self.rules = rules
+
+    def get_candidates(self, domain_part, path):
+        """Return the rules that might match the given URL in match order.
+        `domain_part` is the subdomain or, with host matching enabled, the
+        host.  `path` is the path info and always starts with a slash.
+
+        Returning a rule that ends up not matching is fine, but leaving out
+        a rule that would have matched changes the result of the match.
+        """
+        return self.rules
+
+
+class _TreeNode(object):
+    __slots__ = ('children', 'entries', 'candidates')
+
+    def __init__(self):
+        self.children = {}
+        self.entries = []
+        self.candidates = ()
+
+
+class _DomainTree(object):
+    __slots__ = ('root', 'static')
+
+    def __init__(self):
+        self.root = _TreeNode()
+        self.static = {}
+
+
+def _static_path_key(path):
+    # a rule without converters matches its own path and, depending on
+    # the slash settings, the path with a slash appended.  Because the
+    # rule regexes end in ``$`` a trailing newline is accepted as well.
+    return path.rstrip(u'/\n')
+
+
+def _split_rule_trace(rule):
+    """Returns the static domain part of a bound rule (or `None` if it has
+    converters), the static part of the path in front of the first
+    converter and whether the whole path is static.
+    """
+    trace = rule._trace
+    sep = trace.index((False, '|'))
+    domain_trace = trace[:sep]
+    path_trace = trace[sep + 1:]
+    # branch rules have the slash in the trace but not in the regex
+    if not rule.is_leaf:
+        path_trace = path_trace[:-1]
+
+    domain_part = None
+    if not any(is_dynamic for is_dynamic, data in domain_trace):
+        domain_part = u''.join(data for is_dynamic, data in domain_trace)
+
+    static = []
+    for is_dynamic, data in path_trace:
+        if is_dynamic:
+            break
+        static.append(data)
+    return domain_part, u''.join(static), len(static) == len(path_trace)
+
+
+class TreeMatcher(RuleMatcher):
+    """A matcher that compiles the rules into a prefix tree.  The first
+    level of the tree is keyed on the domain part, below that the tree
+    follows the static path segments in front of the first converter of
+    each rule.  Rules without any converters are looked up in a dict
+    instead.  Finding the candidates for a URL then costs about as much as
+    the URL is deep instead of as many rules as the map has.
+
+    Because the rules found are still tried in match order by
+    :meth:`MapAdapter.match` the results are the same as with the default
+    :class:`RuleMatcher`, including redirects for missing slashes and
+    :exc:`MethodNotAllowed` errors.  To enable it pass it to the map::
+
+        url_map = Map([...], matcher_class=TreeMatcher)
+
+    .. versionadded:: 0.10
+    """
+
+    def __init__(self, rules):
+        RuleMatcher.__init__(self, rules)
+        self._domains = {}
+        self._any_domain = _DomainTree()
+        self._priorities = {}
+
+        parsed = []
+        for idx, rule in enumerate(rules):
+            if rule.build_only:
+                continue
+            self._priorities[id(rule)] = idx
+            domain_part, prefix, is_static = _split_rule_trace(rule)
+            if domain_part is not None:
+                self._domains.setdefault(domain_part, _DomainTree())
+            parsed.append((idx, rule, domain_part, prefix, is_static))
+
+        for idx, rule, domain_part, prefix, is_static in parsed:
+            if domain_part is None:
+                trees = [self._any_domain] + list(itervalues(self._domains))
+            else:
+                trees = [self._domains[domain_part]]
+            for tree in trees:
+                if is_static:
+                    tree.static.setdefault(_static_path_key(prefix),
+                                           []).append(rule)
+                    continue
+                node = tree.root
+                cut = prefix.rfind('/')
+                if cut > 0:
+                    for segment in prefix[1:cut].split('/'):
+                        node = node.children.setdefault(segment, _TreeNode())
+                node.entries.append((idx, rule))
+
+        for tree in [self._any_domain] + list(itervalues(self._domains)):
+            self._finalize(tree.root)
+
+    def _finalize(self, root):
+        """Stores the rules of all parent nodes in the nodes so that a
+        lookup only has to look at the last node it reaches.
+        """
+        stack = [(root, [])]
+        while stack:
+            node, inherited = stack.pop()
+            node.entries = sorted(inherited + node.entries,
+                                  key=lambda x: x[0])
+            node.candidates = tuple(rule for idx, rule in node.entries)
+            for child in itervalues(node.children):
+                stack.append((child, node.entries))
+
+    def get_candidates(self, domain_part, path):
+        tree = self._domains.get(domain_part, self._any_domain)
+        node = tree.root
+        for segment in path[1:].split('/'):
+            child = node.children.get(segment)
+            if child is None:
+                break
+            node = child
+        static = tree.static.get(_static_path_key(path))
+        if static is None:
+            return node.candidates
+        elif not node.candidates:
+            return static
+        priorities = self._priorities
+        return sorted(static + list(node.candidates),
+                      key=lambda x: priorities[id(x)])
+
+
+_named_group_re = re.compile(r'\(\?P<[a-zA-Z_][a-zA-Z0-9_]*>')
+
+
+class CombinedRegexMatcher(RuleMatcher):
+    """A matcher that joins the regular expressions of the rules into one
+    large alternation in match order.  A single call to the regex engine
+    then finds the first rule that matches the URL, and only the
+    converters of that rule are run.  This is a good fit for maps with a
+    few hundred rules where a :class:`TreeMatcher` is more than needed::
+
+        url_map = Map([...], matcher_class=CombinedRegexMatcher)
+
+    Python 2 limits the number of groups in a regular expression, so the
+    rules are split into chunks of :attr:`max_groups` rules that are joined
+    separately.  If the rule found does not accept the request method the
+    following rules are still tried in order, which keeps the results the
+    same as with the default :class:`RuleMatcher`.
+
+    .. versionadded:: 0.10
+    """
+
+    #: the maximum number of rules joined into one regular expression.
+    max_groups = 99
+
+    def __init__(self, rules):
+        RuleMatcher.__init__(self, rules)
+        self._chunks = []
+        start = 0
+        alternatives = []
+        for idx, rule in enumerate(rules):
+            if rule.build_only:
+                continue
+            regex = rule._regex
+            if regex.groups > len(regex.groupindex):
+                # converters with unnamed groups might refer to them by
+                # number which breaks once the groups are renumbered.
+                self._add_chunk(alternatives, start, idx)
+                self._chunks.append((regex, None, idx, idx + 1))
+                alternatives = []
+                start = idx + 1
+                continue
+            if len(alternatives) == self.max_groups:
+                self._add_chunk(alternatives, start, idx)
+                alternatives = []
+                start = idx
+            alternatives.append(idx)
+        self._add_chunk(alternatives, start, len(rules))
+
+    def _add_chunk(self, alternatives, start, end):
+        if not alternatives:
+            return
+        # the names of the groups would clash between the rules and the
+        # values are taken from the regex of the matching rule anyways.
+        pattern = u'|'.join(u'(%s)' % _named_group_re.sub(
+            u'(?:', self.rules[idx]._regex.pattern) for idx in alternatives)
+        try:
+            regex = re.compile(pattern, re.UNICODE)
+        except (re.error, AssertionError):
+            # converters with inline flags or backreferences by name
+            # cannot be joined, use the regular expressions of the rules.
+            for pos, idx in enumerate(alternatives):
+                next_idx = end
+                if pos + 1 < len(alternatives):
+                    next_idx = alternatives[pos + 1]
+                self._chunks.append((self.rules[idx]._regex, None,
+                                     idx, next_idx))
+            return
+        rule_by_group = dict((group + 1, idx) for group, idx
+                             in enumerate(alternatives))
+        self._chunks.append((regex, rule_by_group, start, end))
+
+    def get_candidates(self, domain_part, path):
+        path = u'%s|%s' % (domain_part, path)
+        for regex, rule_by_group, start, end in self._chunks:
+            m = regex.search(path)
+            if m is None:
+                continue
+            if rule_by_group is not None:
+                start = rule_by_group[m.lastindex]
+            for rule in self.rules[start:end]:
+                yield rule
+
+
+class _MatchCache(object):
+    """A thread safe LRU cache for the results of the rule lookups done by
+    :meth:`MapAdapter.match`.
+
+    :internal:
+    """
+
+    def __init__(self, size):
+        self.size = size
+        self._lock = Lock()
+        self._entries = _LRUDict()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        with self._lock:
+            return self._entries.get(key)
+
+    def set(self, key, value):
+        with self._lock:
+            if key in self._entries:
+                return
+            if len(self._entries) >= self.size:
+                self._entries.popitem()
+            self._entries[key] = value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
 class Map(object):
     """The map class stores all the URL rules and some configuration
     parameters.  Some of the configuration values are only stored on the
@@ -1026,26 +1386,70 @@ class Map(object):
                           feature and disables the subdomain one.  If
                           enabled the `host` parameter to rules is used
                           instead of the `subdomain` one.
+    :param matcher_class: the :class:`RuleMatcher` subclass used to find
+                          the rules that can match a URL.  Defaults to
+                          :attr:`matcher_class`.
+    :param match_cache_size: if set, :meth:`MapAdapter.match` remembers
+                             which rule matched for this many of the most
+                             recently used URLs.  Only enable this if the
+                             converters always return the same values
+                             for the same URL and the values are not
+                             modified by the application.
 
     .. versionadded:: 0.5
         `sort_parameters` and `sort_key` was added.
 
     .. versionadded:: 0.7
         `encoding_errors` and `host_matching` was added.
+
+    .. versionadded:: 0.10
+        `matcher_class` and `match_cache_size` was added.
     """
 
     #: .. versionadded:: 0.6
     #:    a dict of default converters to be used.
     default_converters = ImmutableDict(DEFAULT_CONVERTERS)
 
+    #: .. versionadded:: 0.10
+    #:    the class that is used to find the rules that can match a URL.
+    #:    The default tries all rules in order, :class:`TreeMatcher` skips
+    #:    the rules that cannot match.
+    matcher_class = RuleMatcher
+
+    #: .. versionadded:: 0.10
+    #:    the number of endpoint, argument names and method combinations
+    #:    for which the rules that can build them are remembered.
+    build_cache_size = 1000
+
     def __init__(self, rules=None, default_subdomain='', charset='utf-8',
                  strict_slashes=True, redirect_defaults=True,
                  converters=None, sort_parameters=False, sort_key=None,
-                 encoding_errors='replace', host_matching=False):
+                 encoding_errors='replace', host_matching=False,
+                 matcher_class=None, match_cache_size=None):
         self._rules = []
         self._rules_by_endpoint = {}
+        self._static_index = {}
+        self._matcher = None
+        self._build_cache = {}
         self._remap = True
 
+        #: the number of URLs :meth:`MapAdapter.match` resolved from the
+        #: index of rules without arguments.
+        self.static_index_hits = 0
+        #: the number of URLs that had to be looked up with the matcher.
+        self.static_index_misses = 0
+
+        self._match_cache = None
+        if match_cache_size:
+            self._match_cache = _MatchCache(match_cache_size)
+        #: the number of URLs :meth:`MapAdapter.match` found in the match
+        #: cache if enabled with `match_cache_size`.
+        self.match_cache_hits = 0
+        #: the number of URLs that were not in the match cache.
+        self.match_cache_misses = 0
+        if matcher_class is not None:
+            self.matcher_class = matcher_class
+
         self.default_subdomain = default_subdomain
         self.charset = charset
         self.encoding_errors = encoding_errors
@@ -1232,8 +1636,46 @@ class Map(object):
             self._rules.sort(key=lambda x: x.match_compare_key())
             for rules in itervalues(self._rules_by_endpoint):
                 rules.sort(key=lambda x: x.build_compare_key())
+
+            # rules without arguments are sorted in front of all other
+            # rules, so if none of them matches the matcher continues with
+            # the rest of the rules as if all rules were tried in order.
+            self._static_index = {}
+            static_count = 0
+            for rule in self._rules:
+                if rule.arguments:
+                    break
+                static_count += 1
+                if rule.build_only:
+                    continue
+                domain_part, path, is_static = _split_rule_trace(rule)
+                key = domain_part, _static_path_key(path)
+                self._static_index.setdefault(key, []).append(rule)
+            self._matcher = self.matcher_class(self._rules[static_count:])
+            self._build_cache.clear()
+            if self._match_cache is not None:
+                self._match_cache.clear()
             self._remap = False
 
+    def _get_build_rules(self, endpoint, values, method):
+        """Returns the rules of an endpoint that can build a URL for the
+        keys of the values and the method.  The result only depends on
+        the keys and is cached.  The values still have to be checked
+        against the defaults of the rules.
+
+        :internal:
+        """
+        key = endpoint, frozenset(values), method
+        rv = self._build_cache.get(key)
+        if rv is None:
+            rv = [rule for rule in self._rules_by_endpoint.get(endpoint, ())
+                  if rule._suitable_for_keys(values, method)]
+            # the keys might come from the request, don't grow forever
+            if len(self._build_cache) >= self.build_cache_size:
+                self._build_cache.clear()
+            self._build_cache[key] = rv
+        return rv
+
     def __repr__(self):
         rules = self.iter_rules()
         return '%s(%s)' % (self.__class__.__name__, pformat(list(rules)))
@@ -1400,56 +1842,111 @@ class MapAdapter(object):
             query_args = self.query_args
         method = (method or self.default_method).upper()
 
-        path = u'%s|/%s' % (self.map.host_matching and self.server_name or
-                            self.subdomain, path_info.lstrip('/'))
+        domain_part = self.map.host_matching and self.server_name or \
+            self.subdomain
+        path_part = u'/' + path_info.lstrip('/')
+        path = u'%s|%s' % (domain_part, path_part)
+
+        cache = self.map._match_cache
+        if cache is None:
+            rv, have_match_for = self._lookup_rule(domain_part, path_part,
+                                                   path, method)
+        else:
+            cache_key = domain_part, path_part, method
+            cached = cache.get(cache_key)
+            if cached is not None:
+                self.map.match_cache_hits += 1
+                rv, have_match_for = _copy_match_result(cached)
+            else:
+                self.map.match_cache_misses += 1
+                rv, have_match_for = self._lookup_rule(domain_part, path_part,
+                                                       path, method)
+                cache.set(cache_key, _copy_match_result((rv, have_match_for)))
+
+        if rv is None:
+            if have_match_for:
+                raise MethodNotAllowed(valid_methods=list(have_match_for))
+            raise NotFound()
+
+        rule, rv = rv
+        if isinstance(rv, RequestSlash):
+            raise RequestRedirect(self.make_redirect_url(
+                url_quote(path_info, self.map.charset,
+                          safe='/:|+') + '/', query_args))
+        elif isinstance(rv, RequestAliasRedirect):
+            raise RequestRedirect(self.make_alias_redirect_url(
+                path, rule.endpoint, rv.matched_values, method, query_args))
+
+        if self.map.redirect_defaults:
+            redirect_url = self.get_default_redirect(rule, method, rv,
+                                                     query_args)
+            if redirect_url is not None:
+                raise RequestRedirect(redirect_url)
+
+        if rule.redirect_to is not None:
+            if isinstance(rule.redirect_to, string_types):
+                def _handle_match(match):
+                    value = rv[match.group(1)]
+                    return rule._converters[match.group(1)].to_url(value)
+                redirect_url = _simple_rule_re.sub(_handle_match,
+                                                   rule.redirect_to)
+            else:
+                redirect_url = rule.redirect_to(self, **rv)
+            raise RequestRedirect(str(url_join('%s://%s%s%s' % (
+                self.url_scheme,
+                self.subdomain and self.subdomain + '.' or '',
+                self.server_name,
+                self.script_name
+            ), redirect_url)))
+
+        if return_rule:
+            return rule, rv
+        else:
+            return rule.endpoint, rv
 
+    def _lookup_rule(self, domain_part, path_part, path, method):
+        """Looks up the rule for a URL in the static index and with the
+        matcher of the map.  Returns the result of :meth:`_match_rules`
+        and the methods of the rules that only matched the path.
+
+        :internal:
+        """
         have_match_for = set()
-        for rule in self.map._rules:
+        rv = None
+        static_rules = self.map._static_index.get(
+            (domain_part, _static_path_key(path_part)))
+        if static_rules is not None:
+            rv = self._match_rules(static_rules, path, method,
+                                   have_match_for)
+        if rv is None:
+            self.map.static_index_misses += 1
+            rv = self._match_rules(self.map._matcher.get_candidates(
+                domain_part, path_part), path, method, have_match_for)
+        else:
+            self.map.static_index_hits += 1
+        return rv, have_match_for
+
+    def _match_rules(self, rules, path, method, have_match_for):
+        """Tries the rules in order and returns ``(rule, values)`` for the
+        first rule that matches the path and accepts the method.  If the
+        rule wants a redirect instead the :exc:`RequestSlash` or
+        :exc:`RequestAliasRedirect` exception is returned in place of the
+        values.  If no rule matched `None` is returned and the methods of
+        the rules that only matched the path are added to `have_match_for`.
+
+        :internal:
+        """
+        for rule in rules:
             try:
                 rv = rule.match(path)
-            except RequestSlash:
-                raise RequestRedirect(self.make_redirect_url(
-                    url_quote(path_info, self.map.charset,
-                              safe='/:|+') + '/', query_args))
-            except RequestAliasRedirect as e:
-                raise RequestRedirect(self.make_alias_redirect_url(
-                    path, rule.endpoint, e.matched_values, method, query_args))
+            except (RequestSlash, RequestAliasRedirect) as e:
+                return rule, e
             if rv is None:
                 continue
             if rule.methods is not None and method not in rule.methods:
                 have_match_for.update(rule.methods)
                 continue
-
-            if self.map.redirect_defaults:
-                redirect_url = self.get_default_redirect(rule, method, rv,
-                                                         query_args)
-                if redirect_url is not None:
-                    raise RequestRedirect(redirect_url)
-
-            if rule.redirect_to is not None:
-                if isinstance(rule.redirect_to, string_types):
-                    def _handle_match(match):
-                        value = rv[match.group(1)]
-                        return rule._converters[match.group(1)].to_url(value)
-                    redirect_url = _simple_rule_re.sub(_handle_match,
-                                                       rule.redirect_to)
-                else:
-                    redirect_url = rule.redirect_to(self, **rv)
-                raise RequestRedirect(str(url_join('%s://%s%s%s' % (
-                    self.url_scheme,
-                    self.subdomain and self.subdomain + '.' or '',
-                    self.server_name,
-                    self.script_name
-                ), redirect_url)))
-
-            if return_rule:
-                return rule, rv
-            else:
-                return rule.endpoint, rv
-
-        if have_match_for:
-            raise MethodNotAllowed(valid_methods=list(have_match_for))
-        raise NotFound()
+            return rule, rv
 
     def test(self, path_info=None, method=None):
         """Test if a rule would match.  Works like `match` but returns `True`
@@ -1563,8 +2060,8 @@ class MapAdapter(object):
 
         # default method did not match or a specific method is passed,
         # check all and go with first result.
-        for rule in self.map._rules_by_endpoint.get(endpoint, ()):
-            if rule.suitable_for(values, method):
+        for rule in self.map._get_build_rules(endpoint, values, method):
+            if rule._suitable_for_defaults(values):
                 rv = rule.build(values, append_unknown)
                 if rv is not None:
                     return rv
@@ -1624,30 +2121,81 @@ class MapAdapter(object):
                                if you want the builder to ignore those.
         """
         self.map.update()
-        if values:
-            if isinstance(values, MultiDict):
-                valueiter = values.iteritems(multi=True)
-            else:
-                valueiter = iteritems(values)
-            values = dict((k, v) for k, v in valueiter if v is not None)
-        else:
-            values = {}
-
+        values = _clean_build_values(values)
         rv = self._partial_build(endpoint, values, method, append_unknown)
         if rv is None:
             raise BuildError(endpoint, values, method)
         domain_part, path = rv
+        return self._join_url_prefix(
+            self._get_url_prefix(domain_part, force_external), path)
+
+    def build_many(self, endpoint, values_iter, method=None,
+                   force_external=False, append_unknown=True):
+        """Works like :meth:`build` but builds the URLs of one endpoint for
+        every dict of values in `values_iter` and returns an iterator over
+        the URLs.  This is useful for sitemaps or feeds that generate a lot
+        of URLs at once because the map is only updated once and the host
+        part of the URLs is only calculated once per domain.
+
+        >>> m = Map([Rule('/downloads/<int:id>', endpoint='downloads/show')])
+        >>> urls = m.bind("example.com", "/")
+        >>> list(urls.build_many("downloads/show", [{'id': 1}, {'id': 2}]))
+        ['/downloads/1', '/downloads/2']
 
+        The values are consumed lazily, so a :exc:`BuildError` is only
+        raised once the iterator reaches values that cannot be built.
+
+        .. versionadded:: 0.10
+
+        :param endpoint: the endpoint of the URLs to build.
+        :param values_iter: an iterable of dicts with the values for the
+                            URLs.  See :meth:`build` for details.
+        :param method: the HTTP method for the rule if there are different
+                       URLs for different methods on the same endpoint.
+        :param force_external: enforce full canonical external URLs.
+        :param append_unknown: unknown parameters are appended to the
+                               generated URLs as query string arguments.
+        """
+        self.map.update()
+        prefixes = {}
+        for values in values_iter:
+            values = _clean_build_values(values)
+            rv = self._partial_build(endpoint, values, method, append_unknown)
+            if rv is None:
+                raise BuildError(endpoint, values, method)
+            domain_part, path = rv
+            try:
+                prefix = prefixes[domain_part]
+            except KeyError:
+                prefix = prefixes[domain_part] = \
+                    self._get_url_prefix(domain_part, force_external)
+            yield self._join_url_prefix(prefix, path)
+
+    def _get_url_prefix(self, domain_part, force_external):
+        """Returns the prefix of the URLs built for a domain part or `None`
+        if the URLs are relative to the script name.
+
+        :internal:
+        """
         host = self.get_host(domain_part)
 
         # shortcut this.
         if not force_external and (
             (self.map.host_matching and host == self.server_name) or
              (not self.map.host_matching and domain_part == self.subdomain)):
-            return str(url_join(self.script_name, './' + path.lstrip('/')))
-        return str('%s://%s%s/%s' % (
+            return None
+        return u'%s://%s%s/' % (
             self.url_scheme,
             host,
-            self.script_name[:-1],
-            path.lstrip('/')
-        ))
+            self.script_name[:-1]
+        )
+
+    def _join_url_prefix(self, prefix, path):
+        """Joins a path built by a rule with the prefix returned by
+        :meth:`_get_url_prefix`.
+
+        :internal:
+        """
+        if prefix is None:
+            return str(_join_script_name(self.script_name, path.lstrip('/')))
+        return str(prefix + path.lstrip('/'))
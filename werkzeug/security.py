@@ -13,13 +13,18 @@ import hmac
 import hashlib
 import posixpath
 import codecs
+from binascii import hexlify, unhexlify
 from struct import Struct
 from random import SystemRandom
-from operator import xor
-from itertools import starmap
+from threading import Lock, Semaphore
 
 from werkzeug._compat import range_type, PY2, text_type, izip, to_bytes, \
-     string_types, to_native
+     string_types, to_native, iteritems
+
+try:
+    from concurrent.futures import ProcessPoolExecutor
+except ImportError:
+    ProcessPoolExecutor = None
 
 
 SALT_CHARS = 'abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789'
@@ -28,6 +33,7 @@ DEFAULT_PBKDF2_ITERATIONS = 1000
 
 _pack_int = Struct('>I').pack
 _builtin_safe_str_cmp = getattr(hmac, 'compare_digest', None)
+_builtin_pbkdf2_hmac = getattr(hashlib, 'pbkdf2_hmac', None)
 _sys_rng = SystemRandom()
 _os_alt_seps = list(sep for sep in [os.path.sep, os.path.altsep]
                     if sep not in (None, '/'))
@@ -44,6 +50,19 @@ def _find_hashlib_algorithms():
             rv[algo] = func
     return rv
 _hash_funcs = _find_hashlib_algorithms()
+_hash_names = dict((func, name) for name, func in iteritems(_hash_funcs))
+
+
+if PY2:
+    def _bytes_to_int(x):
+        return int(hexlify(x), 16)
+else:
+    def _bytes_to_int(x):
+        return int.from_bytes(x, 'big')
+
+
+def _int_to_bytes(x, length):
+    return unhexlify('%0*x' % (length * 2, x))
 
 
 def pbkdf2_hex(data, salt, iterations=DEFAULT_PBKDF2_ITERATIONS,
@@ -72,6 +91,9 @@ def pbkdf2_bin(data, salt, iterations=DEFAULT_PBKDF2_ITERATIONS,
     key of `keylen` bytes. By default, SHA-1 is used as hash function;
     a different hashlib `hashfunc` can be provided.
 
+    If the Python version provides :func:`hashlib.pbkdf2_hmac` it is used
+    for the hash functions hashlib knows by name.
+
     .. versionadded:: 0.9
 
     :param data: the data to derive.
@@ -84,25 +106,55 @@ def pbkdf2_bin(data, salt, iterations=DEFAULT_PBKDF2_ITERATIONS,
                      from the hashlib module.  Defaults to sha1.
     """
     if isinstance(hashfunc, string_types):
+        hash_name = hashfunc
         hashfunc = _hash_funcs[hashfunc]
     elif not hashfunc:
+        hash_name = 'sha1'
         hashfunc = hashlib.sha1
+    else:
+        hash_name = _hash_names.get(hashfunc)
+    data = to_bytes(data)
     salt = to_bytes(salt)
-    mac = hmac.HMAC(to_bytes(data), None, hashfunc)
+
+    # hashlib ships a C implementation since Python 2.7.8 and 3.4 which
+    # can only be used for the algorithms it knows by name.
+    if _builtin_pbkdf2_hmac is not None and hash_name is not None \
+       and iterations > 0:
+        return _builtin_pbkdf2_hmac(hash_name, data, salt, iterations,
+                                    keylen or None)
+    return _pbkdf2_bin_python(data, salt, iterations, keylen, hashfunc)
+
+
+def _pbkdf2_bin_python(data, salt, iterations, keylen, hashfunc):
+    """The pure Python implementation of :func:`pbkdf2_bin`.  The HMAC is
+    computed from copies of the prepared inner and outer hash objects and
+    the digests are XORed as integers instead of byte by byte.
+    """
+    inner = hashfunc()
+    outer = hashfunc()
+    digest_size = inner.digest_size
+    block_size = getattr(inner, 'block_size', 64)
+    if len(data) > block_size:
+        data = hashfunc(data).digest()
+    key = bytearray(data.ljust(block_size, b'\0'))
+    inner.update(bytes(bytearray(x ^ 0x36 for x in key)))
+    outer.update(bytes(bytearray(x ^ 0x5c for x in key)))
     if not keylen:
-        keylen = mac.digest_size
-    def _pseudorandom(x, mac=mac):
-        h = mac.copy()
-        h.update(x)
-        return bytearray(h.digest())
-    buf = bytearray()
-    for block in range_type(1, -(-keylen // mac.digest_size) + 1):
-        rv = u = _pseudorandom(salt + _pack_int(block))
-        for i in range_type(iterations - 1):
-            u = _pseudorandom(bytes(u))
-            rv = bytearray(starmap(xor, izip(rv, u)))
-        buf.extend(rv)
-    return bytes(buf[:keylen])
+        keylen = digest_size
+    buf = []
+    for block in range_type(1, -(-keylen // digest_size) + 1):
+        u = salt + _pack_int(block)
+        rv = 0
+        for i in range_type(max(iterations, 1)):
+            h = inner.copy()
+            h.update(u)
+            u = h.digest()
+            h = outer.copy()
+            h.update(u)
+            u = h.digest()
+            rv ^= _bytes_to_int(u)
+        buf.append(_int_to_bytes(rv, digest_size))
+    return b''.join(buf)[:keylen]
 
 
 def safe_str_cmp(a, b):
@@ -224,6 +276,92 @@ def check_password_hash(pwhash, password):
     return safe_str_cmp(_hash_internal(method, salt, password)[0], hashval)
 
 
+class PasswordHasher(object):
+    """Runs :func:`generate_password_hash` and :func:`check_password_hash`
+    in a pool of worker processes.  The PBKDF2 rounds then no longer hold
+    the GIL of the process that serves the requests, so a burst of logins
+    does not stall the other threads.  The methods return
+    :class:`concurrent.futures.Future` objects::
+
+        hasher = PasswordHasher(max_workers=2, max_queue=32)
+
+        def login(user, password):
+            return hasher.check_password_hash(user.pw_hash, password).result()
+
+    The `concurrent.futures` module is part of the standard library on
+    Python 3, on Python 2 the `futures` package has to be installed unless
+    an executor is provided.
+
+    .. versionadded:: 0.10
+
+    :param max_workers: the number of worker processes.  Defaults to the
+                        number of CPUs.
+    :param max_queue: the maximum number of operations that are waiting or
+                      running at the same time.  If the queue is full,
+                      further calls block until an operation finished.
+                      `None` means unlimited, otherwise it has to be at
+                      least 1.
+    :param executor: an executor to use instead of creating a process pool.
+    """
+
+    def __init__(self, max_workers=None, max_queue=None, executor=None):
+        if max_queue is not None and max_queue < 1:
+            raise ValueError('max_queue must be at least 1')
+        if executor is None:
+            if ProcessPoolExecutor is None:
+                raise RuntimeError('no concurrent.futures module found')
+            executor = ProcessPoolExecutor(max_workers)
+        self.executor = executor
+        self.max_queue = max_queue
+        self._slots = max_queue is not None and Semaphore(max_queue) or None
+        self._lock = Lock()
+        self._depth = 0
+
+    @property
+    def queue_depth(self):
+        """The number of operations that are waiting for a worker or are
+        currently running.
+        """
+        return self._depth
+
+    def submit(self, func, *args, **kwargs):
+        """Runs `func` with the given arguments in the pool and returns a
+        future for the result.  The function has to be picklable for a
+        process pool.
+        """
+        if self._slots is not None:
+            self._slots.acquire()
+        with self._lock:
+            self._depth += 1
+        try:
+            future = self.executor.submit(func, *args, **kwargs)
+        except Exception:
+            self._release()
+            raise
+        future.add_done_callback(self._release)
+        return future
+
+    def _release(self, future=None):
+        with self._lock:
+            self._depth -= 1
+        if self._slots is not None:
+            self._slots.release()
+
+    def generate_password_hash(self, password, method='pbkdf2:sha1',
+                               salt_length=8):
+        """Like :func:`generate_password_hash` but returns a future."""
+        return self.submit(generate_password_hash, password, method,
+                           salt_length)
+
+    def check_password_hash(self, pwhash, password):
+        """Like :func:`check_password_hash` but returns a future."""
+        return self.submit(check_password_hash, pwhash, password)
+
+    def shutdown(self, wait=True):
+        """Shuts down the executor."""
+        self.executor.shutdown(wait)
+
+
 def safe_join(directory, filename):
     """Safely join `directory` and `filename`.  If this cannot be done,
     this function returns ``None``.
@@ -37,18 +37,33 @@
 """
 from __future__ import with_statement
 
+import io
 import os
+import errno
+import re
 import socket
 import sys
 import time
 import signal
 import subprocess
+import threading
+import traceback
 
 try:
     import thread
 except ImportError:
     import _thread as thread
 
+try:
+    from Queue import Queue, Full, Empty
+except ImportError:
+    from queue import Queue, Full, Empty
+
+try:
+    import selectors
+except ImportError:
+    selectors = None
+
 try:
     from SocketServer import ThreadingMixIn, ForkingMixIn
     from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
@@ -61,24 +76,75 @@ from werkzeug._internal import _log
 from werkzeug._compat import iteritems, PY2, reraise, text_type, \
      wsgi_encoding_dance
 from werkzeug.urls import url_parse, url_unquote
-from werkzeug.exceptions import InternalServerError, BadRequest
+from werkzeug.wsgi import LimitedStream
+from werkzeug.datastructures import Headers
+from werkzeug.exceptions import InternalServerError, BadRequest, \
+     ClientDisconnected
+
+
+#: request lines and header lines longer than this are rejected.
+_max_line = 65536
+
+#: the maximum number of header lines in a request.
+_max_headers = 100
+
+#: matches request paths that are plain ASCII without a scheme, host or
+#: percent escapes.  Those are used for the environ as they are.
+_simple_path_re = re.compile(r'(/(?!/)[\x21-\x3e\x40-\x7e]*)'
+                             r'(?:\?([\x21-\x7e]*))?$')
+
+#: maps header names to environ keys so that the key is only computed
+#: once per name and not once per request.
+_environ_keys = {}
+_max_environ_keys = 1000
 
 
 class WSGIRequestHandler(BaseHTTPRequestHandler, object):
-    """A request handler that implements WSGI dispatching."""
+    """A request handler that implements WSGI dispatching.
+
+    If the server has `keep_alive` enabled the handler speaks HTTP/1.1 and
+    keeps the connection open for further requests.  Responses without a
+    `Content-Length` are then sent with chunked transfer encoding.
+    """
+
+    #: the response is buffered until the application writes data so that
+    #: the status line and headers go out together with the first block.
+    wbufsize = -1
+
+    #: request bodies the application did not read are read and thrown
+    #: away up to this size to keep the connection alive.  Bigger ones
+    #: close the connection instead.
+    max_drain_size = 64 * 1024
 
     @property
     def server_version(self):
         return 'Werkzeug/' + werkzeug.__version__
 
-    def make_environ(self):
-        request_url = url_parse(self.path)
+    @property
+    def protocol_version(self):
+        if getattr(self.server, 'keep_alive', False):
+            return 'HTTP/1.1'
+        return 'HTTP/1.0'
 
+    def make_environ(self):
         def shutdown_server():
             self.server.shutdown_signal = True
 
         url_scheme = self.server.ssl_context is None and 'http' or 'https'
-        path_info = url_unquote(request_url.path)
+
+        # most request paths need neither url_parse nor unquoting.
+        path = self.path
+        match = None
+        if '%' not in path and '#' not in path:
+            match = _simple_path_re.match(path)
+        if match is not None:
+            path_info, query_string = match.groups()
+            netloc = None
+        else:
+            request_url = url_parse(path)
+            path_info = wsgi_encoding_dance(url_unquote(request_url.path))
+            query_string = wsgi_encoding_dance(request_url.query)
+            netloc = request_url.netloc
 
         environ = {
             'wsgi.version':         (1, 0),
@@ -93,10 +159,8 @@ class WSGIRequestHandler(BaseHTTPRequestHandler, object):
             'SERVER_SOFTWARE':      self.server_version,
             'REQUEST_METHOD':       self.command,
             'SCRIPT_NAME':          '',
-            'PATH_INFO':            wsgi_encoding_dance(path_info),
-            'QUERY_STRING':         wsgi_encoding_dance(request_url.query),
-            'CONTENT_TYPE':         self.headers.get('Content-Type', ''),
-            'CONTENT_LENGTH':       self.headers.get('Content-Length', ''),
+            'PATH_INFO':            path_info,
+            'QUERY_STRING':         query_string or '',
             'REMOTE_ADDR':          self.client_address[0],
             'REMOTE_PORT':          self.client_address[1],
             'SERVER_NAME':          self.server.server_address[0],
@@ -104,28 +168,89 @@ class WSGIRequestHandler(BaseHTTPRequestHandler, object):
             'SERVER_PROTOCOL':      self.request_version
         }
 
-        for h in self.headers.headers:
-            key, value = h.split(':', 1)
-            key = 'HTTP_' + key.upper().replace('-', '_')
-            value = value.strip()
-            if key not in ('HTTP_CONTENT_TYPE', 'HTTP_CONTENT_LENGTH'):
-                if key in environ:
-                    environ[key] += ',' + value
+        environ_keys = _environ_keys
+        for key, value in self.headers.items():
+            try:
+                key = environ_keys[key]
+            except KeyError:
+                name = key
+                lower = key.lower()
+                if lower in ('content-type', 'content-length'):
+                    key = lower.upper().replace('-', '_')
                 else:
-                    environ[key] = value
+                    key = 'HTTP_' + key.upper().replace('-', '_')
+                    # headers like ``Content_Length`` must not end up in
+                    # the environ next to the real ones.
+                    if key in ('HTTP_CONTENT_TYPE', 'HTTP_CONTENT_LENGTH'):
+                        key = None
+                # header names come from the client, don't let them
+                # grow the cache without limit.
+                if len(environ_keys) < _max_environ_keys:
+                    environ_keys[name] = key
+            if key is None:
+                continue
+            value = value.strip()
+            if key not in environ:
+                environ[key] = value
+            elif key[:5] == 'HTTP_':
+                environ[key] += ',' + value
+        environ.setdefault('CONTENT_TYPE', '')
+        environ.setdefault('CONTENT_LENGTH', '')
 
-        if request_url.netloc:
-            environ['HTTP_HOST'] = request_url.netloc
+        if netloc:
+            environ['HTTP_HOST'] = netloc
 
         return environ
 
+    def make_request_body(self, environ):
+        """Limits the input stream of a persistent connection to the
+        request body so that the rest of it can be skipped after the
+        response.  Returns the limited stream or `None` if the body can't
+        be delimited, in which case the connection is closed after this
+        request.
+        """
+        if 'chunked' in environ.get('HTTP_TRANSFER_ENCODING', '').lower():
+            return None
+        try:
+            content_length = max(0, int(environ['CONTENT_LENGTH'] or 0))
+        except ValueError:
+            return None
+        stream = LimitedStream(self.rfile, content_length)
+        environ['wsgi.input'] = stream
+        return stream
+
+    def drain_request_body(self, stream):
+        """Skips what the application did not read from the request body.
+        If that is more than :attr:`max_drain_size` the connection is
+        closed instead.
+        """
+        if stream.limit - stream.tell() > self.max_drain_size:
+            self.close_connection = True
+            return
+        try:
+            stream.exhaust()
+        except ClientDisconnected:
+            self.close_connection = True
+
     def run_wsgi(self):
         if self.headers.get('Expect', '').lower().strip() == '100-continue':
             self.wfile.write(b'HTTP/1.1 100 Continue\r\n\r\n')
+            self.wfile.flush()
 
         environ = self.make_environ()
         headers_set = []
         headers_sent = []
+        chunked = []
+        request_body = None
+
+        self.requests_handled += 1
+        if self.requests_handled >= self.server.max_keep_alive_requests:
+            self.close_connection = True
+        if not self.close_connection:
+            request_body = self.make_request_body(environ)
+            if request_body is None:
+                self.close_connection = True
+        send_body = self.command != 'HEAD'
 
         def write(data):
             assert headers_set, 'write() before start_response'
@@ -135,15 +260,29 @@ class WSGIRequestHandler(BaseHTTPRequestHandler, object):
                     code, msg = status.split(None, 1)
                 except ValueError:
                     code, msg = status, ""
-                self.send_response(int(code), msg)
+                code = int(code)
+                self.send_response(code, msg)
                 header_keys = set()
                 for key, value in response_headers:
                     self.send_header(key, value)
                     key = key.lower()
                     header_keys.add(key)
-                if 'content-length' not in header_keys:
-                    self.close_connection = True
-                    self.send_header('Connection', 'close')
+                    if key == 'connection' and value.lower() == 'close':
+                        self.close_connection = True
+                if 'content-length' not in header_keys and send_body and \
+                   code >= 200 and code not in (204, 304):
+                    if self.close_connection or \
+                       self.request_version != 'HTTP/1.1' or \
+                       'transfer-encoding' in header_keys:
+                        self.close_connection = True
+                    else:
+                        self.send_header('Transfer-Encoding', 'chunked')
+                        chunked.append(True)
+                if 'connection' not in header_keys:
+                    if self.close_connection:
+                        self.send_header('Connection', 'close')
+                    elif self.request_version != 'HTTP/1.1':
+                        self.send_header('Connection', 'keep-alive')
                 if 'server' not in header_keys:
                     self.send_header('Server', self.version_string())
                 if 'date' not in header_keys:
@@ -151,7 +290,14 @@ class WSGIRequestHandler(BaseHTTPRequestHandler, object):
                 self.end_headers()
 
             assert type(data) is bytes, 'applications must write bytes'
-            self.wfile.write(data)
+            if not send_body:
+                pass
+            elif chunked:
+                if data:
+                    self.wfile.write(('%x\r\n' % len(data)).encode('ascii') +
+                                     data + b'\r\n')
+            else:
+                self.wfile.write(data)
             self.wfile.flush()
 
         def start_response(status, response_headers, exc_info=None):
@@ -173,6 +319,9 @@ class WSGIRequestHandler(BaseHTTPRequestHandler, object):
                     write(data)
                 if not headers_sent:
                     write(b'')
+                if chunked:
+                    self.wfile.write(b'0\r\n\r\n')
+                    self.wfile.flush()
             finally:
                 if hasattr(application_iter, 'close'):
                     application_iter.close()
@@ -180,9 +329,15 @@ class WSGIRequestHandler(BaseHTTPRequestHandler, object):
 
         try:
             execute(self.server.app)
+            if request_body is not None and not self.close_connection:
+                self.drain_request_body(request_body)
         except (socket.error, socket.timeout) as e:
+            self.close_connection = True
             self.connection_dropped(e, environ)
         except Exception:
+            # the response might be cut off, the connection can't be
+            # reused in any case.
+            self.close_connection = True
             if self.server.passthrough_errors:
                 raise
             from werkzeug.debug.tbtools import get_current_traceback
@@ -201,6 +356,9 @@ class WSGIRequestHandler(BaseHTTPRequestHandler, object):
     def handle(self):
         """Handles a request ignoring dropped connections."""
         rv = None
+        # the event loop server passes on how many requests were handled
+        # on the connection before.
+        self.requests_handled = getattr(self.request, 'requests_handled', 0)
         try:
             rv = BaseHTTPRequestHandler.handle(self)
         except (socket.error, socket.timeout) as e:
@@ -232,12 +390,108 @@ class WSGIRequestHandler(BaseHTTPRequestHandler, object):
         """
 
     def handle_one_request(self):
-        """Handle a single HTTP request."""
-        self.raw_requestline = self.rfile.readline()
+        """Handle a single HTTP request.  On a persistent connection the
+        server's `keep_alive_timeout` limits how long we wait for it.
+        """
+        if self.requests_handled:
+            self.connection.settimeout(self.server.keep_alive_timeout)
+            try:
+                self.raw_requestline = self.rfile.readline(_max_line + 1)
+            except socket.timeout:
+                self.raw_requestline = b''
+            self.connection.settimeout(self.timeout)
+        else:
+            self.raw_requestline = self.rfile.readline(_max_line + 1)
         if not self.raw_requestline:
             self.close_connection = 1
+        elif len(self.raw_requestline) > _max_line:
+            self.requestline = ''
+            self.request_version = ''
+            self.command = ''
+            self.send_error(414)
         elif self.parse_request():
-            return self.run_wsgi()
+            rv = self.run_wsgi()
+            self.wfile.flush()
+            return rv
+
+    def parse_request(self):
+        """Parses the request line and the headers.  Unlike the base class
+        this does not go through :mod:`mimetools` or :mod:`email`, the
+        headers are stored as :class:`~werkzeug.datastructures.Headers`.
+        Returns `False` if the request is invalid, an error was sent then.
+        """
+        self.command = None
+        self.request_version = version = self.default_request_version
+        self.close_connection = 1
+        requestline = self.raw_requestline
+        if not PY2:
+            requestline = requestline.decode('iso-8859-1')
+        self.requestline = requestline = requestline.rstrip('\r\n')
+        words = requestline.split()
+        if len(words) == 3:
+            command, path, version = words
+            try:
+                if version[:5] != 'HTTP/':
+                    raise ValueError()
+                major, minor = version[5:].split('.', 1)
+                version_number = int(major), int(minor)
+            except ValueError:
+                self.send_error(400, 'Bad request version (%r)' % version)
+                return False
+            if version_number >= (2, 0):
+                self.send_error(505, 'Invalid HTTP Version (%s)' %
+                                version[5:])
+                return False
+            if version_number >= (1, 1) and \
+               self.protocol_version >= 'HTTP/1.1':
+                self.close_connection = 0
+        elif len(words) == 2:
+            command, path = words
+            if command != 'GET':
+                self.send_error(400, 'Bad HTTP/0.9 request type (%r)' %
+                                command)
+                return False
+        elif not words:
+            return False
+        else:
+            self.send_error(400, 'Bad request syntax (%r)' % requestline)
+            return False
+        self.command, self.path, self.request_version = \
+            command, path, version
+
+        headers = []
+        if version != 'HTTP/0.9':
+            readline = self.rfile.readline
+            while 1:
+                line = readline(_max_line + 1)
+                if len(line) > _max_line:
+                    self.send_error(431, 'Line too long')
+                    return False
+                if line in (b'\r\n', b'\n', b''):
+                    break
+                if not PY2:
+                    line = line.decode('iso-8859-1')
+                if line[:1] in ' \t':
+                    # continuation of the previous header
+                    if headers:
+                        key, value = headers[-1]
+                        headers[-1] = (key, value + ' ' + line.strip())
+                    continue
+                if len(headers) >= _max_headers:
+                    self.send_error(431, 'Too many headers')
+                    return False
+                key, sep, value = line.partition(':')
+                if sep:
+                    headers.append((key.strip(), value.strip()))
+        self.headers = Headers(headers)
+
+        connection = self.headers.get('Connection', '').lower()
+        if connection == 'close':
+            self.close_connection = 1
+        elif connection == 'keep-alive' and \
+             self.protocol_version >= 'HTTP/1.1':
+            self.close_connection = 0
+        return True
 
     def send_response(self, code, message=None):
         """Send the response header and log the response code."""
@@ -407,8 +661,16 @@ class BaseWSGIServer(HTTPServer, object):
     multiprocess = False
     request_queue_size = 128
 
+    #: the number of seconds a persistent connection may be idle before
+    #: the server closes it.
+    keep_alive_timeout = 5
+
+    #: the number of requests after which a persistent connection is closed.
+    max_keep_alive_requests = 100
+
     def __init__(self, host, port, app, handler=None,
-                 passthrough_errors=False, ssl_context=None):
+                 passthrough_errors=False, ssl_context=None,
+                 keep_alive=False):
         if handler is None:
             handler = WSGIRequestHandler
         self.address_family = select_ip_version(host, port)
@@ -416,6 +678,7 @@ class BaseWSGIServer(HTTPServer, object):
         self.app = app
         self.passthrough_errors = passthrough_errors
         self.shutdown_signal = False
+        self.keep_alive = keep_alive
 
         if ssl_context is not None:
             try:
@@ -460,35 +723,807 @@ class ThreadedWSGIServer(ThreadingMixIn, BaseWSGIServer):
     multithread = True
 
 
+class PooledWSGIServer(BaseWSGIServer):
+    """A WSGI server that handles the connections in a fixed number of
+    worker threads.  Accepted connections wait in a queue of at most
+    `queue_size` connections for a free worker.  If the queue is full the
+    connection is answered with `overload_response` (by default
+    :attr:`default_overload_response`) and closed right away.
+
+    Keep in mind that with `keep_alive` a worker stays with a connection
+    until it is closed or idle for `keep_alive_timeout` seconds.
+
+    .. versionadded:: 0.10
+    """
+    multithread = True
+
+    #: sent to connections that don't fit into the queue unless another
+    #: response is passed to the constructor.
+    default_overload_response = (b'HTTP/1.0 503 Service Unavailable\r\n'
+                                 b'Content-Type: text/plain\r\n'
+                                 b'Content-Length: 19\r\n'
+                                 b'Retry-After: 1\r\n'
+                                 b'Connection: close\r\n\r\n'
+                                 b'Service Unavailable')
+
+    #: the number of seconds :meth:`server_close` waits for every worker
+    #: to finish the connection it is handling.
+    close_timeout = 5
+
+    def __init__(self, host, port, app, threads=10, handler=None,
+                 passthrough_errors=False, ssl_context=None,
+                 keep_alive=False, queue_size=64, overload_response=None):
+        BaseWSGIServer.__init__(self, host, port, app, handler,
+                                passthrough_errors, ssl_context, keep_alive)
+        if overload_response is None:
+            overload_response = self.default_overload_response
+        self.threads = threads
+        self.queue_size = queue_size
+        self.overload_response = overload_response
+        self._queue = Queue(queue_size)
+        self._workers = []
+        self._busy = 0
+        self._busy_lock = threading.Lock()
+
+    @property
+    def queue_depth(self):
+        """The number of connections that wait for a worker."""
+        return self._queue.qsize()
+
+    @property
+    def busy_workers(self):
+        """The number of workers that handle a connection right now."""
+        return self._busy
+
+    def _start_workers(self):
+        while len(self._workers) < self.threads:
+            t = threading.Thread(target=self._worker)
+            t.daemon = True
+            t.start()
+            self._workers.append(t)
+
+    def _worker(self):
+        while 1:
+            item = self._queue.get()
+            if item is None:
+                break
+            with self._busy_lock:
+                self._busy += 1
+            try:
+                self.process_request_thread(*item)
+            except Exception:
+                # with passthrough_errors the error is reraised, the
+                # worker has to keep running nonetheless.
+                self.log('error', 'Error in worker thread:\n%s',
+                         traceback.format_exc())
+            finally:
+                with self._busy_lock:
+                    self._busy -= 1
+
+    def process_request_thread(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+
+    def process_request(self, request, client_address):
+        if not self._workers:
+            self._start_workers()
+        try:
+            self._queue.put_nowait((request, client_address))
+        except Full:
+            self.shed_request(request, client_address)
+
+    def shed_request(self, request, client_address):
+        """Called for connections that don't fit into the queue.  By
+        default the overload response is sent and the connection is
+        closed.
+        """
+        try:
+            request.sendall(self.overload_response)
+        except socket.error:
+            pass
+        self.shutdown_request(request)
+
+    def server_close(self):
+        BaseWSGIServer.server_close(self)
+        # connections still waiting for a worker are closed so that the
+        # queue has room for one stop marker per worker.
+        while 1:
+            try:
+                item = self._queue.get_nowait()
+            except Empty:
+                break
+            if item is not None:
+                self.shutdown_request(item[0])
+        for t in self._workers:
+            try:
+                self._queue.put_nowait(None)
+            except Full:
+                break
+        for t in self._workers:
+            t.join(self.close_timeout)
+        self._workers = []
+
+
 class ForkingWSGIServer(ForkingMixIn, BaseWSGIServer):
     """A WSGI server that does forking."""
     multiprocess = True
 
     def __init__(self, host, port, app, processes=40, handler=None,
-                 passthrough_errors=False, ssl_context=None):
+                 passthrough_errors=False, ssl_context=None,
+                 keep_alive=False):
         BaseWSGIServer.__init__(self, host, port, app, handler,
-                                passthrough_errors, ssl_context)
+                                passthrough_errors, ssl_context, keep_alive)
         self.max_children = processes
 
 
+class PreforkWSGIServer(BaseWSGIServer):
+    """A WSGI server that forks `processes` long lived worker processes
+    which accept connections from the shared listening socket.  The
+    process that calls :meth:`serve_forever` supervises them and starts
+    a new one whenever a worker exits.
+
+    If `reuse_port` is enabled every worker binds its own socket with
+    ``SO_REUSEPORT`` so that the kernel spreads the connections evenly.
+    The socket of the supervisor then only reserves the address and
+    does not listen.  If `max_requests` is given a worker exits after it
+    handled that many connections and is replaced by a fresh one.
+    Workers exit on their own if the supervisor goes away.  After a
+    worker failed no new worker is started for :attr:`respawn_interval`
+    seconds so that a broken application does not keep the supervisor
+    busy forking.
+
+    .. versionadded:: 0.10
+    """
+    multiprocess = True
+
+    #: how often (in seconds) an idle worker checks that the supervisor
+    #: is still alive.
+    worker_check_interval = 1
+
+    #: how long (in seconds) the supervisor waits before it replaces a
+    #: worker that exited with an error.
+    respawn_interval = 1
+
+    #: how often (in seconds) the supervisor looks for exited workers.
+    supervisor_poll_interval = 0.1
+
+    def __init__(self, host, port, app, processes=4, handler=None,
+                 passthrough_errors=False, ssl_context=None,
+                 keep_alive=False, reuse_port=False, max_requests=None):
+        if not hasattr(os, 'fork'):
+            raise RuntimeError('The prefork server requires os.fork')
+        if reuse_port and not hasattr(socket, 'SO_REUSEPORT'):
+            raise ValueError('SO_REUSEPORT is not supported on this system')
+        self.reuse_port = reuse_port
+        BaseWSGIServer.__init__(self, host, port, app, handler,
+                                passthrough_errors, ssl_context, keep_alive)
+        self.processes = processes
+        self.max_requests = max_requests
+        self._handled = 0
+        self._workers = set()
+        self._next_spawn = 0
+        self._stopping = False
+        self._is_shut_down = threading.Event()
+        self._is_shut_down.set()
+
+    def server_bind(self):
+        if self.reuse_port:
+            self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        BaseWSGIServer.server_bind(self)
+
+    def server_activate(self):
+        # with reuse_port only the workers listen, connections must not
+        # end up in the queue of the supervisor's socket.
+        if not self.reuse_port:
+            BaseWSGIServer.server_activate(self)
+
+    def process_request(self, request, client_address):
+        self._handled += 1
+        BaseWSGIServer.process_request(self, request, client_address)
+
+    def _bind_worker_socket(self):
+        sock = socket.socket(self.address_family, self.socket_type)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        sock.bind(self.server_address)
+        sock.listen(self.request_queue_size)
+        if self.ssl_context is not None:
+            from OpenSSL import tsafe
+            sock = tsafe.Connection(self.ssl_context, sock)
+        self.socket.close()
+        self.socket = sock
+
+    def _spawn_worker(self):
+        pid = os.fork()
+        if pid:
+            self._workers.add(pid)
+            return
+        exit_code = 0
+        try:
+            self._run_worker()
+        except KeyboardInterrupt:
+            pass
+        except Exception:
+            traceback.print_exc()
+            exit_code = 1
+        finally:
+            os._exit(exit_code)
+
+    def _run_worker(self):
+        supervisor = os.getppid()
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        if self.reuse_port:
+            self._bind_worker_socket()
+        # wake up regularly, also if another worker took the connection
+        # we were woken up for, to see if the supervisor is still there.
+        self.timeout = self.worker_check_interval
+        self.socket.settimeout(self.worker_check_interval)
+        self._handled = 0
+        while self.max_requests is None or self._handled < self.max_requests:
+            if os.getppid() != supervisor:
+                break
+            self.handle_request()
+            if self.shutdown_signal:
+                # shut down the whole server, not only this worker
+                os.kill(supervisor, signal.SIGTERM)
+                break
+
+    def _wait_worker(self, pid, options=0):
+        """Waits for the worker `pid` and returns its exit status or
+        `None` if it is still running.
+        """
+        while 1:
+            try:
+                wpid, status = os.waitpid(pid, options)
+            except OSError as e:
+                if e.errno == errno.EINTR:
+                    continue
+                # not our child (anymore), count it as failed
+                return 1
+            if wpid == 0:
+                return None
+            return status
+
+    def _reap_workers(self):
+        reaped = False
+        for pid in list(self._workers):
+            status = self._wait_worker(pid, os.WNOHANG)
+            if status is None:
+                continue
+            self._workers.discard(pid)
+            reaped = True
+            if status != 0 and not self._stopping:
+                self._next_spawn = time.time() + self.respawn_interval
+        return reaped
+
+    def _kill_workers(self):
+        for pid in list(self._workers):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except OSError:
+                pass
+
+    def serve_forever(self):
+        self.shutdown_signal = False
+        self._stopping = False
+        self._is_shut_down.clear()
+        self._next_spawn = 0
+        old_handler = False
+        try:
+            old_handler = signal.signal(signal.SIGTERM,
+                                        lambda *args: sys.exit(0))
+        except ValueError:
+            # not in the main thread
+            pass
+        try:
+            while not self._stopping:
+                if time.time() >= self._next_spawn:
+                    while len(self._workers) < self.processes:
+                        self._spawn_worker()
+                if not self._reap_workers():
+                    time.sleep(self.supervisor_poll_interval)
+        except (KeyboardInterrupt, SystemExit):
+            pass
+        finally:
+            self._stopping = True
+            self._kill_workers()
+            for pid in list(self._workers):
+                self._wait_worker(pid)
+                self._workers.discard(pid)
+            if old_handler is not False:
+                # None means the handler was not installed from Python
+                signal.signal(signal.SIGTERM, old_handler or signal.SIG_DFL)
+            self._is_shut_down.set()
+
+    def shutdown(self):
+        """Stops the workers and waits for :meth:`serve_forever` to
+        return.
+        """
+        self._stopping = True
+        self._kill_workers()
+        self._is_shut_down.wait()
+
+
+_content_length_re = re.compile(br'^content-length:[ \t]*(\d+)[ \t]*\r?$',
+                                re.I | re.M)
+_needs_stream_re = re.compile(br'^(?:transfer-encoding|expect):', re.I | re.M)
+_header_end_re = re.compile(br'\r?\n\r?\n')
+
+
+class _BufferedRequestReader(io.BytesIO):
+    """The input of a request the event loop read completely.  Remembers
+    if the handler tried to read past it, which is what it does when it
+    waits for the next request on a persistent connection.
+    """
+    wants_next_request = False
+
+    def readline(self, size=-1):
+        line = io.BytesIO.readline(self, size)
+        if not line:
+            self.wants_next_request = True
+        return line
+
+
+class _BufferedResponseWriter(object):
+    """Hands the response data over to the event loop when it is
+    flushed.
+    """
+    closed = False
+
+    def __init__(self, conn):
+        self._conn = conn
+        self._buffer = []
+
+    def write(self, data):
+        self._buffer.append(data)
+
+    def flush(self):
+        if self._buffer:
+            data = b''.join(self._buffer)
+            del self._buffer[:]
+            self._conn.queue_output(data)
+
+    def close(self):
+        self.flush()
+
+
+class _BufferedConnection(object):
+    """Stands in for the socket when a request handler runs on a request
+    that the event loop buffered.
+    """
+
+    def __init__(self, conn, request):
+        self.rfile = _BufferedRequestReader(request)
+        self.wfile = _BufferedResponseWriter(conn)
+        self.requests_handled = conn.requests - 1
+
+    def makefile(self, mode='r', bufsize=-1):
+        if 'r' in mode:
+            return self.rfile
+        return self.wfile
+
+    def settimeout(self, timeout):
+        pass
+
+    def setsockopt(self, *args):
+        pass
+
+
+class _PrefixedSocketReader(io.RawIOBase):
+    """Reads the data the event loop already received and then goes on
+    reading from the socket.
+    """
+
+    def __init__(self, prefix, sock):
+        self._prefix = prefix
+        self._sock = sock
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        if self._prefix:
+            n = min(len(b), len(self._prefix))
+            b[:n] = self._prefix[:n]
+            del self._prefix[:n]
+            return n
+        return self._sock.recv_into(b)
+
+
+class _PrefixedConnection(object):
+    """Stands in for the socket when a request handler takes over a
+    connection from the event loop.
+    """
+
+    def __init__(self, sock, prefix):
+        self._sock = sock
+        self._prefix = prefix
+
+    def makefile(self, mode='r', bufsize=-1):
+        if 'r' in mode:
+            return io.BufferedReader(_PrefixedSocketReader(self._prefix,
+                                                           self._sock))
+        return self._sock.makefile(mode, bufsize)
+
+    def __getattr__(self, name):
+        return getattr(self._sock, name)
+
+
+class _EventLoopConnection(object):
+    reading, working, closed = range(3)
+
+    def __init__(self, server, sock, client_address):
+        self.server = server
+        self.sock = sock
+        self.client_address = client_address
+        self.state = self.reading
+        self.inbuf = bytearray()
+        self.outbuf = bytearray()
+        self.cond = threading.Condition()
+        self.done = False
+        self.keep_open = False
+        self.requests = 0
+        self.events = 0
+        self.last_active = time.time()
+
+    def queue_output(self, data):
+        """Called from a worker, waits while too much data is pending."""
+        if not data:
+            return
+        with self.cond:
+            while len(self.outbuf) >= self.server.max_write_buffer and \
+                  self.state != self.closed:
+                self.cond.wait()
+            if self.state == self.closed:
+                raise socket.error('connection closed')
+            self.outbuf += data
+        self.server._wakeup(self)
+
+    def finish(self, keep_open):
+        with self.cond:
+            self.done = True
+            self.keep_open = keep_open
+        self.server._wakeup(self)
+
+
+class EventLoopWSGIServer(BaseWSGIServer):
+    """A WSGI server that waits on all connections in one thread with
+    :mod:`selectors`.  Requests are read without blocking and only
+    complete ones are passed to one of `threads` worker threads that
+    call the application.  The response is buffered and sent by the event
+    loop, a worker only waits if more than :attr:`max_write_buffer` bytes
+    are pending for a slow client.
+
+    Idle persistent connections (see `keep_alive`) cost no thread.  A
+    request with a body bigger than :attr:`max_request_buffer`, with
+    chunked transfer encoding or one that expects a ``100 Continue``
+    takes the connection out of the event loop and is handled by the
+    worker like in :class:`PooledWSGIServer`.
+
+    This server requires the :mod:`selectors` module (Python 3.4 or
+    later) and does not support SSL.
+
+    .. versionadded:: 0.10
+    """
+    multithread = True
+
+    #: request bodies up to this size are read by the event loop.
+    max_request_buffer = 1024 * 1024
+
+    #: the maximum size of the request line and headers.
+    max_header_size = 64 * 1024
+
+    #: a worker waits while this many response bytes are not sent yet.
+    max_write_buffer = 1024 * 1024
+
+    #: connections that don't finish sending a request within this many
+    #: seconds are closed.
+    request_timeout = 60
+
+    #: how often (in seconds) the event loop looks for connections that
+    #: ran into a timeout.
+    idle_check_interval = 1
+
+    def __init__(self, host, port, app, threads=10, handler=None,
+                 passthrough_errors=False, ssl_context=None,
+                 keep_alive=False):
+        if selectors is None:
+            raise RuntimeError('The event loop server requires the '
+                               'selectors module.')
+        if ssl_context is not None:
+            raise TypeError('The event loop server does not support SSL.')
+        BaseWSGIServer.__init__(self, host, port, app, handler,
+                                passthrough_errors, None, keep_alive)
+        self.threads = threads
+        self._tasks = Queue()
+        self._workers = []
+        self._connections = set()
+        self._pending = set()
+        self._pending_lock = threading.Lock()
+        self._waker, self._wake_sock = socket.socketpair()
+        self._waker.setblocking(False)
+        self._wake_sock.setblocking(False)
+        self._selector = None
+        self._stopping = False
+        self._is_shut_down = threading.Event()
+        self._is_shut_down.set()
+
+    @property
+    def connection_count(self):
+        """The number of open connections."""
+        return len(self._connections)
+
+    def _wakeup(self, conn=None):
+        if conn is not None:
+            with self._pending_lock:
+                self._pending.add(conn)
+        try:
+            self._wake_sock.send(b'x')
+        except socket.error:
+            pass
+
+    def _worker(self):
+        while 1:
+            task = self._tasks.get()
+            if task is None:
+                break
+            try:
+                task[0](*task[1:])
+            except Exception:
+                self.log('error', 'Error in worker thread:\n%s',
+                         traceback.format_exc())
+
+    def _run_buffered(self, conn, request):
+        keep_open = False
+        fake = _BufferedConnection(conn, request)
+        try:
+            self.finish_request(fake, conn.client_address)
+            keep_open = fake.rfile.wants_next_request
+        except Exception:
+            self.handle_error(fake, conn.client_address)
+        finally:
+            conn.finish(keep_open)
+
+    def _run_streamed(self, conn, prefix):
+        try:
+            self.finish_request(_PrefixedConnection(conn.sock, prefix),
+                                conn.client_address)
+        except Exception:
+            self.handle_error(conn.sock, conn.client_address)
+        finally:
+            self.shutdown_request(conn.sock)
+
+    def _set_events(self, conn, events):
+        if events == conn.events:
+            return
+        if not conn.events:
+            self._selector.register(conn.sock, events, conn)
+        elif not events:
+            self._selector.unregister(conn.sock)
+        else:
+            self._selector.modify(conn.sock, events, conn)
+        conn.events = events
+
+    def _accept(self):
+        try:
+            sock, client_address = self.socket.accept()
+        except socket.error:
+            return
+        sock.setblocking(False)
+        # the responses are buffered, small writes don't need to wait
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        conn = _EventLoopConnection(self, sock, client_address)
+        self._connections.add(conn)
+        self._set_events(conn, selectors.EVENT_READ)
+
+    def _close(self, conn):
+        with conn.cond:
+            conn.state = conn.closed
+            conn.cond.notify_all()
+        self._connections.discard(conn)
+        self._set_events(conn, 0)
+        self.shutdown_request(conn.sock)
+
+    def _dispatch(self, conn):
+        """Passes the next request in the input buffer to a worker if it
+        is complete.
+        """
+        buf = conn.inbuf
+        # skip empty lines in front of the request line
+        while buf[:1] in (b'\r', b'\n'):
+            del buf[:1]
+        match = _header_end_re.search(buf)
+        if match is None:
+            if len(buf) > self.max_header_size:
+                self._stream(conn)
+            return
+        head = bytes(buf[:match.end()])
+        length = _content_length_re.search(head)
+        length = length is not None and int(length.group(1)) or 0
+        if _needs_stream_re.search(head) or \
+           length > self.max_request_buffer:
+            self._stream(conn)
+            return
+        end = match.end() + length
+        if len(buf) < end:
+            return
+        request = bytes(buf[:end])
+        del buf[:end]
+        conn.state = conn.working
+        conn.done = False
+        conn.requests += 1
+        self._set_events(conn, 0)
+        self._tasks.put((self._run_buffered, conn, request))
+
+    def _stream(self, conn):
+        """Hands the connection over to a worker for good."""
+        self._connections.discard(conn)
+        self._set_events(conn, 0)
+        conn.sock.setblocking(True)
+        self._tasks.put((self._run_streamed, conn, conn.inbuf))
+
+    def _read(self, conn):
+        try:
+            data = conn.sock.recv(64 * 1024)
+        except socket.error:
+            data = b''
+        if not data:
+            self._close(conn)
+            return
+        conn.inbuf += data
+        conn.last_active = time.time()
+        self._dispatch(conn)
+
+    def _write(self, conn):
+        with conn.cond:
+            if conn.outbuf:
+                try:
+                    sent = conn.sock.send(conn.outbuf)
+                except socket.error as e:
+                    if e.args[0] not in (errno.EAGAIN, errno.EWOULDBLOCK):
+                        conn.state = conn.closed
+                else:
+                    del conn.outbuf[:sent]
+                    conn.last_active = time.time()
+                conn.cond.notify_all()
+            pending = bool(conn.outbuf)
+            finished = conn.done and not pending
+        if conn.state == conn.closed:
+            self._close(conn)
+        elif finished:
+            self._finish_response(conn)
+        else:
+            self._set_events(conn, pending and selectors.EVENT_WRITE or 0)
+
+    def _finish_response(self, conn):
+        if not conn.keep_open:
+            self._close(conn)
+            return
+        conn.state = conn.reading
+        conn.last_active = time.time()
+        self._set_events(conn, selectors.EVENT_READ)
+        self._dispatch(conn)
+
+    def _process_pending(self):
+        try:
+            while self._waker.recv(4096):
+                pass
+        except socket.error:
+            pass
+        with self._pending_lock:
+            pending = self._pending
+            self._pending = set()
+        for conn in pending:
+            if conn.state == conn.working:
+                self._write(conn)
+
+    def _close_idle(self):
+        now = time.time()
+        for conn in list(self._connections):
+            if conn.state != conn.reading:
+                continue
+            timeout = conn.inbuf and self.request_timeout or \
+                self.keep_alive_timeout
+            if now - conn.last_active > timeout:
+                self._close(conn)
+
+    def serve_forever(self):
+        self.shutdown_signal = False
+        self._stopping = False
+        self._is_shut_down.clear()
+        while len(self._workers) < self.threads:
+            t = threading.Thread(target=self._worker)
+            t.daemon = True
+            t.start()
+            self._workers.append(t)
+        self._selector = selector = selectors.DefaultSelector()
+        self.socket.setblocking(False)
+        selector.register(self.socket, selectors.EVENT_READ)
+        selector.register(self._waker, selectors.EVENT_READ)
+        next_idle_check = time.time() + self.idle_check_interval
+        try:
+            while not self._stopping and not self.shutdown_signal:
+                for key, events in selector.select(self.idle_check_interval):
+                    if key.fileobj is self.socket:
+                        self._accept()
+                    elif key.fileobj is self._waker:
+                        self._process_pending()
+                    elif events & selectors.EVENT_READ:
+                        self._read(key.data)
+                    elif key.data.state == key.data.working:
+                        self._write(key.data)
+                # the timeouts are in seconds, looking at every connection
+                # on each iteration of a busy loop is not worth it.
+                if time.time() >= next_idle_check:
+                    self._close_idle()
+                    next_idle_check = time.time() + self.idle_check_interval
+        except KeyboardInterrupt:
+            pass
+        finally:
+            for conn in list(self._connections):
+                self._close(conn)
+            for t in self._workers:
+                self._tasks.put(None)
+            self._workers = []
+            selector.close()
+            self.socket.setblocking(True)
+            self._is_shut_down.set()
+
+    def shutdown(self):
+        """Stops the event loop and waits for :meth:`serve_forever` to
+        return.
+        """
+        self._stopping = True
+        self._wakeup()
+        self._is_shut_down.wait()
+
+    def server_close(self):
+        BaseWSGIServer.server_close(self)
+        self._waker.close()
+        self._wake_sock.close()
+
+
 def make_server(host, port, app=None, threaded=False, processes=1,
                 request_handler=None, passthrough_errors=False,
-                ssl_context=None):
+                ssl_context=None, keep_alive=False, threads=None,
+                prefork=False, reuse_port=False, max_requests=None,
+                queue_size=64, event_loop=False):
     """Create a new server instance that is either threaded, or forks
-    or just processes one request after another.
+    or just processes one request after another.  If `threads` is given
+    a :class:`PooledWSGIServer` with that many worker threads is used,
+    with `prefork` a :class:`PreforkWSGIServer` with `processes` workers
+    and with `event_loop` an :class:`EventLoopWSGIServer` with `threads`
+    (or 10) workers.
     """
-    if threaded and processes > 1:
+    if (threaded or threads or event_loop) and (processes > 1 or prefork):
         raise ValueError("cannot have a multithreaded and "
                          "multi process server.")
+    elif event_loop:
+        return EventLoopWSGIServer(host, port, app, threads or 10,
+                                   request_handler, passthrough_errors,
+                                   ssl_context, keep_alive)
+    elif prefork:
+        return PreforkWSGIServer(host, port, app, processes, request_handler,
+                                 passthrough_errors, ssl_context, keep_alive,
+                                 reuse_port, max_requests)
+    elif threads:
+        return PooledWSGIServer(host, port, app, threads, request_handler,
+                                passthrough_errors, ssl_context, keep_alive,
+                                queue_size)
     elif threaded:
         return ThreadedWSGIServer(host, port, app, request_handler,
-                                  passthrough_errors, ssl_context)
+                                  passthrough_errors, ssl_context,
+                                  keep_alive)
     elif processes > 1:
         return ForkingWSGIServer(host, port, app, processes, request_handler,
-                                 passthrough_errors, ssl_context)
+                                 passthrough_errors, ssl_context, keep_alive)
     else:
         return BaseWSGIServer(host, port, app, request_handler,
-                              passthrough_errors, ssl_context)
+                              passthrough_errors, ssl_context, keep_alive)
 
 
 def _iter_module_files():
@@ -628,7 +1663,9 @@ def run_simple(hostname, port, application, use_reloader=False,
                use_debugger=False, use_evalex=True,
                extra_files=None, reloader_interval=1, threaded=False,
                processes=1, request_handler=None, static_files=None,
-               passthrough_errors=False, ssl_context=None):
+               passthrough_errors=False, ssl_context=None, keep_alive=False,
+               threads=None, prefork=False, reuse_port=False,
+               max_requests=None, queue_size=64, event_loop=False):
     """Start an application using wsgiref and with an optional reloader.  This
     wraps `wsgiref` to fix the wrong default reporting of the multithreaded
     WSGI variable and adds optional multithreading and fork support.
@@ -651,6 +1688,10 @@ def run_simple(hostname, port, application, use_reloader=False,
     .. versionadded:: 0.9
        Added command-line interface.
 
+    .. versionadded:: 0.10
+       Added support for persistent HTTP/1.1 connections, a pool of
+       worker threads, prefork worker processes and an event loop.
+
     :param hostname: The host for the application.  eg: ``'localhost'``
     :param port: The port for the server.  eg: ``8080``
     :param application: the WSGI application to execute
@@ -664,8 +1705,24 @@ def run_simple(hostname, port, application, use_reloader=False,
     :param reloader_interval: the interval for the reloader in seconds.
     :param threaded: should the process handle each request in a separate
                      thread?
+    :param threads: if given the requests are handled by a fixed pool of
+                    this many threads instead, see
+                    :class:`PooledWSGIServer`.
+    :param queue_size: with `threads`, the number of connections that may
+                       wait for a free thread before new ones are answered
+                       with 503.
+    :param event_loop: if set, the connections are waited on in one thread
+                       and only complete requests are handed to `threads`
+                       worker threads, see :class:`EventLoopWSGIServer`.
     :param processes: if greater than 1 then handle each request in a new process
                       up to this maximum number of concurrent processes.
+    :param prefork: if set, `processes` worker processes are forked up front
+                    and accept the connections themselves, see
+                    :class:`PreforkWSGIServer`.
+    :param reuse_port: with `prefork`, let every worker listen on its own
+                       socket with ``SO_REUSEPORT``.
+    :param max_requests: with `prefork`, replace a worker after it handled
+                         this many connections.
     :param request_handler: optional parameter that can be used to replace
                             the default one.  You can use this to replace it
                             with a different
@@ -683,6 +1740,11 @@ def run_simple(hostname, port, application, use_reloader=False,
                         the string ``'adhoc'`` if the server should
                         automatically create one, or `None` to disable SSL
                         (which is the default).
+    :param keep_alive: set this to `True` to keep connections open for
+                       further requests.  Responses without a content
+                       length are then sent chunked.  Keep in mind that a
+                       server that is not threaded can't serve other
+                       clients while it waits on an idle connection.
     """
     if use_debugger:
         from werkzeug.debug import DebuggedApplication
@@ -694,7 +1756,9 @@ def run_simple(hostname, port, application, use_reloader=False,
     def inner():
         make_server(hostname, port, application, threaded,
                     processes, request_handler,
-                    passthrough_errors, ssl_context).serve_forever()
+                    passthrough_errors, ssl_context,
+                    keep_alive, threads, prefork, reuse_port,
+                    max_requests, queue_size, event_loop).serve_forever()
 
     if os.environ.get('WERKZEUG_RUN_MAIN') != 'true':
         display_hostname = hostname != '*' and hostname or 'localhost'
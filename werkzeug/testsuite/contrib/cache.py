@@ -10,12 +10,20 @@
 """
 import os
 import time
+import fnmatch
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
 import unittest
 import tempfile
 import shutil
+from functools import update_wrapper
+from threading import Lock, Thread
 
 from werkzeug.testsuite import WerkzeugTestCase
 from werkzeug.contrib import cache
+from werkzeug._compat import iteritems, text_type
 
 try:
     import redis
@@ -129,6 +137,68 @@ class CacheTestCase(WerkzeugTestCase):
 class SimpleCacheTestCase(CacheTestCase):
     make_cache = cache.SimpleCache
 
+    def test_simplecache_lru(self):
+        c = self.make_cache(threshold=3)
+        for key in 'abc':
+            assert c.set(key, key)
+        assert c.get('a') == 'a'
+        assert c.set('d', 'd')
+        assert c.get('b') is None
+        assert c.set('e', 'e')
+        assert c.get('c') is None
+        for key in 'ade':
+            assert c.get(key) == key
+        self.assert_equal(c.evictions, 2)
+        self.assert_equal(c.hits, 4)
+        self.assert_equal(c.misses, 2)
+
+    def test_simplecache_max_size(self):
+        c = self.make_cache(max_size=1000)
+        assert c.set('a', b'x' * 400)
+        assert c.set('b', b'x' * 400)
+        assert 800 < c.size <= 1000
+        assert c.set('c', b'x' * 400)
+        assert c.get('a') is None
+        assert c.get('b') is not None
+        assert not c.set('d', b'x' * 2000)
+        assert c.get('d') is None
+        assert c.delete('b')
+        assert c.delete('c')
+        self.assert_equal(c.size, 0)
+
+    def test_simplecache_expire(self):
+        c = self.make_cache()
+        for x in range(100):
+            assert c.set(x, x, -1)
+        assert c.set('foo', 'bar')
+        self.assert_equal(list(c._cache), ['foo'])
+        for x in range(1000):
+            assert c.set('foo', x)
+        assert len(c._expiry) < 200
+        assert c.get('foo') == 999
+
+    def test_simplecache_values(self):
+        c = self.make_cache()
+        value = u'immutable'
+        assert c.set('foo', value)
+        assert c.get('foo') is value
+        value = ['mutable']
+        assert c.set('foo', value)
+        value.append('changed')
+        self.assert_equal(c.get('foo'), ['mutable'])
+
+    def test_simplecache_threads(self):
+        c = self.make_cache()
+        def inc():
+            for x in range(500):
+                c.inc('foo')
+        threads = [Thread(target=inc) for x in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assert_equal(c.get('foo'), 2000)
+
 
 class FileSystemCacheTestCase(CacheTestCase):
     tmp_dir = None
@@ -142,23 +212,319 @@ class FileSystemCacheTestCase(CacheTestCase):
         if self.tmp_dir is not None:
             shutil.rmtree(self.tmp_dir)
     
+    def list_cache_files(self):
+        return [os.path.join(path, fn)
+                for path, dirs, files in os.walk(self.tmp_dir)
+                for fn in files if fn != cache.FileSystemCache._fs_index_name]
+
     def test_filesystemcache_prune(self):
         THRESHOLD = 13
         c = self.make_cache(threshold=THRESHOLD)
         for i in range(2 * THRESHOLD):
             assert c.set(str(i), i)
-        cache_files = os.listdir(self.tmp_dir)
+        cache_files = self.list_cache_files()
         assert len(cache_files) <= THRESHOLD
+        # the files that expire soonest are deleted first
+        assert c.set('short', 1, 1)
+        assert c.set('long', 1, 1000)
+        assert c.get('short') is None
+        assert c.get('long') == 1
 
     def test_filesystemcache_clear(self):
         c = self.make_cache()
         assert c.set('foo', 'bar')
-        cache_files = os.listdir(self.tmp_dir)
+        cache_files = self.list_cache_files()
         assert len(cache_files) == 1
         assert c.clear()
-        cache_files = os.listdir(self.tmp_dir)
+        cache_files = self.list_cache_files()
         assert len(cache_files) == 0
 
+    def test_filesystemcache_shared_index(self):
+        c1 = self.make_cache(threshold=10)
+        c2 = self.make_cache(threshold=10)
+        for i in range(8):
+            assert c1.set(str(i), i)
+        for i in range(8, 16):
+            assert c2.set(str(i), i)
+        self.assert_equal(len(self.list_cache_files()), 10)
+        assert c1.delete('15')
+        c2._read_index()
+        self.assert_equal(len(c2._entries), 9)
+        assert c1.clear()
+        assert c2.set('foo', 'bar')
+        self.assert_equal(len(self.list_cache_files()), 1)
+        self.assert_equal(list(c2._entries), [c2._get_hash('foo')])
+
+    def test_filesystemcache_max_size(self):
+        c = self.make_cache(max_size=2500)
+        for i in range(5):
+            assert c.set(str(i), b'x' * 1000)
+        assert 2000 < c._size <= 2500
+        self.assert_equal(len(self.list_cache_files()), 2)
+
+    def test_filesystemcache_index(self):
+        c = self.make_cache()
+        for i in range(3000):
+            assert c.set('foo', i)
+        # the index was replaced when it got too big
+        record_size = cache.FileSystemCache._fs_index_record.size
+        assert os.path.getsize(c._index_path) < 2000 * record_size
+        assert c.get('foo') == 2999
+
+        # files stored directly in the directory are moved
+        os.remove(c._index_path)
+        os.rename(c._get_filename('foo'),
+                  os.path.join(self.tmp_dir, c._get_hash('foo')))
+        c = self.make_cache()
+        self.assert_equal(len(c._entries), 1)
+        assert c.get('foo') == 2999
+
+
+    if cache.fcntl is not None:
+        def test_filesystemcache_compact_locked(self):
+            c1 = self.make_cache()
+            c2 = self.make_cache()
+            assert c1.set('foo', 'bar')
+            write_index = c1._write_index
+            threads = []
+            def slow_write_index(entries):
+                # another process stores a file while the index is replaced
+                t = Thread(target=c2.set, args=('late', 'value'))
+                t.start()
+                threads.append(t)
+                time.sleep(0.2)
+                return write_index(entries)
+            c1._write_index = slow_write_index
+            assert c1._compact_index()
+            threads[0].join()
+            c3 = self.make_cache()
+            c3._read_index()
+            self.assert_equal(sorted(c3._entries),
+                              sorted([c3._get_hash('foo'),
+                                      c3._get_hash('late')]))
+
+    def test_filesystemcache_compact_without_lock(self):
+        c = self.make_cache()
+        assert c.set('foo', 'bar')
+        # a record that got lost
+        assert c._write_index(())
+        fcntl = cache.fcntl
+        cache.fcntl = None
+        try:
+            assert c._compact_index()
+        finally:
+            cache.fcntl = fcntl
+        self.assert_equal(list(c._entries), [c._get_hash('foo')])
+
+
+class MmapCacheTestCase(CacheTestCase):
+    tmp_dir = None
+
+    def make_cache(self, **kwargs):
+        if self.tmp_dir is None:
+            self.tmp_dir = tempfile.mkdtemp()
+        return cache.MmapCache(os.path.join(self.tmp_dir, 'cache'), **kwargs)
+
+    def teardown(self):
+        if self.tmp_dir is not None:
+            shutil.rmtree(self.tmp_dir)
+
+    def test_mmapcache_shared(self):
+        c1 = self.make_cache(threshold=100, slot_size=256)
+        c2 = self.make_cache(threshold=10, slot_size=64)
+        assert c1.set('foo', ['bar'])
+        self.assert_equal(c2.get('foo'), ['bar'])
+        assert not c2.add('foo', 'baz')
+        assert c2.delete('foo')
+        assert c1.get('foo') is None
+        # the second cache uses the size of the existing file
+        assert c2.set('big', b'x' * 200)
+        self.assert_equal(c1.get('big'), b'x' * 200)
+        assert c2.clear()
+        assert c1.get('big') is None
+
+    def test_mmapcache_lru(self):
+        c = self.make_cache(threshold=2, ways=2)
+        assert c.set('a', 'a')
+        assert c.set('b', 'b')
+        assert c.get('a') == 'a'
+        assert c.set('c', 'c')
+        assert c.get('b') is None
+        assert c.get('a') == 'a'
+        assert c.get('c') == 'c'
+
+    def test_mmapcache_too_big(self):
+        c = self.make_cache(slot_size=100)
+        assert c.set('foo', 'bar')
+        assert not c.set('foo', 'x' * 100)
+        assert c.get('foo') is None
+        self.assert_raises(ValueError, cache.MmapCache,
+                           os.path.join(self.tmp_dir, 'other'), slot_size=10)
+
+    def test_mmapcache_threads(self):
+        c = self.make_cache()
+        def inc():
+            for x in range(500):
+                c.inc('foo')
+        threads = [Thread(target=inc) for x in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assert_equal(c.get('foo'), 2000)
+
+
+class FakeRedis(object):
+    """An in-process stand-in for the parts of the redis-py client used by
+    the redis cache.  It counts the round trips to the "server".
+    """
+
+    def __init__(self):
+        self.data = {}
+        self.round_trips = 0
+
+    def _encode(self, value):
+        if isinstance(value, bytes):
+            return value
+        if not isinstance(value, text_type):
+            value = str(value)
+        return value.encode('utf-8')
+
+    def _get(self, key):
+        item = self.data.get(self._encode(key))
+        if item is not None:
+            if item[1] is None or item[1] > time.time():
+                return item[0]
+            del self.data[self._encode(key)]
+
+    def _set(self, key, value, timeout=None):
+        expires = timeout is not None and time.time() + timeout or None
+        self.data[self._encode(key)] = (self._encode(value), expires)
+        return True
+
+    def _command(f):
+        def command(self, *args, **kwargs):
+            self.round_trips += 1
+            return f(self, *args, **kwargs)
+        command.run = f
+        return update_wrapper(command, f)
+
+    @_command
+    def get(self, key):
+        return self._get(key)
+
+    @_command
+    def mget(self, keys):
+        assert keys, 'wrong number of arguments for MGET'
+        return [self._get(key) for key in keys]
+
+    @_command
+    def set(self, key, value, ex=None, nx=False):
+        if nx and self._get(key) is not None:
+            return None
+        return self._set(key, value, ex)
+
+    @_command
+    def setex(self, key, value, timeout):
+        return self._set(key, value, timeout)
+
+    @_command
+    def setnx(self, key, value):
+        if self._get(key) is not None:
+            return False
+        return self._set(key, value)
+
+    @_command
+    def expire(self, key, timeout):
+        value = self._get(key)
+        return value is not None and self._set(key, value, timeout)
+
+    @_command
+    def delete(self, *keys):
+        assert keys, 'wrong number of arguments for DEL'
+        return len([self.data.pop(key) for key in map(self._encode, keys)
+                    if key in self.data])
+
+    @_command
+    def keys(self, pattern):
+        return [key for key in self.data
+                if fnmatch.fnmatchcase(key, self._encode(pattern))]
+
+    @_command
+    def flushdb(self):
+        self.data.clear()
+        return True
+
+    @_command
+    def incr(self, key, amount=1):
+        value = int(self._get(key) or 0) + amount
+        self._set(key, value)
+        return value
+
+    @_command
+    def decr(self, key, amount=1):
+        return self.incr.run(self, key, -amount)
+
+    def pipeline(self, transaction=True):
+        return FakeRedisPipeline(self)
+
+    del _command
+
+
+class FakeRedisPipeline(object):
+
+    def __init__(self, client):
+        self.client = client
+        self.commands = []
+
+    def __getattr__(self, name):
+        run = getattr(self.client, name).run
+        def command(*args, **kwargs):
+            self.commands.append((run, args, kwargs))
+            return self
+        return command
+
+    def execute(self):
+        self.client.round_trips += 1
+        commands, self.commands = self.commands, []
+        return [run(self.client, *args, **kwargs)
+                for run, args, kwargs in commands]
+
+
+class FakeRedisCacheTestCase(CacheTestCase):
+
+    def make_cache(self, **kwargs):
+        return cache.RedisCache(FakeRedis(), key_prefix='werkzeug-test-case:',
+                                **kwargs)
+
+    def test_compat(self):
+        c = self.make_cache()
+        assert c._client.set(c.key_prefix + 'foo', 'Awesome')
+        self.assert_equal(c.get('foo'), b'Awesome')
+        assert c._client.set(c.key_prefix + 'foo', '42')
+        self.assert_equal(c.get('foo'), 42)
+
+    def test_batches(self):
+        c = self.make_cache(batch_size=1000)
+        keys = ['key%d' % x for x in range(2500)]
+        assert c.set_many((key, key) for key in keys)
+        self.assert_equal(c._client.round_trips, 3)
+        self.assert_equal(c.get_many(*keys), keys)
+        self.assert_equal(c._client.round_trips, 6)
+        self.assert_equal(c.delete_many(*keys[:1500]), 1500)
+        self.assert_equal(c._client.round_trips, 8)
+        assert c.clear()
+        self.assert_equal(c._client.data, {})
+        self.assert_equal(c._client.round_trips, 10)
+
+    def test_add(self):
+        c = self.make_cache()
+        assert c.add('foo', 'bar', 1)
+        self.assert_equal(c._client.round_trips, 1)
+        time.sleep(1.5)
+        assert c.add('foo', 'baz')
+        self.assert_equal(c.get('foo'), 'baz')
+
 
 class RedisCacheTestCase(CacheTestCase):
     def make_cache(self):
@@ -175,6 +541,169 @@ class RedisCacheTestCase(CacheTestCase):
         self.assert_equal(c.get('foo'), 42)
     
 
+class FakeMemcacheServer(object):
+    """Stands in for a memcached server.  It stores the items in a dict and
+    records the keys of every request.
+    """
+
+    def __init__(self):
+        self.data = {}
+        self.requests = []
+        self.clients = 0
+
+
+class FakeMemcache(object):
+    """A client for :class:`FakeMemcacheServer` with the API of
+    :class:`memcache.Client`.  It fails if two threads use it at once.
+    """
+
+    def __init__(self, server):
+        self.server = server
+        self.busy = Lock()
+        server.clients += 1
+
+    def _request(f):
+        def request(self, *args):
+            assert self.busy.acquire(False), 'client used by two threads'
+            try:
+                time.sleep(0.001)
+                return f(self, *args)
+            finally:
+                self.busy.release()
+        return update_wrapper(request, f)
+
+    def _get(self, key):
+        assert isinstance(key, bytes) and len(key) <= 250
+        item = self.server.data.get(key)
+        if item is not None and item[1] > time.time():
+            return pickle.loads(item[0])
+
+    def _set(self, key, value, timeout):
+        assert isinstance(key, bytes) and len(key) <= 250
+        self.server.data[key] = (pickle.dumps(value), time.time() + timeout)
+
+    @_request
+    def get(self, key):
+        self.server.requests.append([key])
+        return self._get(key)
+
+    @_request
+    def get_multi(self, keys):
+        keys = list(keys)
+        self.server.requests.append(keys)
+        rv = {}
+        for key in keys:
+            value = self._get(key)
+            if value is not None:
+                rv[key] = value
+        return rv
+
+    @_request
+    def set(self, key, value, timeout=0):
+        self.server.requests.append([key])
+        self._set(key, value, timeout)
+        return True
+
+    @_request
+    def set_multi(self, mapping, timeout=0):
+        self.server.requests.append(list(mapping))
+        for key, value in iteritems(mapping):
+            self._set(key, value, timeout)
+        return []
+
+    @_request
+    def add(self, key, value, timeout=0):
+        self.server.requests.append([key])
+        if self._get(key) is not None:
+            return False
+        self._set(key, value, timeout)
+        return True
+
+    @_request
+    def delete(self, key):
+        self.server.requests.append([key])
+        return self.server.data.pop(key, None) is not None
+
+    @_request
+    def delete_multi(self, keys):
+        keys = list(keys)
+        self.server.requests.append(keys)
+        for key in keys:
+            self.server.data.pop(key, None)
+        return True
+
+    def _incr(self, key, delta):
+        value = self._get(key)
+        if value is None:
+            return None
+        self._set(key, value + delta, 300)
+        return value + delta
+
+    @_request
+    def incr(self, key, delta=1):
+        self.server.requests.append([key])
+        return self._incr(key, delta)
+
+    @_request
+    def decr(self, key, delta=1):
+        self.server.requests.append([key])
+        return self._incr(key, -delta)
+
+    @_request
+    def flush_all(self):
+        self.server.data.clear()
+        return True
+
+    del _request
+
+
+class FakeMemcachedCache(cache.MemcachedCache):
+
+    def import_preferred_memcache_lib(self, servers):
+        return FakeMemcache(servers[0])
+
+
+class FakeMemcachedCacheTestCase(CacheTestCase):
+
+    def make_cache(self, **kwargs):
+        self.server = FakeMemcacheServer()
+        return FakeMemcachedCache([self.server],
+                                  key_prefix='werkzeug-test-case:', **kwargs)
+
+    def test_batches(self):
+        c = self.make_cache(batch_size=100)
+        keys = [u'k\xe9y%d' % x for x in range(250)]
+        assert c.set_many((key, key) for key in keys)
+        self.assert_equal([len(r) for r in self.server.requests],
+                          [100, 100, 50])
+        del self.server.requests[:]
+        self.assert_equal(c.get_many(*keys + ['x' * 300]),
+                          keys + [None])
+        self.assert_equal([len(r) for r in self.server.requests],
+                          [100, 100, 50])
+        assert all(key.startswith(b'werkzeug-test-case:k\xc3\xa9y')
+                   for key in self.server.requests[0])
+        assert c.delete_many(*keys)
+        self.assert_equal(self.server.data, {})
+
+    def test_pool(self):
+        c = self.make_cache(pool_size=3)
+        def work(n):
+            for x in range(20):
+                key = 'key%d-%d' % (n, x)
+                assert c.set(key, x)
+                assert c.get_dict(key) == {key: x}
+        threads = [Thread(target=work, args=(n,)) for n in range(6)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assert_equal(len(self.server.data), 120)
+        self.assert_true(1 < self.server.clients <= 3)
+        # without a client every call would block forever
+        self.assert_raises(ValueError, self.make_cache, pool_size=0)
+
+
 class MemcachedCacheTestCase(CacheTestCase):
     def make_cache(self):
         return cache.MemcachedCache(key_prefix='werkzeug-test-case:')
@@ -192,8 +721,12 @@ def suite():
     suite = unittest.TestSuite()
     suite.addTest(unittest.makeSuite(SimpleCacheTestCase))
     suite.addTest(unittest.makeSuite(FileSystemCacheTestCase))
+    if cache.fcntl is not None:
+        suite.addTest(unittest.makeSuite(MmapCacheTestCase))
+    suite.addTest(unittest.makeSuite(FakeRedisCacheTestCase))
     if redis is not None:
         suite.addTest(unittest.makeSuite(RedisCacheTestCase))
+    suite.addTest(unittest.makeSuite(FakeMemcachedCacheTestCase))
     if memcache is not None:
         suite.addTest(unittest.makeSuite(MemcachedCacheTestCase))
     return suite
@@ -11,19 +11,25 @@
 
 from __future__ import with_statement
 
+import os
 import unittest
 from os.path import join, dirname
 
-from werkzeug.testsuite import WerkzeugTestCase
+from werkzeug.testsuite import WerkzeugTestCase, get_temporary_directory
 
 from werkzeug import formparser
 from werkzeug.test import create_environ, Client
 from werkzeug.wrappers import Request, Response
 from werkzeug.exceptions import RequestEntityTooLarge
-from werkzeug.datastructures import MultiDict
+from werkzeug.datastructures import MultiDict, FileStorage
 from werkzeug.formparser import parse_form_data
 from werkzeug._compat import BytesIO
 
+try:
+    from concurrent.futures import ThreadPoolExecutor
+except ImportError:
+    ThreadPoolExecutor = None
+
 
 @Request.application
 def form_data_consumer(request):
@@ -148,13 +154,121 @@ class FormParserTestCase(WerkzeugTestCase):
         # close file to prevent fds from leaking
         req.files['foo'].close()
 
+    def make_file_environ(self):
+        return create_environ(method='POST', data={
+            'a': (BytesIO(b'foo'), 'a.txt'),
+            'b': (BytesIO(b'bar'), 'b.txt'),
+            'c': 'no file'
+        })
+
+    if ThreadPoolExecutor is not None:
+        def test_file_processor(self):
+            calls = []
+            def process(f):
+                calls.append(f.filename)
+                return f.read()
+            with ThreadPoolExecutor(2) as executor:
+                parser = formparser.FormDataParser(executor=executor,
+                                                   file_processor=process)
+                stream, form, files = parser.parse_from_environ(
+                    self.make_file_environ())
+                self.assert_strict_equal(files['a'].future.result(), b'foo')
+                self.assert_strict_equal(files['b'].future.result(), b'bar')
+            self.assert_equal(sorted(calls), ['a.txt', 'b.txt'])
+            # the files are rewound after processing
+            self.assert_strict_equal(files['a'].read(), b'foo')
+            self.assert_strict_equal(form['c'], u'no file')
+
+        def test_file_processor_error(self):
+            def process(f):
+                f.read()
+                raise ValueError(f.filename)
+            with ThreadPoolExecutor(2) as executor:
+                parser = formparser.FormDataParser(executor=executor,
+                                                   file_processor=process)
+                stream, form, files = parser.parse_from_environ(
+                    self.make_file_environ())
+                for name in 'a', 'b':
+                    try:
+                        files[name].future.result()
+                    except ValueError as e:
+                        self.assert_equal(e.args, (name + '.txt',))
+                    else:
+                        self.fail('the error was not passed on')
+            # the files are rewound even if the processor fails
+            self.assert_strict_equal(files['b'].read(), b'bar')
+            self.assert_strict_equal(form['c'], u'no file')
+
+    def test_file_processor_disabled(self):
+        parser = formparser.FormDataParser()
+        stream, form, files = parser.parse_from_environ(
+            self.make_file_environ())
+        self.assert_is_none(files['a'].future)
+
+    def test_urlencoded(self):
+        from werkzeug.urls import url_decode
+        data = b'&'.join([b'foo=Hello+World', b'bar=%C3%A4%C3%B6',
+                          b'empty=', b'novalue', b'', b'x=' + b'y' * 200000,
+                          b'foo=again&'])
+        parser = formparser.FormDataParser()
+        stream, form, files = parser.parse(BytesIO(data),
+                                           'application/x-www-form-urlencoded',
+                                           len(data))
+        self.assert_equal(form, url_decode(data))
+        self.assert_strict_equal(form.getlist('foo'),
+                                 [u'Hello World', u'again'])
+        self.assert_strict_equal(form['bar'], u'\xe4\xf6')
+        self.assert_strict_equal(form['novalue'], u'')
+        self.assert_equal(len(form['x']), 200000)
+        self.assert_equal(len(files), 0)
+
+    def test_urlencoded_limits(self):
+        data = b'a=1&b=22&c=333'
+        def parse(**options):
+            parser = formparser.FormDataParser(**options)
+            return parser.parse(BytesIO(data),
+                                'application/x-www-form-urlencoded',
+                                len(data))[1]
+
+        self.assert_equal(len(parse(max_form_fields=3)), 3)
+        self.assert_raises(RequestEntityTooLarge, parse, max_form_fields=2)
+        self.assert_equal(len(parse(max_field_size=5)), 3)
+        self.assert_raises(RequestEntityTooLarge, parse, max_field_size=4)
+
+        # a field that spans many blocks is limited too
+        data = b'a=' + b'x' * (1024 * 200)
+        self.assert_equal(len(parse(max_field_size=1024 * 201)['a']),
+                          1024 * 200)
+        self.assert_raises(RequestEntityTooLarge, parse,
+                           max_field_size=1024 * 100)
+
+    def test_parse_streaming_urlencoded(self):
+        data = b'foo=1&bar=2&foo=3'
+        fields = []
+        parser = formparser.FormDataParser()
+        stream = BytesIO(data)
+        parser.parse_streaming(stream, 'application/x-www-form-urlencoded',
+                               len(data),
+                               on_field=lambda k, v: fields.append((k, v)))
+        self.assert_equal(fields, [('foo', u'1'), ('bar', u'2'),
+                                   ('foo', u'3')])
+        self.assert_strict_equal(stream.read(), b'')
+
+        data = (b'--foo\r\nContent-Disposition: form-field; name=foo\r\n\r\n'
+                b'Hello World\r\n--foo--')
+        fields = []
+        parser.parse_streaming(BytesIO(data), 'multipart/form-data',
+                               len(data), {'boundary': 'foo'},
+                               on_field=lambda k, v: fields.append((k, v)))
+        self.assert_equal(fields, [('foo', u'Hello World')])
+
     def test_streaming_parse(self):
         data = b'x' * (1024 * 600)
         class StreamMPP(formparser.MultiPartParser):
             def parse(self, file, boundary, content_length):
                 i = iter(self.parse_lines(file, boundary, content_length))
                 one = next(i)
-                two = next(i)
+                two = list(iter(lambda: next(i), ('end', None)))
                 return self.cls(()), {'one': one, 'two': two}
         class StreamFDP(formparser.FormDataParser):
             def _sf_parse_multipart(self, stream, mimetype,
@@ -174,8 +288,91 @@ class FormParserTestCase(WerkzeugTestCase):
                                     method='POST')
         self.assert_strict_equal('begin_file', req.files['one'][0])
         self.assert_strict_equal(('foo', 'test.txt'), req.files['one'][1][1:])
-        self.assert_strict_equal('cont', req.files['two'][0])
-        self.assert_strict_equal(data, req.files['two'][1])
+        # the data is not collected into one line but passed on in blocks
+        self.assert_equal(set(x[0] for x in req.files['two']), set(['cont']))
+        assert max(len(x[1]) for x in req.files['two']) <= 64 * 1024
+        self.assert_strict_equal(data, b''.join(x[1] for x in req.files['two']))
+
+    def test_spooled_upload_file(self):
+        f = formparser.SpooledUploadFile(max_size=10)
+        f.write(memoryview(b'hello\nwor'))
+        assert f.in_memory
+        f.seek(0)
+        self.assert_strict_equal(f.readline(), b'hello\n')
+        self.assert_strict_equal(f.read(2), b'wo')
+        f.seek(0, 2)
+        f.write(b'ld!')
+        assert not f.in_memory
+        self.assert_equal(f.tell(), 12)
+        f.seek(6)
+        self.assert_strict_equal(f.read(), b'world!')
+        self.assert_strict_equal(f.getvalue(), b'hello\nworld!')
+        self.assert_equal(list(f), [])
+        f.close()
+
+        for max_size in 100, 0:
+            with formparser.SpooledUploadFile(max_size) as f:
+                f.write(b'foobar')
+                f.seek(3)
+                f.truncate()
+                self.assert_equal(f.getvalue(), b'foo')
+                f.truncate(1)
+                self.assert_equal(f.getvalue(), b'f')
+            assert f.closed
+
+        f = formparser.default_stream_factory(100, None, None)
+        f.write(b'foo\nbar')
+        assert f.in_memory
+        f.seek(0)
+        self.assert_equal(list(f), [b'foo\n', b'bar'])
+        f = formparser.default_stream_factory(1024 * 1024, None, None)
+        f.write(b'foo')
+        assert not f.in_memory
+
+    def test_spooled_upload_file_save(self):
+        folder = get_temporary_directory()
+        with open(join(folder, 'reference'), 'wb'):
+            pass
+        mode = os.stat(join(folder, 'reference')).st_mode
+
+        for max_size, named in (100, False), (0, False), (0, True):
+            f = formparser.SpooledUploadFile(max_size, named, folder)
+            f.write(b'x' * 50)
+            f.seek(10)
+            out = BytesIO()
+            FileStorage(f).save(out)
+            self.assert_strict_equal(out.getvalue(), b'x' * 40)
+            self.assert_strict_equal(f.read(), b'')
+
+            f.seek(0)
+            dst = join(folder, 'saved')
+            FileStorage(f).save(dst)
+            self.assert_strict_equal(get_contents(dst), b'x' * 50)
+            self.assert_equal(os.stat(dst).st_mode, mode)
+            self.assert_strict_equal(f.read(), b'')
+            # a named file was moved instead of copied
+            self.assert_equal(sorted(os.listdir(folder)),
+                              ['reference', 'saved'])
+            if named:
+                # and the saved file can't be changed through it
+                assert not f.writable()
+                try:
+                    f.write(b'y')
+                except (IOError, ValueError):
+                    pass
+                else:
+                    assert False, 'expected an error'
+                f.seek(0)
+                self.assert_strict_equal(f.read(), b'x' * 50)
+                self.assert_strict_equal(get_contents(dst), b'x' * 50)
+            f.close()
+            os.remove(dst)
+
+        # named files are removed on close unless they were moved
+        f = formparser.SpooledUploadFile(0, True, folder)
+        f.write(b'foo')
+        f.close()
+        self.assert_equal(os.listdir(folder), ['reference'])
 
 
 class MultiPartTestCase(WerkzeugTestCase):
@@ -358,6 +555,53 @@ class MultiPartTestCase(WerkzeugTestCase):
         self.assert_raises(ValueError, formparser.parse_multipart_headers,
                            ['foo: bar\r\n', ' x test'])
 
+    def test_boundary_across_blocks(self):
+        value = b'--foox\r\n--foo bar\r\n-\r\n--fo\r'
+        for padding in range(1000, 1040):
+            content = b'x' * padding + value
+            data = b'--foo\r\n' \
+                   b'Content-Disposition: form-data; name=a; filename=a\r\n' \
+                   b'\r\n' + content + b'\r\n--foo \r\n' \
+                   b'Content-Disposition: form-data; name=b\r\n' \
+                   b'\r\n\r\n--foo--'
+            parser = formparser.MultiPartParser(
+                formparser.default_stream_factory, buffer_size=1024)
+            form, files = parser.parse(BytesIO(data), b'foo', len(data))
+            self.assert_strict_equal(files['a'].read(), content)
+            self.assert_strict_equal(form['b'], u'')
+
+    def test_parse_streaming(self):
+        data = b'--foo\r\n' \
+               b'Content-Disposition: form-data; name=a\r\n\r\n' \
+               b'\xc3\xa4\r\n--foo\r\n' \
+               b'Content-Disposition: form-data; name=f; filename=f.txt\r\n' \
+               b'Content-Type: text/plain\r\n\r\n' + b'x' * 3000 + \
+               b'\r\n--foo\r\n' \
+               b'Content-Disposition: form-data; name=a\r\n\r\n' \
+               b'b\r\n--foo--'
+        events = []
+        parser = formparser.MultiPartParser(buffer_size=1024)
+        parser.parse_streaming(
+            BytesIO(data), b'foo', len(data),
+            on_field=lambda *args: events.append(('field',) + args),
+            on_file_start=lambda name, filename, headers: events.append(
+                ('start', name, filename, headers['content-type'])),
+            on_file_chunk=lambda *args: events.append(('chunk',) + args),
+            on_file_end=lambda *args: events.append(('end',) + args))
+        self.assert_equal(events[:2], [('field', 'a', u'\xe4'),
+                                       ('start', 'f', u'f.txt', 'text/plain')])
+        chunks = events[2:-2]
+        assert len(chunks) > 1
+        self.assert_equal(set(x[:2] for x in chunks), set([('chunk', 'f')]))
+        self.assert_equal(set(type(x[2]) for x in chunks), set([bytes]))
+        self.assert_equal(b''.join(x[2] for x in chunks), b'x' * 3000)
+        self.assert_equal(events[-2:], [('end', 'f'), ('field', 'a', u'b')])
+
+        # no callbacks at all still checks the form memory limit
+        parser = formparser.MultiPartParser(max_form_memory_size=1)
+        self.assert_raises(RequestEntityTooLarge, parser.parse_streaming,
+                           BytesIO(data), b'foo', len(data))
+
     def test_bad_newline_bad_newline_assumption(self):
         class ISORequest(Request):
             charset = 'latin1'
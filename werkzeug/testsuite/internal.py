@@ -29,6 +29,24 @@ class InternalTestCase(WerkzeugTestCase):
         x = datetime(2010, 2, 15, 16, 15, 39)
         assert internal._date_to_unix(x) == 1266250539
 
+    def test_lru_dict(self):
+        d = internal._LRUDict()
+        for key in 'abc':
+            d[key] = key.upper()
+        self.assert_equal(len(d), 3)
+        self.assert_equal(d.get('a'), 'A')
+        self.assert_equal(d.peek('b'), 'B')
+        self.assert_equal(list(d), ['b', 'c', 'a'])
+        d['b'] = 'X'
+        self.assert_equal(d.items(), [('c', 'C'), ('a', 'A'), ('b', 'X')])
+        self.assert_equal(d.popitem(), ('c', 'C'))
+        self.assert_equal(d.pop('a'), 'A')
+        self.assert_is_none(d.pop('a'))
+        assert 'a' not in d and 'b' in d
+        d.clear()
+        self.assert_equal(len(d), 0)
+        self.assert_raises(KeyError, d.popitem)
+
     def test_easteregg(self):
         req = Request.from_values('/?macgybarchakku')
         resp = Response.force_type(internal._easteregg(None), req)
@@ -691,6 +691,224 @@ class RoutingTestCase(WerkzeugTestCase):
         self.assert_strict_equal(rv,
             "Map([<Rule '/woop' -> foobar>, <Rule '/wat' -> enter>])")
 
+    def test_rule_matchers(self):
+        def make_rules():
+            return [
+                r.Rule('/', endpoint='index'),
+                r.Rule('/foo', endpoint='foo'),
+                r.Rule('/bar/', endpoint='bar'),
+                r.Rule('/bar/<int:id>', endpoint='bar_show'),
+                r.Rule('/bar/<int:id>/edit', endpoint='bar_edit',
+                       methods=['POST']),
+                r.Rule('/bar/<int:id>/edit', endpoint='bar_form',
+                       methods=['GET']),
+                r.Rule('/page/', defaults={'page': 1}, endpoint='page'),
+                r.Rule('/page/<int:page>', endpoint='page'),
+                r.Rule('/x<int:id>y', endpoint='embedded'),
+                r.Rule('/files/<path:name>', endpoint='files'),
+                r.Rule('/files/<path:name>/edit', endpoint='files_edit'),
+                r.Rule('/loose', endpoint='loose', strict_slashes=False),
+                r.Rule('/<string(length=2):lang>/about', endpoint='about'),
+                r.Rule('/old/<int:id>', redirect_to='bar/<id>'),
+                r.Rule('/static/<path:f>', endpoint='static',
+                       build_only=True),
+                r.Rule('/', subdomain='kb', endpoint='kb_index'),
+                r.Rule('/<page>', subdomain='kb', endpoint='kb_page'),
+                r.Rule('/', subdomain='<user>', endpoint='user_index'),
+                r.Rule('/stats', subdomain='<user>', endpoint='user_stats'),
+            ]
+        paths = ['/', '/foo', '/foo/', '/bar', '/bar/', '/bar/42',
+                 '/bar/42/', '/bar/42/edit', '/bar/x', '/page/',
+                 '/page/1', '/page/2', '/x42y', '/x42', '/files/a/b',
+                 '/files/a/b/edit', '/files/', '/loose', '/loose/',
+                 '/de/about', '/deu/about', '/old/42', '/static/foo',
+                 '/stats', '/missing', '//foo', u'/\xe4']
+        for subdomain in '', 'kb', 'peter':
+            maps = [r.Map(make_rules(), matcher_class=cls)
+                    for cls in (r.RuleMatcher, r.TreeMatcher,
+                                r.CombinedRegexMatcher)]
+            for path in paths:
+                for method in 'GET', 'POST':
+                    results = [_match_outcome(m.bind('example.org', '/',
+                                                     subdomain=subdomain),
+                                              path, method)
+                               for m in maps]
+                    self.assert_equal(results[0], results[1])
+                    self.assert_equal(results[0], results[2])
+
+    def test_tree_matcher_host_matching(self):
+        map = r.Map([
+            r.Rule('/', endpoint='index', host='www.example.com'),
+            r.Rule('/', endpoint='user_index', host='<user>.example.com'),
+            r.Rule('/<int:id>', endpoint='user_show',
+                   host='<user>.example.com')
+        ], host_matching=True, matcher_class=r.TreeMatcher)
+        a = map.bind('www.example.com')
+        self.assert_equal(a.match('/'), ('index', {}))
+        self.assert_equal(a.match('/42'), ('user_show', {'user': 'www',
+                                                         'id': 42}))
+        self.assert_raises(r.NotFound, lambda: a.match('/foo'))
+        a = map.bind('peter.example.com')
+        self.assert_equal(a.match('/'), ('user_index', {'user': 'peter'}))
+        self.assert_equal(a.match('/42'), ('user_show', {'user': 'peter',
+                                                         'id': 42}))
+
+    def test_tree_matcher_candidates(self):
+        map = r.Map([
+            r.Rule('/', endpoint='index'),
+            r.Rule('/foo/<int:id>', endpoint='foo'),
+            r.Rule('/bar/<int:id>', endpoint='bar'),
+            r.Rule('/<path:page>', endpoint='page')
+        ], matcher_class=r.TreeMatcher)
+        map.update()
+        candidates = map._matcher.get_candidates('', '/foo/42')
+        self.assert_equal([x.endpoint for x in candidates], ['foo', 'page'])
+        candidates = map._matcher.get_candidates('', '/')
+        self.assert_equal([x.endpoint for x in candidates], ['page'])
+
+    def test_combined_regex_matcher(self):
+        class LowerConverter(r.BaseConverter):
+            regex = r'([a-z]+)'
+
+        class SmallMatcher(r.CombinedRegexMatcher):
+            max_groups = 2
+
+        map = r.Map([
+            r.Rule('/a/<int:id>', endpoint='a'),
+            r.Rule('/b/<int:id>', endpoint='b', methods=['POST']),
+            r.Rule('/b/<int:id>', endpoint='b_get', methods=['GET']),
+            r.Rule('/c/<lower:value>', endpoint='c'),
+            r.Rule('/d/<int:id>', endpoint='d'),
+        ], converters={'lower': LowerConverter}, matcher_class=SmallMatcher)
+        map.update()
+        self.assert_equal(len(map._matcher._chunks), 3)
+        adapter = map.bind('example.org', '/')
+        self.assert_equal(adapter.match('/a/1'), ('a', {'id': 1}))
+        self.assert_equal(adapter.match('/b/1', 'POST'), ('b', {'id': 1}))
+        self.assert_equal(adapter.match('/b/1'), ('b_get', {'id': 1}))
+        self.assert_equal(adapter.match('/c/xy'), ('c', {'value': 'xy'}))
+        self.assert_raises(r.NotFound, lambda: adapter.match('/c/XY'))
+        self.assert_equal(adapter.match('/d/1'), ('d', {'id': 1}))
+        self.assert_raises(r.MethodNotAllowed,
+                           lambda: adapter.match('/b/1', 'PUT'))
+
+    def test_static_index(self):
+        map = r.Map([
+            r.Rule('/', endpoint='index'),
+            r.Rule('/foo', endpoint='foo_post', methods=['POST']),
+            r.Rule('/foo/', endpoint='foo'),
+            r.Rule('/<int:id>', endpoint='show'),
+            r.Rule('/', subdomain='kb', endpoint='kb_index')
+        ])
+        adapter = map.bind('example.org', '/')
+        self.assert_equal(adapter.match('/'), ('index', {}))
+        self.assert_equal(adapter.match('/foo', 'POST'), ('foo_post', {}))
+        self.assert_raises(r.RequestRedirect, lambda: adapter.match('/foo'))
+        self.assert_equal((map.static_index_hits, map.static_index_misses),
+                          (3, 0))
+        self.assert_equal(adapter.match('/42'), ('show', {'id': 42}))
+        self.assert_raises(r.NotFound, lambda: adapter.match('/missing'))
+        self.assert_equal((map.static_index_hits, map.static_index_misses),
+                          (3, 2))
+        adapter = map.bind('example.org', '/', subdomain='kb')
+        self.assert_equal(adapter.match('/'), ('kb_index', {}))
+        self.assert_equal(map.static_index_hits, 4)
+
+    def test_build_cache(self):
+        map = r.Map([
+            r.Rule('/page/', defaults={'page': 1}, endpoint='page'),
+            r.Rule('/page/<int:page>', endpoint='page'),
+            r.Rule('/100%/<int:x>', endpoint='percent')
+        ])
+        map.build_cache_size = 3
+        adapter = map.bind('example.org', '/')
+        for x in range(2):
+            self.assert_equal(adapter.build('page', {'page': 1}), '/page/')
+            self.assert_equal(adapter.build('page', {'page': 2}), '/page/2')
+            self.assert_equal(adapter.build('page'), '/page/')
+        self.assert_equal(len(map._build_cache), 2)
+        self.assert_equal(adapter.build('percent', {'x': 1}), '/100%25/1')
+        self.assert_equal(adapter.build('page', {'page': 2, 'q': 'x'}),
+                          '/page/2?q=x')
+        self.assert_equal(len(map._build_cache), 1)
+
+        self.assert_raises(r.BuildError, adapter.build, 'other')
+        map.add(r.Rule('/other', endpoint='other'))
+        self.assert_equal(adapter.build('other'), '/other')
+
+    def test_build_script_name_join(self):
+        map = r.Map([r.Rule('/<path:p>', endpoint='page')])
+        adapter = map.bind('example.org', '/app')
+        self.assert_equal(adapter.build('page', {'p': 'a/b'}), '/app/a/b')
+        self.assert_equal(adapter.build('page', {'p': 'a/../b'}), '/app/b')
+        self.assert_equal(adapter.build('page', {'p': 'a/./b'}), '/app/a/b')
+
+    def test_build_many(self):
+        map = r.Map([
+            r.Rule('/page/', defaults={'page': 1}, endpoint='page'),
+            r.Rule('/page/<int:page>', endpoint='page'),
+            r.Rule('/page/<int:page>', subdomain='<lang>', endpoint='page')
+        ], default_subdomain='www')
+        adapter = map.bind('example.org', '/app')
+        values = [{'page': 1}, {'page': 2, 'q': 'x'}, {'page': 3,
+                  'lang': 'de'}, {'page': 4, 'lang': 'de'}]
+        self.assert_equal(list(adapter.build_many('page', values)),
+                          [adapter.build('page', x) for x in values])
+        self.assert_equal(list(adapter.build_many('page', values,
+                                                  force_external=True)),
+                          [adapter.build('page', x, force_external=True)
+                           for x in values])
+
+        urls = adapter.build_many('missing', [{'page': 2}])
+        self.assert_raises(r.BuildError, next, urls)
+
+    def test_match_cache(self):
+        map = r.Map([
+            r.Rule('/', endpoint='index'),
+            r.Rule('/foo/', endpoint='foo'),
+            r.Rule('/page/<int:page>', endpoint='page', methods=['GET'])
+        ], match_cache_size=2)
+        adapter = map.bind('example.org', '/app')
+
+        values = adapter.match('/page/1')[1]
+        values['page'] = 42
+        self.assert_equal(adapter.match('/page/1'), ('page', {'page': 1}))
+        self.assert_equal((map.match_cache_hits, map.match_cache_misses),
+                          (1, 1))
+
+        self.assert_raises(r.MethodNotAllowed, adapter.match, '/page/1',
+                           'POST')
+        self.assert_raises(r.MethodNotAllowed, adapter.match, '/page/1',
+                           'POST')
+        self.assert_equal(len(map._match_cache), 2)
+
+        self.assert_equal(_match_outcome(adapter, '/foo', 'GET'),
+                          ('redirect', 'http://example.org/app/foo/'))
+        other = map.bind('example.org', '/other')
+        self.assert_equal(_match_outcome(other, '/foo', 'GET'),
+                          ('redirect', 'http://example.org/other/foo/'))
+        self.assert_equal(len(map._match_cache), 2)
+        # the GET lookup of /page/1 was the least recently used one
+        self.assert_equal((map.match_cache_hits, map.match_cache_misses),
+                          (3, 3))
+        adapter.match('/page/1')
+        self.assert_equal(map.match_cache_misses, 4)
+
+        self.assert_raises(r.NotFound, adapter.match, '/bar')
+        map.add(r.Rule('/bar', endpoint='bar'))
+        self.assert_equal(adapter.match('/bar'), ('bar', {}))
+
+
+def _match_outcome(adapter, path, method):
+    try:
+        return adapter.match(path, method)
+    except r.RequestRedirect as e:
+        return 'redirect', e.new_url
+    except r.MethodNotAllowed as e:
+        return 'method not allowed', sorted(e.valid_methods)
+    except r.NotFound:
+        return 'not found'
+
 
 def suite():
     suite = unittest.TestSuite()
@@ -9,12 +9,19 @@
     :license: BSD, see LICENSE for more details.
 """
 import os
+import hashlib
 import unittest
+import threading
 
 from werkzeug.testsuite import WerkzeugTestCase
 
 from werkzeug.security import check_password_hash, generate_password_hash, \
-     safe_join, pbkdf2_hex
+     safe_join, pbkdf2_hex, pbkdf2_bin, PasswordHasher
+
+try:
+    from concurrent.futures import ThreadPoolExecutor
+except ImportError:
+    ThreadPoolExecutor = None
 
 
 class SecurityTestCase(WerkzeugTestCase):
@@ -90,8 +97,70 @@ class SecurityTestCase(WerkzeugTestCase):
         check('X' * 65, 'pass phrase exceeds block size', 1200, 32,
               '9ccad6d468770cd51b10e6a68721be611a8b4d282601db3b36be9246915ec82a')
 
+    def test_pbkdf2_python_fallback(self):
+        # hash functions hashlib does not know by name are run through
+        # the pure Python implementation
+        sha1 = lambda *args: hashlib.sha1(*args)
+        sha256 = lambda *args: hashlib.sha256(*args)
+        for data, salt, iterations, keylen in [
+            ('password', 'salt', 1, None),
+            ('password', 'salt', 4096, 20),
+            ('pass\x00word', 'sa\x00lt', 4096, 16),
+            ('X' * 65, 'pass phrase exceeds block size', 1200, 32),
+            (u'password', u'salt', 10, 100),
+        ]:
+            self.assert_equal(
+                pbkdf2_bin(data, salt, iterations, keylen, sha1),
+                pbkdf2_bin(data, salt, iterations, keylen, 'sha1'))
+            self.assert_equal(
+                pbkdf2_bin(data, salt, iterations, keylen, sha256),
+                pbkdf2_bin(data, salt, iterations, keylen, hashlib.sha256))
+
+
+class PasswordHasherTestCase(WerkzeugTestCase):
+
+    def test_process_pool(self):
+        hasher = PasswordHasher(max_workers=2)
+        try:
+            pwhash = hasher.generate_password_hash('default').result()
+            assert pwhash.startswith('pbkdf2:sha1:1000$')
+            assert check_password_hash(pwhash, 'default')
+            assert hasher.check_password_hash(pwhash, 'default').result()
+            assert not hasher.check_password_hash(pwhash, 'x').result()
+        finally:
+            hasher.shutdown()
+
+    def test_queue_depth(self):
+        hasher = PasswordHasher(max_queue=2,
+                                executor=ThreadPoolExecutor(1))
+        event = threading.Event()
+        futures = [hasher.submit(event.wait, 5) for x in range(2)]
+        self.assert_equal(hasher.queue_depth, 2)
+
+        # the queue is full, so the next call has to wait
+        t = threading.Thread(target=lambda: futures.append(
+            hasher.check_password_hash('plain$$default', 'default')))
+        t.start()
+        t.join(0.1)
+        assert t.is_alive()
+        self.assert_equal(len(futures), 2)
+
+        event.set()
+        t.join()
+        assert futures[2].result()
+        hasher.shutdown()
+        self.assert_equal(hasher.queue_depth, 0)
+
+        # an empty queue would block every call forever
+        for max_queue in 0, -1:
+            self.assert_raises(ValueError, PasswordHasher,
+                               max_queue=max_queue,
+                               executor=ThreadPoolExecutor(1))
+
 
 def suite():
     suite = unittest.TestSuite()
     suite.addTest(unittest.makeSuite(SecurityTestCase))
+    if ThreadPoolExecutor is not None:
+        suite.addTest(unittest.makeSuite(PasswordHasherTestCase))
     return suite
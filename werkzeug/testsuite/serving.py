@@ -11,6 +11,9 @@
 import os
 import sys
 import time
+import signal
+import socket
+import subprocess
 try:
     import httplib
 except ImportError:
@@ -33,8 +36,10 @@ from werkzeug.testsuite import WerkzeugTestCase, get_temporary_directory
 
 from werkzeug import __version__ as version, serving
 from werkzeug.testapp import test_app
+from werkzeug.wsgi import get_input_stream
 from werkzeug._compat import StringIO
-from threading import Thread
+import threading
+from threading import Thread, Event
 
 
 
@@ -117,6 +122,402 @@ class ServingTestCase(WerkzeugTestCase):
         res = conn.getresponse()
         assert res.read() == b'YES'
 
+    @silencestderr
+    def test_request_parsing(self):
+        environs = []
+        def app(environ, start_response):
+            environs.append(environ)
+            start_response('200 OK', [('Content-Length', '2')])
+            return [b'ok']
+        server, addr = run_dev_server(app)
+        host, port = addr.rsplit(':', 1)
+
+        def request(data):
+            sock = socket.create_connection((host, int(port)))
+            sock.sendall(data)
+            rv = b''
+            while 1:
+                chunk = sock.recv(4096)
+                if not chunk:
+                    break
+                rv += chunk
+            sock.close()
+            return rv
+
+        for x in range(2):
+            rv = request(b'GET /foo/bar?a=b?c HTTP/1.0\r\n'
+                         b'X-Foo: 1\r\nx-foo: 2\r\n'
+                         b'X-Folded: a\r\n b\r\n'
+                         b'Content-Type: text/plain\r\n'
+                         b'Content-Type: text/html\r\n\r\n')
+            self.assert_true(rv.endswith(b'ok'))
+            environ = environs.pop()
+            self.assert_equal(environ['PATH_INFO'], '/foo/bar')
+            self.assert_equal(environ['QUERY_STRING'], 'a=b?c')
+            self.assert_equal(environ['HTTP_X_FOO'], '1,2')
+            self.assert_equal(environ['HTTP_X_FOLDED'], 'a b')
+            self.assert_equal(environ['CONTENT_TYPE'], 'text/plain')
+            self.assert_equal(environ['CONTENT_LENGTH'], '')
+            self.assert_not_in('HTTP_CONTENT_TYPE', environ)
+
+        # only the real headers set the content length and type
+        request(b'GET / HTTP/1.0\r\nContent_Length: 10\r\n'
+                b'content_type: text/html\r\n\r\n')
+        environ = environs.pop()
+        self.assert_equal(environ['CONTENT_LENGTH'], '')
+        self.assert_equal(environ['CONTENT_TYPE'], '')
+        self.assert_not_in('HTTP_CONTENT_LENGTH', environ)
+        self.assert_not_in('HTTP_CONTENT_TYPE', environ)
+        request(b'GET / HTTP/1.0\r\ncontent-length: 0\r\n'
+                b'Content_Length: 10\r\n\r\n')
+        environ = environs.pop()
+        self.assert_equal(environ['CONTENT_LENGTH'], '0')
+
+        request(b'GET /f%C3%BCr%20x?q=%20 HTTP/1.0\r\n\r\n')
+        environ = environs.pop()
+        self.assert_equal(environ['PATH_INFO'],
+                          u'/für x'.encode('utf-8').decode('latin1')
+                          if str is not bytes else '/f\xc3\xbcr x')
+        self.assert_equal(environ['QUERY_STRING'], 'q=%20')
+
+        request(b'GET //host/path HTTP/1.0\r\n\r\n')
+        environ = environs.pop()
+        self.assert_equal(environ['PATH_INFO'], '/path')
+        self.assert_equal(environ['HTTP_HOST'], 'host')
+
+        rv = request(b'GET / HTTP/2.0\r\n\r\n')
+        self.assert_in(b' 505 ', rv.split(b'\r\n')[0])
+        rv = request(b'GET / FOO/1.0\r\n\r\n')
+        self.assert_in(b' 400 ', rv.split(b'\r\n')[0])
+        rv = request(b'GET / HTTP/1.0\r\nX-Foo: ' + b'x' * 70000 +
+                     b'\r\n\r\n')
+        self.assert_in(b' 431 ', rv.split(b'\r\n')[0])
+        self.assert_equal(environs, [])
+
+    @silencestderr
+    def test_keep_alive(self):
+        def app(environ, start_response):
+            body = environ['wsgi.input'].read(2)
+            start_response('200 OK', [('Content-Type', 'text/plain'),
+                                      ('Content-Length', '8')])
+            return [body + str(environ['REMOTE_PORT']).encode('ascii')
+                    .rjust(6)]
+        server, addr = run_dev_server(app, keep_alive=True)
+        conn = httplib.HTTPConnection(addr)
+        ports = set()
+        for x in range(3):
+            # the rest of the body is skipped by the server
+            conn.request('POST', '/', body=b'xyzzy')
+            res = conn.getresponse()
+            self.assert_equal(res.version, 11)
+            self.assert_true(res.getheader('Connection') is None)
+            data = res.read()
+            self.assert_equal(data[:2], b'xy')
+            ports.add(data)
+        self.assert_equal(len(ports), 1)
+        conn.close()
+
+    @silencestderr
+    def test_keep_alive_chunked(self):
+        def app(environ, start_response):
+            start_response('200 OK', [('Content-Type', 'text/plain')])
+            return [b'foo', b'', b'bar']
+        server, addr = run_dev_server(app, keep_alive=True)
+        conn = httplib.HTTPConnection(addr)
+        for x in range(2):
+            conn.request('GET', '/')
+            res = conn.getresponse()
+            self.assert_equal(res.getheader('Transfer-Encoding'), 'chunked')
+            self.assert_equal(res.read(), b'foobar')
+
+        conn.request('GET', '/', headers={'Connection': 'close'})
+        res = conn.getresponse()
+        self.assert_equal(res.getheader('Connection'), 'close')
+        self.assert_true(res.getheader('Transfer-Encoding') is None)
+        self.assert_equal(res.read(), b'foobar')
+
+    @silencestderr
+    def test_keep_alive_limits(self):
+        def app(environ, start_response):
+            start_response('200 OK', [('Content-Length', '2')])
+            return [b'ok']
+        server, addr = run_dev_server(app, keep_alive=True)
+        server.max_keep_alive_requests = 2
+        conn = httplib.HTTPConnection(addr)
+        conn.request('GET', '/')
+        res = conn.getresponse()
+        self.assert_true(res.getheader('Connection') is None)
+        self.assert_equal(res.read(), b'ok')
+        conn.request('GET', '/')
+        res = conn.getresponse()
+        self.assert_equal(res.getheader('Connection'), 'close')
+        self.assert_equal(res.read(), b'ok')
+
+        server.keep_alive_timeout = 0.1
+        host, port = addr.rsplit(':', 1)
+        sock = socket.create_connection((host, int(port)))
+        sock.sendall(b'GET / HTTP/1.1\r\nHost: localhost\r\n\r\n'
+                     b'GET / HTTP/1.1\r\nHost: localhost\r\n\r\n')
+        data = b''
+        while 1:
+            chunk = sock.recv(4096)
+            if not chunk:
+                break
+            data += chunk
+        sock.close()
+        self.assert_equal(data.count(b'HTTP/1.1 200 OK'), 2)
+        self.assert_true(data.endswith(b'ok'))
+
+    @silencestderr
+    def test_pooled_server(self):
+        event = Event()
+        def app(environ, start_response):
+            event.wait(5)
+            start_response('200 OK', [('Content-Length', '2')])
+            return [b'ok']
+        server, addr = run_dev_server(app, threads=2, queue_size=1)
+        self.assert_is_instance(server, serving.PooledWSGIServer)
+
+        host, port = addr.rsplit(':', 1)
+        socks = []
+        for x in range(3):
+            sock = socket.create_connection((host, int(port)))
+            sock.sendall(b'GET / HTTP/1.0\r\n\r\n')
+            socks.append(sock)
+            time.sleep(0.1)
+        self.assert_equal(server.busy_workers, 2)
+        self.assert_equal(server.queue_depth, 1)
+
+        shed = socket.create_connection((host, int(port)))
+        self.assert_in(b'503 Service Unavailable', shed.recv(4096))
+        shed.close()
+
+        event.set()
+        for sock in socks:
+            self.assert_in(b'200 OK', sock.recv(4096))
+            sock.close()
+        time.sleep(0.1)
+        self.assert_equal(server.busy_workers, 0)
+
+    @silencestderr
+    def test_pooled_server_close(self):
+        event = Event()
+        def app(environ, start_response):
+            event.wait(5)
+            start_response('200 OK', [('Content-Length', '2')])
+            return [b'ok']
+        server, addr = run_dev_server(app, threads=1, queue_size=1)
+        host, port = addr.rsplit(':', 1)
+        socks = []
+        for x in range(2):
+            sock = socket.create_connection((host, int(port)))
+            sock.sendall(b'GET / HTTP/1.0\r\n\r\n')
+            socks.append(sock)
+            time.sleep(0.1)
+        self.assert_equal(server.queue_depth, 1)
+
+        # the queue is full, closing must not wait for room in it
+        closer = Thread(target=server.server_close)
+        closer.start()
+        socks[1].settimeout(5)
+        self.assert_equal(socks[1].recv(4096), b'')
+        self.assert_true(closer.is_alive())
+        event.set()
+        closer.join(5)
+        self.assert_false(closer.is_alive())
+        self.assert_in(b'200 OK', socks[0].recv(4096))
+        self.assert_equal(server._workers, [])
+        for sock in socks:
+            sock.close()
+
+    def run_prefork_server(self, **kwargs):
+        def app(environ, start_response):
+            start_response('200 OK', [('Content-Type', 'text/plain')])
+            return [str(os.getpid()).encode('ascii')]
+        server = serving.make_server('localhost', 0, app, prefork=True,
+                                     **kwargs)
+        t = Thread(target=server.serve_forever)
+        t.setDaemon(True)
+        t.start()
+        time.sleep(0.25)
+        return server, 'http://localhost:%d/' % server.socket.getsockname()[1]
+
+    @silencestderr
+    def test_prefork_server(self):
+        server = None
+        try:
+            server, url = self.run_prefork_server(processes=2,
+                                                  max_requests=2)
+            self.assert_is_instance(server, serving.PreforkWSGIServer)
+            pids = set()
+            for x in range(8):
+                pids.add(urlopen(url).read())
+            self.assert_not_in(str(os.getpid()).encode('ascii'), pids)
+            # every worker is replaced after two requests
+            self.assert_true(len(pids) >= 4)
+            self.assert_equal(len(server._workers), 2)
+        finally:
+            if server is not None:
+                server.shutdown()
+        self.assert_equal(len(server._workers), 0)
+
+    if hasattr(socket, 'SO_REUSEPORT'):
+        @silencestderr
+        def test_prefork_server_reuse_port(self):
+            server = None
+            try:
+                server, url = self.run_prefork_server(processes=2,
+                                                      reuse_port=True)
+                for x in range(4):
+                    rv = urlopen(url).read()
+                    self.assert_not_equal(rv, str(os.getpid()).encode('ascii'))
+            finally:
+                if server is not None:
+                    server.shutdown()
+
+    @silencestderr
+    def test_prefork_server_failing_workers(self):
+        server = serving.make_server('localhost', 0, None, prefork=True,
+                                     processes=1)
+        server.respawn_interval = 0.3
+        def run_worker():
+            raise RuntimeError('broken worker')
+        server._run_worker = run_worker
+        spawned = []
+        spawn_worker = server._spawn_worker
+        def count_spawn():
+            spawned.append(time.time())
+            spawn_worker()
+        server._spawn_worker = count_spawn
+        # children the server did not start are left alone
+        other = subprocess.Popen([sys.executable, '-c',
+                                  'import sys; sys.exit(3)'])
+        handler = signal.getsignal(signal.SIGTERM)
+        stopper = threading.Timer(1, server.shutdown)
+        stopper.start()
+        try:
+            server.serve_forever()
+        finally:
+            stopper.join()
+            server.server_close()
+        self.assert_true(2 <= len(spawned) <= 5)
+        self.assert_equal(other.wait(), 3)
+        self.assert_equal(signal.getsignal(signal.SIGTERM), handler)
+        self.assert_equal(len(server._workers), 0)
+
+    def test_prefork_worker_exits_without_supervisor(self):
+        # a supervisor that goes away without stopping its worker
+        script = '\n'.join([
+            'import os, sys',
+            'from werkzeug import serving',
+            'server = serving.make_server("localhost", 0, None, prefork=True,',
+            '                             processes=1)',
+            'server.worker_check_interval = 0.1',
+            'server._spawn_worker()',
+            'sys.stdout.write(str(list(server._workers)[0]))',
+        ])
+        env = dict(os.environ)
+        env['PYTHONPATH'] = os.path.dirname(os.path.dirname(
+            os.path.dirname(os.path.abspath(serving.__file__))))
+        proc = subprocess.Popen([sys.executable, '-c', script],
+                                stdout=subprocess.PIPE, env=env)
+        worker = int(proc.communicate()[0])
+        for x in range(50):
+            try:
+                os.kill(worker, 0)
+            except OSError:
+                break
+            time.sleep(0.1)
+        else:
+            os.kill(worker, 9)
+            self.fail('worker did not exit')
+
+    if serving.selectors is not None:
+        @silencestderr
+        def test_event_loop_server(self):
+            def app(environ, start_response):
+                body = get_input_stream(environ).read()
+                start_response('200 OK', [('Content-Type', 'text/plain')])
+                return [b'got ' + str(len(body)).encode('ascii')]
+            server, addr = run_dev_server(app, event_loop=True, threads=2,
+                                          keep_alive=True)
+            try:
+                self.assert_is_instance(server, serving.EventLoopWSGIServer)
+                server.max_request_buffer = 1024
+                host, port = addr.rsplit(':', 1)
+
+                # idle connections don't need a thread
+                threads = threading.active_count()
+                idle = [socket.create_connection((host, int(port)))
+                        for x in range(20)]
+                time.sleep(0.2)
+                self.assert_equal(server.connection_count, 20)
+                self.assert_equal(threading.active_count(), threads)
+                for sock in idle:
+                    sock.close()
+
+                conn = httplib.HTTPConnection(addr)
+                for body in b'', b'abc', b'x' * 10:
+                    conn.request('POST', '/', body=body)
+                    res = conn.getresponse()
+                    self.assert_equal(res.getheader('Transfer-Encoding'),
+                                      'chunked')
+                    self.assert_equal(res.read(),
+                                      b'got ' + str(len(body)).encode('ascii'))
+
+                # pipelined requests are answered in order, a big body
+                # is read by the worker
+                sock = socket.create_connection((host, int(port)))
+                sock.sendall(b'POST / HTTP/1.1\r\nContent-Length: 2\r\n\r\n'
+                             b'abGET / HTTP/1.1\r\n\r\n'
+                             b'POST / HTTP/1.1\r\nContent-Length: 4000\r\n'
+                             b'Connection: close\r\n\r\n' + b'x' * 4000)
+                data = b''
+                while 1:
+                    chunk = sock.recv(4096)
+                    if not chunk:
+                        break
+                    data += chunk
+                sock.close()
+                self.assert_equal(data.count(b'200 OK'), 3)
+                self.assert_true(data.index(b'got 2') < data.index(b'got 0')
+                                 < data.index(b'got 4000'))
+            finally:
+                server.shutdown()
+            self.assert_equal(server.connection_count, 0)
+
+        @silencestderr
+        def test_event_loop_server_idle(self):
+            def app(environ, start_response):
+                start_response('200 OK', [('Content-Length', '2')])
+                return [b'ok']
+            server, addr = run_dev_server(app, event_loop=True,
+                                          keep_alive=True)
+            checks = []
+            close_idle = server._close_idle
+            def count_check():
+                checks.append(time.time())
+                close_idle()
+            server._close_idle = count_check
+            server.keep_alive_timeout = 0.2
+            try:
+                host, port = addr.rsplit(':', 1)
+                idle = socket.create_connection((host, int(port)))
+                conn = httplib.HTTPConnection(addr)
+                start = time.time()
+                for x in range(50):
+                    conn.request('GET', '/')
+                    self.assert_equal(conn.getresponse().read(), b'ok')
+                # a busy loop doesn't look for timeouts on every iteration
+                self.assert_true(len(checks) <= time.time() - start + 1)
+                conn.close()
+
+                idle.settimeout(5)
+                self.assert_equal(idle.recv(4096), b'')
+                idle.close()
+            finally:
+                server.shutdown()
+
     if OpenSSL is not None:
         def test_ssl_context_adhoc(self):
             def hello(environ, start_response):
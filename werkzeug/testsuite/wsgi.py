@@ -203,6 +203,45 @@ class WSGIUtilsTestCase(WerkzeugTestCase):
         stream = wsgi.LimitedStream(io, 8)
         self.assert_strict_equal(list(stream), [u'123\n', u'456\n'])
 
+    def test_limited_stream_readinto(self):
+        class RaisingLimitedStream(wsgi.LimitedStream):
+            def on_exhausted(self):
+                raise BadRequest('input stream exhausted')
+
+        buf = bytearray(4)
+        stream = RaisingLimitedStream(BytesIO(b'123456'), 6)
+        self.assert_equal(stream.readinto(buf), 4)
+        self.assert_equal(buf, bytearray(b'1234'))
+        self.assert_equal(stream.readinto(memoryview(buf)[1:]), 2)
+        self.assert_equal(buf, bytearray(b'1564'))
+        self.assert_strict_equal(stream.tell(), 6)
+        self.assert_raises(BadRequest, stream.readinto, buf)
+
+        stream = wsgi.LimitedStream(BytesIO(b'123456'), 3)
+        self.assert_equal(stream.readinto1(buf), 3)
+        self.assert_equal(buf[:3], bytearray(b'123'))
+        self.assert_equal(stream.readinto1(buf), 0)
+
+        # streams without readinto are read with read
+        class ReadOnly(object):
+            def __init__(self, data):
+                self.io = BytesIO(data)
+                self.read = self.io.read
+                self.readline = self.io.readline
+        stream = wsgi.LimitedStream(ReadOnly(b'123456'), 5)
+        self.assert_equal(stream.readinto(buf), 4)
+        self.assert_equal(stream.readinto(buf), 1)
+        self.assert_equal(buf[:1], bytearray(b'5'))
+        self.assert_equal(stream.readinto(buf), 0)
+
+        stream = wsgi.LimitedStream(BytesIO(b'123'), 255)
+        with self.assert_raises(ClientDisconnected):
+            stream.readinto(buf)
+        stream = wsgi.LimitedStream(BytesIO(b'123'), 255)
+        self.assert_equal(stream.readinto1(buf), 3)
+        with self.assert_raises(ClientDisconnected):
+            stream.readinto1(buf)
+
     def test_limited_stream_disconnection(self):
         io = BytesIO(b'A bit of content')
 
@@ -306,6 +345,21 @@ class WSGIUtilsTestCase(WerkzeugTestCase):
                                              buffer_size=4))
             self.assert_equal(lines, ['abc\r', 'def\r\n', 'ghi'])
 
+    def test_make_line_iter_text(self):
+        # a '\r\n' split over two blocks is one line break
+        data = [u'abc\r', u'\ndef\r', u'ghi\n\r', u'\r\n']
+        self.assert_equal(list(wsgi.make_line_iter(data)),
+                          [u'abc\r\n', u'def\r', u'ghi\n', u'\r',
+                           u'\r\n'])
+        # other unicode line boundaries don't end a line
+        data = u'a\x0bb\x0cc\x1cd\x85e\u2028f\r\ng'
+        for bufsize in range(1, 6):
+            lines = list(wsgi.make_line_iter(StringIO(data),
+                                             limit=len(data),
+                                             buffer_size=bufsize))
+            self.assert_equal(lines, [u'a\x0bb\x0cc\x1cd\x85e\u2028f\r\n',
+                                      u'g'])
+
     def test_iter_functions_support_iterators(self):
         data = ['abcdef\r\nghi', 'jkl\r\nmnopqrstuvwxyz\r', '\nABCDEFGHIJK']
         lines = list(wsgi.make_line_iter(data))
@@ -338,6 +392,14 @@ class WSGIUtilsTestCase(WerkzeugTestCase):
         self.assert_equal(rv, [b'abcdef', b'ghijkl', b'mnopqrstuvwxyz',
                                b'ABCDEFGHIJK'])
 
+    def test_make_chunk_iter_separator_across_blocks(self):
+        data = b'abc--defg--h----i--'
+        for bufsize in range(1, 6):
+            rv = list(wsgi.make_chunk_iter(BytesIO(data), '--',
+                                           limit=len(data),
+                                           buffer_size=bufsize))
+            self.assert_equal(rv, [b'abc', b'defg', b'h', b'', b'i', b''])
+
     def test_lines_longer_buffer_size(self):
         data = '1234567890\n1234567890\n'
         for bufsize in range(1, 15):
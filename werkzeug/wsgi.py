@@ -21,7 +21,7 @@ from functools import partial, update_wrapper
 
 from werkzeug._compat import iteritems, text_type, string_types, \
      implements_iterator, make_literal_wrapper, to_unicode, to_bytes, \
-     wsgi_get_bytes, try_coerce_native, PY2
+     wsgi_get_bytes, try_coerce_native, memoryview, PY2
 from werkzeug._internal import _empty_stream, _encode_idna
 from werkzeug.http import is_resource_modified, http_date
 from werkzeug.urls import uri_to_iri, url_quote, url_parse, url_join
@@ -742,8 +742,16 @@ class FileWrapper(object):
         raise StopIteration()
 
 
-def _make_chunk_iter(stream, limit, buffer_size):
-    """Helper for the line and chunk iter functions."""
+_text_line_re = re.compile(u'[^\r\n]*(?:\r\n?|\n)|[^\r\n]+')
+
+
+def _make_chunk_iter(stream, limit, buffer_size, reuse_buffer=False):
+    """Helper for the line and chunk iter functions.  If `reuse_buffer`
+    is set and the stream supports :meth:`readinto` all blocks are read
+    into one preallocated :class:`bytearray` and yielded as
+    :class:`memoryview` slices of it that are only valid until the next
+    block is read.
+    """
     if isinstance(stream, (bytes, bytearray, text_type)):
         raise TypeError('Passed a string or byte object instead of '
                         'true iterator or stream.')
@@ -754,6 +762,16 @@ def _make_chunk_iter(stream, limit, buffer_size):
         return
     if not isinstance(stream, LimitedStream) and limit is not None:
         stream = LimitedStream(stream, limit)
+    _readinto = reuse_buffer and memoryview is not None and \
+        getattr(stream, 'readinto', None)
+    if _readinto:
+        view = memoryview(bytearray(buffer_size))
+        while 1:
+            n = _readinto(view)
+            if not n:
+                break
+            yield view[:n]
+        return
     _read = stream.read
     while 1:
         item = _read(buffer_size)
@@ -775,6 +793,10 @@ def make_line_iter(stream, limit=None, buffer_size=10 * 1024):
     If you need line-by-line processing it's strongly recommended to iterate
     over the input stream using this helper function.
 
+    Lines end at ``\r\n``, ``\r`` or ``\n``, also if a ``\r\n`` is split
+    over two blocks.  For unicode input the other line boundaries known to
+    :meth:`unicode.splitlines` don't end a line.
+
     .. versionchanged:: 0.8
        This function now ensures that the limit was reached.
 
@@ -794,42 +816,43 @@ def make_line_iter(stream, limit=None, buffer_size=10 * 1024):
         return
 
     s = make_literal_wrapper(first_item)
-    empty = s('')
+    _join = s('').join
     cr = s('\r')
     lf = s('\n')
-    crlf = s('\r\n')
-
-    _iter = chain((first_item,), _iter)
+    if isinstance(first_item, text_type):
+        # unicode strings know more line boundaries than we want to split at
+        _splitlines = _text_line_re.findall
+    else:
+        _splitlines = lambda x: x.splitlines(True)
 
-    def _iter_basic_lines():
-        _join = empty.join
-        buffer = []
-        while 1:
-            new_data = next(_iter, '')
-            if not new_data:
-                break
-            new_buf = []
-            for item in chain(buffer, new_data.splitlines(True)):
-                new_buf.append(item)
-                if item and item[-1:] in crlf:
-                    yield _join(new_buf)
-                    new_buf = []
-            buffer = new_buf
+    # Every block is split into lines in one go, only the start of a line
+    # that continues in the next block is kept in the buffer.  A '\r' at
+    # the end of a block is held back as well until we know if the next
+    # block starts with the '\n' of a '\r\n'.
+    buffer = []
+    for chunk in chain((first_item,), _iter):
+        lines = _splitlines(chunk)
         if buffer:
-            yield _join(buffer)
-
-    # This hackery is necessary to merge 'foo\r' and '\n' into one item
-    # of 'foo\r\n' if we were unlucky and we hit a chunk boundary.
-    previous = empty
-    for item in _iter_basic_lines():
-        if item == lf and previous[-1:] == cr:
-            previous += item
-            item = empty
-        if previous:
-            yield previous
-        previous = item
-    if previous:
-        yield previous
+            if buffer[-1][-1:] == cr:
+                if lines[0] == lf:
+                    buffer.append(lf)
+                    del lines[0]
+                yield _join(buffer)
+                buffer = []
+            else:
+                first = lines[0]
+                buffer.append(first)
+                if first[-1:] == lf or (first[-1:] == cr and len(lines) > 1):
+                    lines[0] = _join(buffer)
+                    buffer = []
+                else:
+                    del lines[0]
+        if lines and lines[-1][-1:] != lf:
+            buffer.append(lines.pop())
+        for line in lines:
+            yield line
+    if buffer:
+        yield _join(buffer)
 
 
 def make_chunk_iter(stream, separator, limit=None, buffer_size=10 * 1024):
@@ -856,32 +879,36 @@ def make_chunk_iter(stream, separator, limit=None, buffer_size=10 * 1024):
     if not first_item:
         return
 
-    _iter = chain((first_item,), _iter)
     if isinstance(first_item, text_type):
         separator = to_unicode(separator)
-        _split = re.compile(r'(%s)' % re.escape(separator)).split
         _join = u''.join
     else:
         separator = to_bytes(separator)
-        _split = re.compile(b'(' + re.escape(separator) + b')').split
         _join = b''.join
+    sep_size = len(separator)
 
+    # Like in make_line_iter the blocks are split in one go and only the
+    # start of a chunk that continues in the next block is buffered.
     buffer = []
-    while 1:
-        new_data = next(_iter, '')
-        if not new_data:
-            break
-        chunks = _split(new_data)
-        new_buf = []
-        for item in chain(buffer, chunks):
-            if item == separator:
-                yield _join(new_buf)
-                new_buf = []
-            else:
-                new_buf.append(item)
-        buffer = new_buf
-    if buffer:
-        yield _join(buffer)
+    for chunk in chain((first_item,), _iter):
+        if buffer and sep_size > 1:
+            # the separator might start at the end of the previous block
+            tail = buffer.pop()
+            if len(tail) >= sep_size:
+                buffer.append(tail[:1 - sep_size])
+                tail = tail[1 - sep_size:]
+            chunk = tail + chunk
+        chunks = chunk.split(separator)
+        if len(chunks) == 1:
+            buffer.append(chunk)
+            continue
+        if buffer:
+            buffer.append(chunks[0])
+            chunks[0] = _join(buffer)
+        buffer = [chunks.pop()]
+        for item in chunks:
+            yield item
+    yield _join(buffer)
 
 
 @implements_iterator
@@ -922,6 +949,8 @@ class LimitedStream(object):
     def __init__(self, stream, limit):
         self._read = stream.read
         self._readline = stream.readline
+        self._readinto = getattr(stream, 'readinto', None)
+        self._readinto1 = getattr(stream, 'readinto1', None)
         self._pos = 0
         self.limit = limit
 
@@ -985,6 +1014,55 @@ class LimitedStream(object):
         self._pos += len(read)
         return read
 
+    def _copy_into(self, b, data):
+        n = len(data)
+        b[:n] = data
+        return n
+
+    def _read_into(self, b, readinto, allow_short):
+        if self._pos >= self.limit:
+            return self._copy_into(b, self.on_exhausted())
+        to_read = min(self.limit - self._pos, len(b))
+        if memoryview is None:
+            readinto = None
+        else:
+            b = memoryview(b)
+        try:
+            if readinto is None:
+                read = self._read(to_read)
+                n = len(read)
+                b[:n] = read
+            else:
+                n = readinto(b[:to_read])
+        except (IOError, ValueError):
+            return self._copy_into(b, self.on_disconnect())
+        if to_read and not n or not allow_short and n != to_read:
+            return self._copy_into(b, self.on_disconnect())
+        self._pos += n
+        return n
+
+    def readinto(self, b):
+        """Reads bytes into the preallocated writable buffer `b` (for
+        example a :class:`bytearray` or a :class:`memoryview` of one) and
+        returns the number of bytes read.  It reads as much as fits into
+        `b` but never past the limit.  Like :meth:`read` it forwards the
+        return value of :meth:`on_exhausted` and :meth:`on_disconnect`,
+        copied into `b`.
+
+        .. versionadded:: 0.10
+        """
+        return self._read_into(b, self._readinto, False)
+
+    def readinto1(self, b):
+        """Works like :meth:`readinto` but does at most one read on the
+        underlying stream, so it might return fewer bytes than fit into
+        `b` even though the limit is not reached yet.  Only when no bytes
+        arrive at all the client is considered disconnected.
+
+        .. versionadded:: 0.10
+        """
+        return self._read_into(b, self._readinto1 or self._readinto, True)
+
     def readline(self, size=None):
         """Reads one line from the stream."""
         if self._pos >= self.limit: